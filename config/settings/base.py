@@ -314,6 +314,8 @@ ZOTERO_EXCLUDED_TAGS = [
 ]
 
 ZOTERO_PRINTING_TAG = 'Druck'
+ZOTERO_INCREMENTAL_SYNC = True  # Only retrieve changes since the last synchronised library version
+ZOTERO_FETCH_WORKERS = 4  # Collections downloaded concurrently during a full sync
 
 # Error Messages
 MESSAGE_UNEXPECTED_ERROR = "Ein unerwarteter Fehler ist aufgetreten. "\
@@ -327,10 +329,24 @@ MESSAGE_NOT_FOUND = "Bitte entschuldigen Sie, die Datei scheint nicht mehr vorha
 
 # Products
 SHIPPING = 5
+SIGNED_DOWNLOADS = env.bool('SIGNED_DOWNLOADS', default=False)  # Redirect downloads to signed storage URLs
+SIGNED_DOWNLOAD_EXPIRY = 60  # Seconds
 
 # Directories
 TMP_DIR = '/tmp'
 
+# Legacy import
+IMPORT_CACHE_DIR = f'{TMP_DIR}/scholariumat_import'  # Markdown conversions of legacy html by hash
+IMPORT_WORKERS = None  # Processes converting html, defaults to the number of cores
+
+# Users
+PROFILE_EXPORT_CHUNK_SIZE = 2000  # Rows fetched at once by CSV exports
+PROFILE_EXPORT_STREAM_LIMIT = 5000  # Larger exports are written by a job and sent as link
+PROFILE_EXPORT_EXPIRY = 24 * 60 * 60  # Seconds until files of background exports are deleted
+# Private storage of background exports, must not be served publicly
+PROFILE_EXPORT_STORAGE = 'django.core.files.storage.FileSystemStorage'
+PROFILE_EXPORT_STORAGE_OPTIONS = {'location': f'{TMP_DIR}/scholariumat_exports', 'base_url': None}
+
 # Google Analytics
 GOOGLE_ANALYTICS_PROPERTY_ID = env('GOOGLE_ANALYTICS_PROPERTY_ID', default="")
 
@@ -347,3 +363,8 @@ MARKUP_SETTINGS = {
 # Sofort
 SOFORT_KEY = env('SOFORT_KEY', default='')
 SOFORT_PROJECT_ID = env('SOFORT_PROJECT_ID', default='')
+
+# Jobs
+JOBS_RUN_IMMEDIATELY = False  # Run jobs when enqueued instead of in the processjobs worker
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 60  # Seconds before the first retry, doubled for each further one
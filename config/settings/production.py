@@ -88,6 +88,15 @@ AWS_S3_OBJECT_PARAMETERS = {
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 MEDIA_URL = f'https://s3.amazonaws.com/{AWS_STORAGE_BUCKET_NAME}/'
 
+# Background exports of profiles contain personal data: Private objects, only served by the admin
+PROFILE_EXPORT_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+PROFILE_EXPORT_STORAGE_OPTIONS = {
+    'location': 'private/exports',
+    'default_acl': 'private',
+    'querystring_auth': True,
+    'custom_domain': None,
+}
+
 # TEMPLATES
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#templates
@@ -206,6 +215,9 @@ GLOBEE_SANDBOX = env.bool('GLOBEE_SANDBOX', default=False)
 # Cronjobs
 CRON_CLASSES = [
     "library.cron.ZoteroSync",
+    "products.cron.ResolveRequests",
+    "donations.cron.ExpireDonations",
+    "users.cron.DeleteExpiredExports",
 ]
 
 # ReCaptcha
@@ -50,3 +50,7 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 EMAIL_HOST = "localhost"
 # https://docs.djangoproject.com/en/dev/ref/settings/#email-port
 EMAIL_PORT = 1025
+
+# JOBS
+# ------------------------------------------------------------------------------
+JOBS_RUN_IMMEDIATELY = True
@@ -0,0 +1,55 @@
+"""
+Parsing of BibTeX files and pandoc citations.
+
+Bibliographies are split into their entries once per upload, so articles only pass the entries they cite to
+pandoc-citeproc instead of the whole library.
+"""
+import re
+
+
+CITATION_RE = re.compile(r'(?<![\w@])@(\w[\w:.#$%&+?<>~/-]*)')
+CITATION_PUNCTUATION = ':.#$%&+?<>~/-'  # Allowed inside of keys only
+ENTRY_RE = re.compile(r'@(\w+)\s*[{(]')
+SHARED_TYPES = ['string', 'preamble']  # Definitions used by other entries
+IGNORED_TYPES = ['comment']
+
+
+def get_citation_keys(text):
+    """Returns the keys of all citations in markdown text, like [@key, p. 3] or @key."""
+    return {key.rstrip(CITATION_PUNCTUATION) for key in CITATION_RE.findall(text)}
+
+
+def parse_bibtex(source):
+    """
+    Splits BibTeX source into entries by citation key.
+    String and preamble definitions are joined under the empty key, as all entries may depend on them.
+    """
+    entries, shared = {}, []
+    position = 0
+    while True:
+        match = ENTRY_RE.search(source, position)
+        if not match:
+            break
+        # Find the matching closing delimiter
+        depth, end = 0, match.end() - 1
+        for end in range(match.end() - 1, len(source)):
+            if source[end] in '{(':
+                depth += 1
+            elif source[end] in '})':
+                depth -= 1
+                if depth == 0:
+                    break
+        entry = source[match.start():end + 1]
+        position = end + 1
+
+        entry_type = match.group(1).lower()
+        if entry_type in SHARED_TYPES:
+            shared.append(entry)
+        elif entry_type not in IGNORED_TYPES:
+            key = source[match.end():end].split(',', 1)[0].strip()
+            if key:
+                entries.setdefault(key, entry)
+
+    if shared:
+        entries[''] = '\n\n'.join(shared)
+    return entries
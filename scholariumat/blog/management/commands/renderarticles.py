@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Renders all articles whose text or bibliography changed, using all cores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Render unchanged articles, too')
+        parser.add_argument('--workers', type=int, default=None, help='Number of processes, all cores by default')
+
+    def handle(self, *args, **options):
+        rendered = Article.render_all(force=options['force'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} articles.'))
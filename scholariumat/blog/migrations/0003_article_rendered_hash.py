@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_auto_20181103_1300'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='rendered_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_article_rendered_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bibliography',
+            name='indexed_file',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='BibEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('source', models.TextField()),
+                ('bibliography', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='blog.Bibliography')),
+            ],
+            options={
+                'verbose_name': 'Bibliographieeintrag',
+                'verbose_name_plural': 'Bibliographieeinträge',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='bibentry',
+            unique_together={('bibliography', 'key')},
+        ),
+    ]
@@ -1,10 +1,12 @@
+import hashlib
 import logging
 import pypandoc
 import re
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 from django.urls import reverse
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
 from pyzotero import zotero
@@ -12,79 +14,171 @@ from django_extensions.db.models import TimeStampedModel, TitleSlugDescriptionMo
 
 # from products.behaviours import ProductBase
 from framework.behaviours import PublishAble
+from . import citations
 
 
 logger = logging.getLogger(__name__)
 
 
+def render_article(text, bibliography):
+    """
+    Converts the markdown text of an article to html parts, resolving citations with the given BibTeX source.
+    Only depends on its arguments, so articles can be converted in worker processes.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.bib') as bib_file:
+        bib_file.write(bibliography)
+        bib_file.flush()
+
+        md = f"---\nbibliography: {bib_file.name}\n---\n\n{text}\n\n## Literatur"
+        # to html
+        html = pypandoc.convert(md, 'html', format='md', filters=['pandoc-citeproc'])
+
+    # # Add class to quotes
+    # p = re.compile("<blockquote>")
+    # html = p.sub("<blockquote class=\"blockquote\">", html)
+
+    # "--" to "–"
+    p = re.compile("--")
+    html = p.sub("&ndash;", html)
+
+    # References
+    p = re.compile(r'<h2.*Literatur</h2>')
+    split = re.split(p, html)
+    references = split[1].lstrip() if len(split) > 1 else ""
+    if not references:
+        logger.debug('No references found')
+
+    # Split hidden text
+    p = re.compile(r"<p>&lt;&lt;&lt;</p>")
+    split = re.split(p, split[0])
+    public = split[0]
+
+    private = split[1].lstrip() if len(split) > 1 else ""
+    public2 = split[2].lstrip() if len(split) > 2 else ""
+
+    if not private:
+        logger.debug('No hidden part found')
+
+    return {'public': public, 'private': private, 'public2': public2, 'references': references}
+
+
 class Bibliography(TimeStampedModel):
     slug = models.SlugField(unique=True)
     file = models.FileField()
+    indexed_file = models.CharField(max_length=255, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.index()
+
+    def index(self):
+        """Stores the entries of the file by citation key."""
+        with self.file.open('rb') as bib_file:
+            entries = citations.parse_bibtex(bib_file.read().decode('utf-8', errors='replace'))
+        with transaction.atomic():
+            self.entries.all().delete()
+            BibEntry.objects.bulk_create([
+                BibEntry(bibliography=self, key=key, source=source) for key, source in entries.items()])
+            Bibliography.objects.filter(pk=self.pk).update(indexed_file=self.file.name)
+        self.indexed_file = self.file.name
+        logger.info(f'Indexed {len(entries)} entries of bibliography {self.slug}')
+
+    def get_entries(self, keys):
+        """Returns the BibTeX source of the entries with the given keys and shared definitions by key."""
+        if self.indexed_file != self.file.name:  # Uploaded before entries were indexed
+            self.index()
+        return dict(self.entries.filter(key__in=[''] + list(keys)).values_list('key', 'source'))
+
+    def get_bibtex(self, keys, entries=None):
+        """Returns a BibTeX bibliography only containing the given entries. Loaded entries can be passed."""
+        if entries is None:
+            entries = self.get_entries(keys)
+        return '\n\n'.join(entries[key] for key in [''] + sorted(keys) if key in entries)
 
     class Meta:
         verbose_name = "Bibliographie"
         verbose_name_plural = "Bibliographien"
 
 
+class BibEntry(models.Model):
+    """Entry of a bibliography, only passed to pandoc for articles citing it."""
+
+    bibliography = models.ForeignKey(Bibliography, on_delete=models.CASCADE, related_name='entries')
+    key = models.CharField(max_length=255)  # Empty for shared string and preamble definitions
+    source = models.TextField()
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        unique_together = ['bibliography', 'key']
+        verbose_name = "Bibliographieeintrag"
+        verbose_name_plural = "Bibliographieeinträge"
+
+
 class Article(TitleSlugDescriptionModel, PublishAble):
     text = models.TextField(blank=True)
     public = models.TextField(editable=False, blank=True)
     public2 = models.TextField(editable=False, blank=True)
     private = models.TextField(editable=False, blank=True)
     references = models.TextField(editable=False, blank=True)
+    rendered_hash = models.CharField(max_length=64, editable=False, blank=True)  # Of text and bibliography version
+
+    def get_rendered_hash(self, bibtex):
+        return hashlib.sha256(f'{self.text}\n{bibtex}'.encode()).hexdigest()
 
-    def markdown_to_html(self):
+    def get_citation_keys(self):
+        return citations.get_citation_keys(self.text)
+
+    def markdown_to_html(self, force=False):
+        """Renders the text, unless text and cited bibliography entries are unchanged since the last rendering."""
         if not self.text:
             logger.error(f'{self.title}: No article text found')
             return False
 
-        logger.debug(f'Generating article {self.title}')
         try:
             bib = Bibliography.objects.get(slug='zotero')
         except ObjectDoesNotExist:
             logger.exception('No bibliography found')
             return False
 
-        tmp_file = tempfile.NamedTemporaryFile(suffix='.bib')
-        tmp_file.write(bib.file.read())
-
-        md = f"---\nbibliography: {tmp_file.name}\n---\n\n{self.text}\n\n## Literatur"
-        # to html
-        html = pypandoc.convert(md, 'html', format='md', filters=['pandoc-citeproc'])
-
-        # # Add class to quotes
-        # p = re.compile("<blockquote>")
-        # html = p.sub("<blockquote class=\"blockquote\">", html)
-
-        # "--" to "–"
-        p = re.compile("--")
-        html = p.sub("&ndash;", html)
+        bibtex = bib.get_bibtex(self.get_citation_keys())
+        rendered_hash = self.get_rendered_hash(bibtex)
+        if rendered_hash == self.rendered_hash and not force:
+            logger.debug(f'Article {self.title} unchanged')
+            return
 
-        # References
-        p = re.compile(r'<h2.*Literatur</h2>')
-        split = re.split(p, html)
-        references = split[1].lstrip() if len(split) > 1 else ""
-        if not references:
-            logger.debug('No references found')
-
-        # Split hidden text
-        p = re.compile(r"<p>&lt;&lt;&lt;</p>")
-        split = re.split(p, split[0])
-        public = split[0]
-
-        private = split[1].lstrip() if len(split) > 1 else ""
-        public2 = split[2].lstrip() if len(split) > 2 else ""
-
-        if not private:
-            logger.debug('No hidden part found')
-
-        self.public = public
-        self.private = private
-        self.public2 = public2
-        self.references = references
+        logger.debug(f'Generating article {self.title}')
+        for field, value in render_article(self.text, bibtex).items():
+            setattr(self, field, value)
+        self.rendered_hash = rendered_hash
 
         logger.debug('Article generation finished')
 
+    @classmethod
+    def render_all(cls, force=False, workers=None, queryset=None):
+        """
+        Renders all articles, or the articles of queryset, whose text or cited bibliography entries changed since
+        their last rendering, e.g. after the bibliography got updated. Conversions run in a pool of worker processes.
+        Returns the number of articles.
+        """
+        bib = Bibliography.objects.get(slug='zotero')
+        articles = list((cls.objects.all() if queryset is None else queryset).exclude(text=''))
+        keys = {article.pk: article.get_citation_keys() for article in articles}
+        entries = bib.get_entries(set().union(*keys.values()))
+        bibtex = {article.pk: bib.get_bibtex(keys[article.pk], entries) for article in articles}
+        articles = [article for article in articles
+                    if force or article.get_rendered_hash(bibtex[article.pk]) != article.rendered_hash]
+        logger.info(f'Rendering {len(articles)} articles...')
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                render_article, [article.text for article in articles], [bibtex[article.pk] for article in articles])
+            for article, parts in zip(articles, results):
+                cls.objects.filter(pk=article.pk).update(
+                    rendered_hash=article.get_rendered_hash(bibtex[article.pk]), **parts)
+        return len(articles)
+
     @classmethod
     def sync_articles(cls):
         """
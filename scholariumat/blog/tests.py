@@ -5,6 +5,9 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 
 from blog.models import Article, Bibliography
+from blog.citations import get_citation_keys, parse_bibtex
+from blog.utils import ArticleImportHandler
+from framework.importer import MarkdownConverter
 
 
 class BufferTest(TestCase):
@@ -26,11 +29,79 @@ class BufferTest(TestCase):
             self.article.buffer_publish()
 
 
+BIBTEX = """
+@string{vienna = {Wien}}
+@book{mises1940,
+  title = {Nationalökonomie: {Theorie} des Handelns},
+  author = {Mises, Ludwig},
+  address = vienna,
+  year = {1940}
+}
+@comment{ignored}
+@book{menger1871, title = {Grundsätze der Volkswirtschaftslehre}, author = {Menger, Carl}, year = {%s}}
+"""
+
+
 class PandocTest(TestCase):
     def setUp(self):
-        Bibliography.objects.create(slug='zotero', file=SimpleUploadedFile('test.bib', ''))
+        self.bib = Bibliography.objects.create(
+            slug='zotero', file=SimpleUploadedFile('test.bib', (BIBTEX % 1871).encode()))
 
     def test_pandoc(self):
         article = Article.objects.create(title='Testarticle', text='#test')
         self.assertNotEqual(article.public, '')
         self.assertNotEqual(article.public, '#test')
+
+    def test_citations(self):
+        text = 'As shown [@mises1940, p. 3], see @menger1871. Mail a.b@c.de'
+        self.assertEqual(get_citation_keys(text), {'mises1940', 'menger1871'})
+        entries = parse_bibtex(BIBTEX % 1871)
+        self.assertEqual(set(entries), {'', 'mises1940', 'menger1871'})
+        self.assertTrue(entries['mises1940'].endswith('year = {1940}\n}'))
+
+        bibtex = self.bib.get_bibtex({'mises1940', 'unknown'})
+        self.assertIn('@string{vienna', bibtex)
+        self.assertIn('@book{mises1940', bibtex)
+        self.assertNotIn('menger1871', bibtex)
+
+    def test_unchanged(self):
+        article = Article.objects.create(title='Testarticle', text='#test [@mises1940]')
+        with mock.patch('pypandoc.convert', return_value='<p>test</p>') as convert:
+            article.publish()
+            convert.assert_not_called()
+
+            self.bib.file = SimpleUploadedFile('test.bib', (BIBTEX % 1872).encode())
+            self.bib.save()  # Entry not cited by the article changed
+            article.save()
+            convert.assert_not_called()
+
+            self.bib.file = SimpleUploadedFile('test.bib', (BIBTEX % 1872).replace('1940', '1949').encode())
+            self.bib.save()
+            article.save()
+            convert.assert_called_once()
+
+    def test_render_all(self):
+        Article.objects.create(title='Testarticle', text='#test')
+        Article.objects.update(public='', rendered_hash='')
+        self.assertEqual(Article.render_all(workers=1), 1)
+        self.assertNotEqual(Article.objects.get().public, '')
+        self.assertEqual(Article.render_all(workers=1), 0)
+
+
+class ImportTest(TestCase):
+    def test_saved_markdown(self):
+        """Markdown versions of articles already saved are written at once."""
+        handler = ArticleImportHandler()
+        with mock.patch.object(MarkdownConverter, 'convert', side_effect=lambda htmls: {html: html for html in htmls}):
+            handler.start()
+            handler.import_article({'model': 'Scholien.artikel', 'pk': 1, 'fields': {
+                'bezeichnung': 'Titel', 'inhalt': 'Text', 'inhalt_nur_fuer_angemeldet': None, 'inhalt2': None,
+                'prioritaet': 0, 'datum_publizieren': None}})
+            handler.articles.flush()
+        handler.import_markdown(
+            {'model': 'Scholien.markdownartikel', 'pk': 1, 'fields': {'artikel': 1, 'text': '*Text*'}})
+
+        with mock.patch.object(Article, 'render_all') as render_all, self.assertNumQueries(1):
+            handler.finish()
+        render_all.assert_called_once()
+        self.assertEqual(Article.objects.get().text, '*Text*')
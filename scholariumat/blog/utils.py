@@ -1,45 +1,91 @@
-import json
 import logging
-import pypandoc
 
-from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Case, TextField, Value, When
 
 from .models import Article
+from framework.importer import Batch, ImportHandler, LegacyImporter, MarkdownConverter
 
 
 logger = logging.getLogger(__name__)
 
 
-def import_from_json():
+class ArticleImportHandler(ImportHandler):
+    """
+    Imports articles, using the text of their markdown version if there is one.
+    Articles are kept back in a batch until it is full or the dump is read, so markdown versions following them in
+    the dump are found before the html is converted. The html of a batch is converted at once. Markdown versions of
+    articles already saved are written in batches, too, and their articles rendered at once.
+    """
     # TODO: Check for bibliography
-    database = json.load(open(settings.ROOT_DIR.path('db.json')))
-
-    # Articles
-    logger.info('Importing articles...')
+    models = {
+        'Scholien.artikel': 'import_article',
+        'Scholien.markdownartikel': 'import_markdown',
+    }
 
-    articles = [i for i in database if i['model'] == 'Scholien.artikel']
-    md_articles = [i for i in database if i['model'] == 'Scholien.markdownartikel']
+    html_fields = ['bezeichnung', 'inhalt', 'inhalt_nur_fuer_angemeldet', 'inhalt2']
 
-    for article in articles:
-        md_article = next((i for i in md_articles if i['fields']['artikel'] == article['pk']), None)
+    def start(self):
+        self.converter = MarkdownConverter()
+        self.articles = Batch(self.save_articles)
+        self.article_pks = {}  # By legacy primary key
+        self.markdown = {}  # Texts of markdown versions by legacy article primary key
+        self.saved_markdown = Batch(self.save_markdown)  # Local primary keys and markdown texts of saved articles
 
-        defaults = {
-            'publish_priority': article['fields']['prioritaet'],
-            'publish_date': article['fields']['datum_publizieren']
-        }
+    def import_article(self, article):
+        self.articles.add(article, key=article['pk'])
 
-        if md_article:
-            defaults['text'] = md_article['fields']['text']
+    def import_markdown(self, md_article):
+        article_pk = md_article['fields']['artikel']
+        if article_pk in self.article_pks:
+            pk = self.article_pks[article_pk]
+            self.saved_markdown.add((pk, md_article['fields']['text']), key=pk)
         else:
-            text = [pypandoc.convert(article['fields']['inhalt'], 'md', format='html')]
-            if article['fields']['inhalt_nur_fuer_angemeldet'] is not None:
-                text.append(pypandoc.convert(article['fields']['inhalt_nur_fuer_angemeldet'], 'md', format='html'))
-            if article['fields']['inhalt2'] is not None:
-                text.append(pypandoc.convert(article['fields']['inhalt2'], 'md', format='html'))
-
-            defaults['text'] = '\n\n<<<\n\n'.join(text)
-
-        title = pypandoc.convert(article['fields']['bezeichnung'], 'md', format='html')
-        new, created = Article.objects.update_or_create(title=title, defaults=defaults)
-        if created:
-            logger.debug(f'Created article {new.title}')
+            self.markdown[article_pk] = md_article['fields']['text']
+
+    def save_markdown(self, texts):
+        """Replaces the texts of saved articles in one query and renders them in a pool of worker processes."""
+        articles = Article.objects.filter(pk__in=[pk for pk, text in texts])
+        articles.update(text=Case(*[When(pk=pk, then=Value(text)) for pk, text in texts], output_field=TextField()))
+        try:
+            Article.render_all(workers=self.converter.workers, queryset=articles)
+        except ObjectDoesNotExist:
+            logger.exception('No bibliography found')
+
+    def save_articles(self, articles):
+        markdown = self.converter.convert(
+            article['fields'][field] for article in articles for field in self.html_fields
+            if article['fields'][field] is not None and (field == 'bezeichnung' or article['pk'] not in self.markdown))
+
+        for article in articles:
+            defaults = {
+                'publish_priority': article['fields']['prioritaet'],
+                'publish_date': article['fields']['datum_publizieren']
+            }
+
+            if article['pk'] in self.markdown:
+                defaults['text'] = self.markdown.pop(article['pk'])
+            else:
+                text = [markdown[article['fields']['inhalt']]]
+                if article['fields']['inhalt_nur_fuer_angemeldet'] is not None:
+                    text.append(markdown[article['fields']['inhalt_nur_fuer_angemeldet']])
+                if article['fields']['inhalt2'] is not None:
+                    text.append(markdown[article['fields']['inhalt2']])
+
+                defaults['text'] = '\n\n<<<\n\n'.join(text)
+
+            title = markdown[article['fields']['bezeichnung']]
+            new, created = Article.objects.update_or_create(title=title, defaults=defaults)
+            self.article_pks[article['pk']] = new.pk
+            if created:
+                logger.debug(f'Created article {new.title}')
+
+    def finish(self):
+        self.articles.flush()
+        self.saved_markdown.flush()
+        for article_pk in self.markdown:
+            logger.warning(f'Article {article_pk} of markdown version not found')
+
+
+def import_from_json():
+    LegacyImporter(ArticleImportHandler()).run()
@@ -2,7 +2,6 @@ from datetime import date
 
 from django.contrib import admin
 from django.contrib.admin import SimpleListFilter
-from django.db.models import OuterRef, Subquery
 
 from .models import Donation, DonationLevel, PaymentMethod
 
@@ -18,16 +17,13 @@ class LevelFilter(SimpleListFilter):
     parameter_name = 'level'
 
     def lookups(self, request, model_admin):
-        return [(level.amount, level) for level in DonationLevel.objects.all()]
+        return [(level.amount, level) for level in DonationLevel.get_ladder()]
 
     def queryset(self, request, queryset):
         value = self.value()
 
         if value:
-            donations = Donation.objects.filter(
-                profile=OuterRef('pk'), expiration__gte=date.today()).order_by('-amount')
-            return queryset.annotate(
-                active_donation=Subquery(donations.values('amount')[:1])).filter(active_donation__gte=value)
+            return queryset.filter(active_amount__gte=value)
         return queryset.all()
 
 
@@ -42,9 +38,7 @@ class ExpirationFilter(SimpleListFilter):
         value = self.value()
 
         if value:
-            donations = Donation.objects.filter(profile=OuterRef('pk')).order_by('-expiration')
-            return queryset.annotate(latest_donation=Subquery(donations.values('expiration')[:1]))\
-                .filter(latest_donation__lt=date.today())
+            return queryset.filter(expiration__lt=date.today())
         return queryset.all()
 
 
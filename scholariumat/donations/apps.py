@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DonationsConfig(AppConfig):
     name = 'donations'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -1,28 +1,59 @@
 import logging
 import datetime
+from collections import namedtuple
 
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.conf import settings
+from django.utils.functional import cached_property
 
 logger = logging.getLogger(__name__)
 
 
+DonationState = namedtuple('DonationState', ['donation', 'level', 'last_donation'])
+
+
 class DonationMixin(models.Model):
     """Profile mixin for managing user donations"""
     uninterested = models.BooleanField(default=False)  # Indicated no interest in future donations.
 
+    # Donation state stored by update_active_donation(), used for filtering and sorting
+    active_amount = models.SmallIntegerField('Aktiver Betrag', default=0, db_index=True, editable=False)
+    active_level = models.ForeignKey(
+        'donations.DonationLevel', verbose_name='Stufe', on_delete=models.SET_NULL, null=True, blank=True,
+        editable=False)
+    expiration = models.DateField('Ablaufdatum', null=True, blank=True, db_index=True, editable=False)
+
     @property
     def donations(self):
         return self.donation_set.filter(executed=True).order_by('-date')
 
+    @cached_property
+    def _donation_state(self):
+        """
+        Snapshot of the donation state, retrieved with a single query.
+        Lives as long as the profile instance, which is usually the duration of a request (request.user.profile).
+        """
+        donations = list(self.donations)
+        active = [donation for donation in donations if donation.expiration >= datetime.date.today()]
+        donation = max(active, key=lambda donation: donation.amount) if active else None
+        return DonationState(
+            donation=donation,
+            level=donation.level if donation else None,
+            last_donation=donations[0] if donations else None)
+
+    def reset_donation_state(self):
+        """Discards the donation snapshot. Needs to be called when donations of the profile change."""
+        self.__dict__.pop('_donation_state', None)
+
     @property
     def donation(self):
         """Returns HIGHEST active donation."""
-        return self.donations.filter(expiration__gte=datetime.date.today()).order_by('-amount').first()
+        return self._donation_state.donation
 
     @property
     def last_donation(self):
-        return self.donation_set.filter(executed=True).order_by('-date').first()
+        return self._donation_state.last_donation
 
     @property
     def expired_donations(self):
@@ -31,14 +62,7 @@ class DonationMixin(models.Model):
     @property
     def level(self):
         """Returns level of HIGHEST active donation"""
-        active = self.donation
-        return active.level if active else None
-
-    @property
-    def expiration(self):
-        """Returns expiration date of the newest donation."""
-        donation = self.last_donation
-        return donation.expiration if donation else None
+        return self._donation_state.level
 
     @property
     def amount(self):
@@ -67,6 +91,61 @@ class DonationMixin(models.Model):
         donation = self.donation_set.create(amount=amount, **donation_kwargs)
         donation.execute()
 
+    def update_active_donation(self):
+        """
+        Stores amount and level of the active donation and the expiration date of the newest donation.
+        Called whenever donations of the profile change and for profiles whose active donation expired.
+        """
+        self.reset_donation_state()
+        self.active_amount = self.amount
+        self.active_level = self.level
+        self.expiration = self.last_donation.expiration if self.last_donation else None
+        type(self).objects.filter(pk=self.pk).update(
+            active_amount=self.active_amount, active_level=self.active_level, expiration=self.expiration)
+
+    @classmethod
+    def update_active_donations(cls, profiles=None):
+        """Updates the stored donation state of the given profiles or of all profiles with donations."""
+        if profiles is None:
+            profiles = cls.objects.filter(donation__isnull=False).distinct()
+        count = 0
+        for profile in profiles.iterator():
+            profile.update_active_donation()
+            count += 1
+        return count
+
+    @classmethod
+    def update_expired_donations(cls):
+        """Updates profiles whose stored active donation expired. Returns their number."""
+        from .models import Donation
+
+        still_active = Donation.objects.filter(
+            profile=OuterRef('pk'), executed=True, expiration__gte=datetime.date.today(),
+            amount=OuterRef('active_amount'))
+        expired = cls.objects.filter(active_amount__gt=0).annotate(still_active=Exists(still_active))\
+            .filter(still_active=False)
+        return cls.update_active_donations(expired)
+
+    @classmethod
+    def update_active_levels(cls):
+        """Assigns the level of the stored active amount to all profiles, e.g. after levels changed."""
+        from .models import DonationLevel
+
+        levels = list(DonationLevel.objects.order_by('amount'))
+        below = cls.objects.filter(active_level__isnull=False)
+        if levels:
+            below = below.filter(active_amount__lt=levels[0].amount)
+        below.update(active_level=None)
+        for level, next_level in zip(levels, levels[1:] + [None]):
+            profiles = cls.objects.filter(active_amount__gte=level.amount)
+            if next_level:
+                profiles = profiles.filter(active_amount__lt=next_level.amount)
+            profiles.exclude(active_level=level).update(active_level=level)
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.reset_donation_state()
+
     def clean_donations(self):
         for donation in self.donation_set.filter(executed=False):
             donation.delete()
@@ -0,0 +1,19 @@
+import logging
+
+from django_cron import CronJobBase, Schedule
+
+from users.models import Profile
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExpireDonations(CronJobBase):
+    RUN_AT_TIMES = ['00:05']
+
+    schedule = Schedule(run_at_times=RUN_AT_TIMES)
+    code = 'Donation expiry Cronjob'
+
+    def do(self):
+        count = Profile.update_expired_donations()
+        logger.info(f'Updated {count} profiles with expired donations.')
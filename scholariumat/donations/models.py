@@ -1,9 +1,13 @@
 import datetime
 import logging
+import time
+import uuid
+from bisect import bisect_left, bisect_right
 
 from django.urls import reverse_lazy
 from django.db import models
 from django.conf import settings
+from django.core.cache import cache
 
 from django_extensions.db.models import TimeStampedModel, TitleSlugDescriptionModel, TitleDescriptionModel
 
@@ -17,26 +21,75 @@ class DonationLevel(TitleSlugDescriptionModel):
     amount = models.SmallIntegerField(unique=True)
     color = models.CharField(max_length=15, blank=True)
 
+    LADDER_CACHE_KEY = 'donationlevel_ladder'
+    LADDER_VERSION_CACHE_KEY = 'donationlevel_ladder_version'
+
+    LADDER_CHECK_INTERVAL = 10  # Seconds between checks of the shared version
+
+    _ladder = None  # Process local copy: (version, levels, amounts, time of last version check)
+
+    @classmethod
+    def _get_ladder(cls):
+        """
+        Returns all levels and their amounts, sorted by amount.
+        Levels are kept in memory per process and shared between workers through the cache. A version in the cache
+        tells workers when their copy is outdated, it is checked at most every LADDER_CHECK_INTERVAL seconds.
+        Changes in the own process reset the copy right away. If the version is missing, e.g. while the cache is
+        unavailable, the local copy is kept.
+        """
+        ladder = cls._ladder
+        now = time.monotonic()
+        if ladder is not None and now - ladder[3] < cls.LADDER_CHECK_INTERVAL:
+            return ladder[1], ladder[2]
+
+        version = cache.get(cls.LADDER_VERSION_CACHE_KEY)
+        if version is None:
+            version = ladder[0] if ladder else uuid.uuid4().hex
+            cache.add(cls.LADDER_VERSION_CACHE_KEY, version, None)
+        if ladder is None or ladder[0] != version:
+            shared = cache.get(cls.LADDER_CACHE_KEY)
+            if shared and shared[0] == version:
+                levels = shared[1]
+            else:
+                levels = list(cls.objects.order_by('amount'))
+                cache.set(cls.LADDER_CACHE_KEY, (version, levels), None)
+            ladder = (version, levels, [level.amount for level in levels])
+        cls._ladder = ladder[:3] + (now,)
+        return ladder[1], ladder[2]
+
+    @classmethod
+    def reset_ladder(cls):
+        """Invalidates cached levels of all workers."""
+        cls._ladder = None
+        cache.set(cls.LADDER_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+    @classmethod
+    def get_ladder(cls):
+        """Returns all levels sorted by amount"""
+        return cls._get_ladder()[0]
+
     @classmethod
     def get_level_by_amount(cls, amount):
         """Return highest level available for amount"""
-        level = cls.objects.filter(amount__lte=amount).order_by('-amount')
-        if level:
-            return level[0]
+        levels, amounts = cls._get_ladder()
+        index = bisect_right(amounts, amount)
+        if index:
+            return levels[index - 1]
         else:
             logger.info("No level available for {}".format(amount))
 
     @classmethod
     def get_lowest_amount(cls):
         """Returns amount of lowest available donation level"""
-        level = cls.objects.all().order_by('amount')
-        return level[0].amount if level else None
+        levels, amounts = cls._get_ladder()
+        return amounts[0] if amounts else None
 
     @classmethod
     def get_necessary_level(cls, amount):
-        level = cls.objects.filter(amount__gte=amount).order_by('amount')
-        if level:
-            return level[0]
+        levels, amounts = cls._get_ladder()
+        index = bisect_left(amounts, amount)
+        if index < len(levels):
+            return levels[index]
         else:
             logger.info("No level available greater than {}".format(amount))
 
@@ -83,6 +136,7 @@ class Donation(PayAble, TimeStampedModel):
     def execute(self, *args, **kwargs):
         success = super().execute(*args, **kwargs)
         if success:
+            self.profile.reset_donation_state()
             self.profile.refill(self.amount)
             logger.info("{} donated {} and is now level {}".format(self.profile, self.amount, self.profile.level))
         return success
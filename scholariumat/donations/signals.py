@@ -0,0 +1,58 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from users.models import Profile
+from .models import Donation, DonationLevel
+
+
+class DeletedProfiles(threading.local):
+    """Primary keys of the profiles being deleted in the current thread."""
+
+    def __init__(self):
+        self.pks = set()
+
+
+_deleted_profiles = DeletedProfiles()
+
+
+@receiver([post_save, post_delete], sender=DonationLevel)
+def reset_donationlevel_ladder(sender, **kwargs):
+    """
+    Resets cached levels right away for the current process and again after commit,
+    so other workers can't cache the state before the transaction.
+    """
+    DonationLevel.reset_ladder()
+    transaction.on_commit(DonationLevel.reset_ladder)
+
+
+@receiver([post_save, post_delete], sender=DonationLevel)
+def update_active_levels(sender, **kwargs):
+    """Assigns changed levels to the profiles with matching active amounts."""
+    Profile.update_active_levels()
+
+
+@receiver(pre_delete, sender=Profile)
+def mark_deleted_profile(sender, instance, **kwargs):
+    """Remembers profiles being deleted, so their cascading donation deletions don't update them."""
+    _deleted_profiles.pks.add(instance.pk)
+
+
+@receiver(post_delete, sender=Profile)
+def unmark_deleted_profile(sender, instance, **kwargs):
+    _deleted_profiles.pks.discard(instance.pk)
+
+
+@receiver(post_save, sender=Donation)
+def update_active_donation(sender, instance, **kwargs):
+    """Keeps the stored donation state of the profile up to date after executions and changes of executed donations."""
+    if instance.executed:
+        instance.profile.update_active_donation()
+
+
+@receiver(post_delete, sender=Donation)
+def update_deleted_donation(sender, instance, **kwargs):
+    if instance.executed and instance.profile_id not in _deleted_profiles.pks:
+        instance.profile.update_active_donation()
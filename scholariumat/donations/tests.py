@@ -1,8 +1,10 @@
 import os
 from datetime import date, timedelta
+from unittest import mock
 
 from django.test import TestCase
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.test import Client
 from django.urls import reverse
@@ -66,6 +68,37 @@ class DonationTest(TestCase):
         self.assertEqual(DonationLevel.get_level_by_amount(80).amount, 75)
         self.assertEqual(DonationLevel.get_lowest_amount(), 75)
 
+    def test_level_ladder(self):
+        DonationLevel.get_ladder()  # Load levels
+        with self.assertNumQueries(0):
+            self.assertEqual(DonationLevel.get_level_by_amount(150).amount, 150)
+            self.assertEqual(DonationLevel.get_level_by_amount(299).amount, 150)
+            self.assertEqual(DonationLevel.get_level_by_amount(74), None)
+            self.assertEqual(DonationLevel.get_necessary_level(76).amount, 150)
+            self.assertEqual(DonationLevel.get_necessary_level(300).amount, 300)
+            self.assertEqual(DonationLevel.get_necessary_level(301), None)
+
+        # Test if changes reset the ladder
+        DonationLevel.objects.create(amount=50, title='Level 0')
+        self.assertEqual(DonationLevel.get_lowest_amount(), 50)
+        DonationLevel.objects.get(amount=50).delete()
+        self.assertEqual(DonationLevel.get_lowest_amount(), 75)
+
+    def test_level_ladder_version(self):
+        DonationLevel.get_ladder()  # Load levels
+        # Changes of other workers are seen after the check interval
+        DonationLevel.objects.filter(amount=75).update(amount=50)
+        cache.set(DonationLevel.LADDER_VERSION_CACHE_KEY, 'other', None)
+        with self.assertNumQueries(0):
+            self.assertEqual(DonationLevel.get_lowest_amount(), 75)
+        with mock.patch.object(DonationLevel, 'LADDER_CHECK_INTERVAL', 0):
+            self.assertEqual(DonationLevel.get_lowest_amount(), 50)
+
+            # Missing version, e.g. unavailable cache, keeps the local copy
+            with mock.patch('donations.models.cache') as unavailable, self.assertNumQueries(0):
+                unavailable.get.return_value = None
+                self.assertEqual(DonationLevel.get_lowest_amount(), 50)
+
     def test_donation(self):
         donation_amount = 200
         self.profile.donate(donation_amount)
@@ -74,9 +107,61 @@ class DonationTest(TestCase):
         self.assertEqual(self.profile.level.amount, 150)
         self.assertEqual(self.profile.expiration, date.today() + timedelta(days=settings.DONATION_PERIOD))
 
+    def test_donation_state(self):
+        self.profile.donate(200)
+        self.profile.level  # Retrieve donation state
+        with self.assertNumQueries(0):
+            self.assertEqual(self.profile.amount, 200)
+            self.assertEqual(self.profile.level.amount, 150)
+            self.assertTrue(self.profile.active)
+            self.assertFalse(self.profile.expiring)
+
+        # Test if new donations reset the state
+        self.profile.donate(300)
+        self.assertEqual(self.profile.amount, 300)
+        self.assertEqual(self.profile.level.amount, 300)
+
     def test_small_donation(self):
         donation_amount = 70
         self.profile.donate(donation_amount)
         self.assertEqual(self.profile.balance, donation_amount)
         self.assertEqual(self.profile.level, None)
         self.assertEqual(self.profile.expiration, date.today() + timedelta(days=settings.DONATION_PERIOD))
+
+    def test_stored_state(self):
+        self.profile.donate(200)
+        profile = Profile.objects.get(pk=self.profile.pk)
+        self.assertEqual((profile.active_amount, profile.active_level.amount), (200, 150))
+        self.assertEqual(profile.expiration, date.today() + timedelta(days=settings.DONATION_PERIOD))
+        self.assertEqual(Profile.objects.filter(active_amount__gte=150).get(), profile)
+
+        # Levels changed
+        DonationLevel.objects.create(amount=200, title='Level 2.5')
+        self.assertEqual(Profile.objects.get(pk=self.profile.pk).active_level.amount, 200)
+
+        # Expiry sweep
+        self.profile.donate(75)
+        Donation.objects.filter(amount=200).update(expiration=date.today() - timedelta(days=1))
+        self.assertEqual(Profile.update_expired_donations(), 1)
+        self.assertEqual(Profile.objects.get(pk=self.profile.pk).active_amount, 75)
+        self.assertEqual(Profile.update_expired_donations(), 0)
+
+        # Deletion
+        Donation.objects.get(amount=75).delete()
+        profile = Profile.objects.get(pk=self.profile.pk)
+        self.assertEqual((profile.active_amount, profile.active_level), (0, None))
+        self.assertEqual(profile.expiration, date.today() - timedelta(days=1))
+
+    def test_stored_state_queries(self):
+        # Unexecuted donations don't update the profile
+        with self.assertNumQueries(1):
+            self.profile.donation_set.create(amount=200)
+        donation = self.profile.donation_set.get()
+        donation.execute()
+        self.assertEqual((self.profile.active_amount, self.profile.active_level.amount), (200, 150))
+
+        # Deleted profiles aren't updated for each of their donations
+        self.profile.donate(75)
+        with mock.patch.object(Profile, 'update_active_donation') as update:
+            self.profile.delete()
+        update.assert_not_called()
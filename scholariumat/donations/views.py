@@ -94,6 +94,8 @@ class ApprovalView(MessageMixin, FormView):  # TODO: Use products implementation
         return super().dispatch(*args, **kwargs)
 
     def form_valid(self, form):
+        if self.request.user.is_authenticated and self.request.user.profile.pk == self.donation.profile_id:
+            self.donation.profile = self.request.user.profile  # Updates the donation state of the request's profile
         self.donation.execute(self.request)
         if self.donation.executed:
             self.messages.info('Vielen Dank für Ihre Unterstützung')
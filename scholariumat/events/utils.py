@@ -1,30 +1,81 @@
-import json
 import logging
 import os
-import pypandoc
 from datetime import date
 
-from django.conf import settings
-
 from products.models import ItemType, FileAttachment, AttachmentType
+from framework.importer import Batch, ImportHandler, LegacyImporter, MarkdownConverter
 from .models import Event, EventType
 
 
 logger = logging.getLogger(__name__)
 
 
-def import_from_json():
-    database = json.load(open(settings.ROOT_DIR.path('db.json')))
-
-    # Articles
-    logger.info('Importing events...')
-
-    events = [i for i in database if i['model'] == 'Veranstaltungen.veranstaltung']
-    event_types = [i for i in database if i['model'] == 'Veranstaltungen.artderveranstaltung']
-
-    for type in event_types:
-        type_name = type['fields']['bezeichnung']
-        description = pypandoc.convert(type['fields']['beschreibung'], 'md', format='html')
+class EventImportHandler(ImportHandler):
+    """
+    Imports event types and events. Events are saved in batches, converting the html of a batch at once.
+    Events coming before their type in the dump are imported at the end.
+    """
+    models = {
+        'Veranstaltungen.artderveranstaltung': 'import_type',
+        'Veranstaltungen.veranstaltung': 'import_event',
+    }
+
+    def start(self):
+        self.converter = MarkdownConverter()
+        self.events = Batch(self.save_events)
+        self.types = {}  # Local event types by legacy primary key
+        self.deferred = []
+
+        # Initiate item types
+        self.item_types = {}
+        self.item_types['salon_recording'], created = ItemType.objects.get_or_create(
+            slug='salon_recording',
+            defaults={
+                'title': 'Aufzeichnung',
+                'default_price': 5,
+                'buy_once': True})
+        self.item_types['seminar_recording'], created = ItemType.objects.get_or_create(
+            slug='seminar_recording',
+            defaults={
+                'title': 'Aufzeichnung',
+                'default_price': 50,
+                'buy_once': True})
+        self.item_types['vortrag_recording'], created = ItemType.objects.get_or_create(
+            slug='vortrag_recording',
+            defaults={
+                'title': 'Aufzeichnung',
+                'default_price': 10,
+                'buy_once': True})
+        self.item_types['livestream'], created = ItemType.objects.get_or_create(
+            slug='livestream',
+            defaults={
+                'title': 'Livestream',
+                'default_price': 5,
+                'buy_once': True,
+                'expires_on_product_date': True})
+        self.item_types['salon_attendance'], created = ItemType.objects.get_or_create(
+            slug='salon_attendance',
+            defaults={
+                'title': 'Teilnahme',
+                'default_price': 15,
+                'expires_on_product_date': True,
+                'default_amount': 30})
+        self.item_types['seminar_attendance'], created = ItemType.objects.get_or_create(
+            slug='seminar_attendance',
+            defaults={
+                'title': 'Teilnahme',
+                'default_price': 125,
+                'expires_on_product_date': True,
+                'buy_unauthenticated': True,
+                'default_amount': 15})
+
+        self.attachment_type, created = AttachmentType.objects.get_or_create(
+            slug='mp3', defaults={'title': 'MP3'})
+
+    def import_type(self, event_type):
+        type_name = event_type['fields']['bezeichnung']
+        html = event_type['fields']['beschreibung']
+        description = self.converter.convert([html])[html]
         if type_name == 'Salon':
             type, created = EventType.objects.update_or_create(
                 slug='salon',
@@ -37,70 +88,34 @@ def import_from_json():
             type, created = EventType.objects.update_or_create(
                 slug='vortrag',
                 defaults={'title': 'Vortrag', 'section_title': 'Vorträge'})
+        else:
+            logger.warning(f'Unknown event type {type_name}')
+            return
+        self.types[event_type['pk']] = type
+
+    def import_event(self, event):
+        self.events.add(event)
+
+    def save_events(self, events, final=False):
+        markdown = self.converter.convert(
+            event['fields'][field] for event in events for field in ['bezeichnung', 'beschreibung'])
+        for event in events:
+            type = self.types.get(event['fields']['art_veranstaltung'])
+            if type:
+                self.save_event(event, type, markdown)
+            elif final:
+                logger.warning(f'Type of event {event["pk"]} not found')
+            else:
+                self.deferred.append(event)
 
-    # Initiate item types
-    salon_recording_type, created = ItemType.objects.get_or_create(
-        slug='salon_recording',
-        defaults={
-            'title': 'Aufzeichnung',
-            'default_price': 5,
-            'buy_once': True})
-    seminar_recording_type, created = ItemType.objects.get_or_create(
-        slug='seminar_recording',
-        defaults={
-            'title': 'Aufzeichnung',
-            'default_price': 50,
-            'buy_once': True})
-    vortrag_recording_type, created = ItemType.objects.get_or_create(
-        slug='vortrag_recording',
-        defaults={
-            'title': 'Aufzeichnung',
-            'default_price': 10,
-            'buy_once': True})
-    livestream_type, created = ItemType.objects.get_or_create(
-        slug='livestream',
-        defaults={
-            'title': 'Livestream',
-            'default_price': 5,
-            'buy_once': True,
-            'expires_on_product_date': True})
-    salon_attendance_type, created = ItemType.objects.get_or_create(
-        slug='salon_attendance',
-        defaults={
-            'title': 'Teilnahme',
-            'default_price': 15,
-            'expires_on_product_date': True,
-            'default_amount': 30})
-    seminar_attendance_type, created = ItemType.objects.get_or_create(
-        slug='seminar_attendance',
-        defaults={
-            'title': 'Teilnahme',
-            'default_price': 125,
-            'expires_on_product_date': True,
-            'buy_unauthenticated': True,
-            'default_amount': 15})
-
-    attachment_type, created = AttachmentType.objects.get_or_create(
-        slug='mp3', defaults={'title': 'MP3'})
-
-    for event in events:
-        event_type = next((i for i in event_types if event['fields']['art_veranstaltung'] == i['pk']), None)
-
+    def save_event(self, event, type, markdown):
         defaults = {
-            'description': pypandoc.convert(event['fields']['beschreibung'], 'md', format='html'),
+            'description': markdown[event['fields']['beschreibung']],
             'old_pk': event['pk']
         }
 
-        type_name = event_type['fields']['bezeichnung']
-        if type_name == 'Salon':
-            type = EventType.objects.get(slug='salon',)
-        elif type_name == 'Seminar':
-            type = EventType.objects.get(slug='seminar')
-        elif type_name == 'Vorlesung' or type_name == 'Vortrag':
-            type = EventType.objects.get(slug='vortrag')
-
         local_event, created = Event.objects.update_or_create(
-            title=pypandoc.convert(event['fields']['bezeichnung'], 'md', format='html'),
+            title=markdown[event['fields']['bezeichnung']],
             date=event['fields']['datum'],
             type=type,
             defaults=defaults)
@@ -115,18 +130,26 @@ def import_from_json():
         if event['fields']['link']:
             livestream_item = local_event.update_or_create_livestream(link=event['fields']['link'])
         elif type.slug == 'salon' and local_event.date >= date.today():
-            local_event.product.item_set.get_or_create(type=livestream_type)
+            local_event.product.item_set.get_or_create(type=self.item_types['livestream'])
             logger.debug(f'Livestream for {local_event} saved.')
 
         if event['fields']['datei']:
             # Downloaded files have a changed name
             file_name = os.path.split(event['fields']['datei'])[1]
-            existing_file = FileAttachment.objects.filter(type=attachment_type, file=file_name)
+            existing_file = FileAttachment.objects.filter(type=self.attachment_type, file=file_name)
             if existing_file:
-                item_type = ItemType.objects.get(slug=f'{type.slug}_recording')
+                item_type = self.item_types[f'{type.slug}_recording']
                 item, created = local_event.product.item_set.get_or_create(type=item_type)
                 item.files.add(existing_file.get())
                 if livestream_item:
                     livestream_item.files.add(existing_file.get())
             else:
                 local_event.get_or_create_recording(event['fields']['datei'])
+
+    def finish(self):
+        self.events.flush()
+        self.save_events(self.deferred, final=True)
+
+
+def import_from_json():
+    LegacyImporter(EventImportHandler()).run()
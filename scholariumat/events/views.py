@@ -5,11 +5,11 @@ from braces.views import LoginRequiredMixin, StaffuserRequiredMixin
 from django.db.models import Q
 from django.http import Http404
 
-from products.views import PurchaseMixin, DownloadMixin
+from products.views import PurchaseMixin, DownloadMixin, ResolveItemsMixin
 from .models import Event, EventType
 
 
-class EventListView(PurchaseMixin, DownloadMixin, ListView):
+class EventListView(PurchaseMixin, DownloadMixin, ResolveItemsMixin, ListView):
     model = Event
     paginate_by = 10
     event_type = None
@@ -25,7 +25,8 @@ class EventListView(PurchaseMixin, DownloadMixin, ListView):
 
     def get_queryset(self):
         return Event.objects.published().filter(
-            type=self.event_type, date__lt=date.today()).order_by('-date').distinct()
+            type=self.event_type, date__lt=date.today()).order_by('-date').distinct()\
+            .prefetch_related('product__item_set')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -46,10 +47,11 @@ class AttendancesView(StaffuserRequiredMixin, DetailView):
     lookup_field = 'slug'
 
 
-class RecordingsView(LoginRequiredMixin, PurchaseMixin, DownloadMixin, ListView):
+class RecordingsView(LoginRequiredMixin, PurchaseMixin, DownloadMixin, ResolveItemsMixin, ListView):
     model = Event
     paginate_by = 10
     template_name = 'events/recording_list.html'
 
     def get_queryset(self):
-        return Event.objects.published().filter(date__lt=date.today()).order_by('-date').distinct()
+        return Event.objects.published().filter(date__lt=date.today()).order_by('-date').distinct()\
+            .prefetch_related('product__item_set')
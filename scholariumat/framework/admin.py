@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.http import HttpResponseRedirect
+from django.utils import timezone
 
-from .models import Announcement
+from .models import Announcement, Job
 
 
 class PublishAdmin(admin.ModelAdmin):
@@ -16,3 +17,15 @@ class PublishAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Announcement)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['function', 'created', 'run_at', 'attempts', 'failed']
+    list_filter = ['failed', 'function']
+    readonly_fields = ['created', 'modified']
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        queryset.update(failed=False, attempts=0, run_at=timezone.now())
+    retry.short_description = 'Erneut ausführen'
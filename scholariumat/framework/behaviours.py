@@ -8,11 +8,25 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 
 from .managers import PublishedManager
+from .models import Job
 
 
 logger = logging.getLogger(__name__)
 
 
+def post_to_buffer(link):
+    """Adds the link to the queues of all Buffer profiles."""
+    data = [
+        ('access_token', settings.BUFFER_ACCESS_TOKEN),
+        ('media[link]', link)
+    ]
+    ids = [('profile_ids[]', id) for id in settings.BUFFER_SITE_IDS]
+    payload = ids + data
+    response = requests.post('https://api.bufferapp.com/1/updates/create.json', data=payload)
+    logger.debug('Buffer response: {}'.format(response.text))
+    response.raise_for_status()
+
+
 class CommentAble(models.Model):
     comment = models.TextField(blank=True)
 
@@ -34,18 +48,10 @@ class PublishAble(models.Model):
         logger.info('{} published.'.format(self.title))
 
     def buffer_publish(self):
-        """Publishes the object to social media via Buffer."""
+        """Publishes the object to social media via Buffer in a background job."""
 
         link = 'https://%s%s' % (Site.objects.get(pk=settings.SITE_ID).domain, self.get_absolute_url())
-        data = [
-            ('access_token', settings.BUFFER_ACCESS_TOKEN),
-            ('media[link]', link)
-        ]
-        ids = [('profile_ids[]', id) for id in settings.BUFFER_SITE_IDS]
-        payload = ids + data
-        response = requests.post('https://api.bufferapp.com/1/updates/create.json', data=payload)
-        logger.debug('Buffer response: {}'.format(response.text))
-        response.raise_for_status()
+        Job.enqueue('framework.behaviours.post_to_buffer', link)
 
     @classmethod
     def cron_publish(cls):
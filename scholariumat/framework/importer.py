@@ -0,0 +1,239 @@
+"""
+Streaming import of the dump of the legacy database (db.json).
+
+The dump is a JSON array of serialized records. It is read once and decoded one record at a time, so memory use
+does not depend on its size. Every record is passed to the handler registered for its model, which keeps dict
+indexes from legacy primary keys to local objects and writes its records in batches. Small tables referenced by
+records preceding them in the dump are read in a first pass.
+Legacy html is converted to markdown by MarkdownConverter, which caches conversions on disk, so repeated imports
+don't call pandoc again.
+"""
+import datetime
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pypandoc
+
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+BATCH_SIZE = 500
+SEPARATOR_RE = re.compile(r'[\s,]*')
+
+
+def iter_records(path, read_size=READ_SIZE):
+    """Yields the elements of the JSON array in a file one by one, reading it in chunks."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as file:
+        buffer = file.read(read_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{path} does not contain a JSON array')
+        position, eof = 1, False
+        while True:
+            position = SEPARATOR_RE.match(buffer, position).end()
+            if buffer.startswith(']', position):
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Incomplete record: Drop the decoded part of the buffer and read at least as much as it contains
+                buffer = buffer[position:]
+                chunk = file.read(max(read_size, len(buffer)))
+                eof = not chunk
+                buffer, position = buffer + chunk, 0
+                continue
+            yield record
+
+
+def bulk_upsert(model, key, rows):
+    """
+    Creates or updates objects from dicts of field values, identified by the value of the field key, or by the
+    values of a tuple of fields. Existing objects are loaded in one query and only updated if values changed,
+    new objects are created in one query. Returns the primary keys of all objects by key.
+    Values are converted to the types of their fields first, so e.g. dates of the dump can be compared with the
+    values of the database.
+    """
+    fields = (key,) if isinstance(key, str) else key
+
+    def get_key(row):
+        return row[key] if isinstance(key, str) else tuple(row[field] for field in fields)
+
+    def to_python(field, value):
+        value = model._meta.get_field(field).to_python(value)
+        if isinstance(value, datetime.datetime) and settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    rows = ({field: to_python(field, value) for field, value in row.items()} for row in rows)
+    rows = {get_key(row): row for row in rows}
+    if not rows:
+        return {}
+    lookup = {f'{fields[0]}__in': {row[fields[0]] for row in rows.values()}}
+    values = set(fields).union(*rows.values())
+    existing = {get_key(obj): obj for obj in model.objects.filter(**lookup).values('pk', *values)}
+
+    for row_key, row in rows.items():
+        obj = existing.get(row_key)
+        if obj and any(obj[field] != value for field, value in row.items()):
+            model.objects.filter(pk=obj['pk']).update(**row)
+    model.objects.bulk_create([model(**row) for row_key, row in rows.items() if row_key not in existing])
+
+    return {row_key: obj['pk'] for row_key, obj in (
+        (get_key(obj), obj) for obj in model.objects.filter(**lookup).values('pk', *fields)) if row_key in rows}
+
+
+def html_to_markdown(html):
+    return pypandoc.convert(html, 'md', format='html')
+
+
+class MarkdownConverter(object):
+    """
+    Converts legacy html to markdown in batches.
+    Identical texts are converted once and results are cached in files named by the hash of the html. Texts not
+    cached yet are converted in a pool of worker processes.
+    """
+
+    def __init__(self, cache_dir=None, workers=None):
+        self.cache_dir = cache_dir or settings.IMPORT_CACHE_DIR
+        self.workers = workers or settings.IMPORT_WORKERS
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_path(self, html):
+        return os.path.join(self.cache_dir, f'{hashlib.sha256(html.encode()).hexdigest()}.md')
+
+    def load(self, html):
+        try:
+            with open(self.get_path(html), encoding='utf-8') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def store(self, html, markdown):
+        """Writes to a temporary file first, so interrupted imports don't leave incomplete conversions."""
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.cache_dir, delete=False) as file:
+            file.write(markdown)
+        os.replace(file.name, self.get_path(html))
+
+    def convert(self, htmls):
+        """Returns the markdown of all given html texts by html."""
+        results, missing = {}, []
+        for html in set(htmls):
+            markdown = self.load(html)
+            if markdown is None:
+                missing.append(html)
+            else:
+                results[html] = markdown
+
+        if len(missing) > 1 and self.workers != 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                conversions = list(executor.map(html_to_markdown, missing))
+        else:
+            conversions = [html_to_markdown(html) for html in missing]
+        for html, markdown in zip(missing, conversions):
+            self.store(html, markdown)
+            results[html] = markdown
+
+        logger.debug(f'Converted {len(missing)} of {len(results)} html texts')
+        return results
+
+
+class Batch(object):
+    """Collects rows and passes them to write when size rows are collected and on flush()."""
+
+    def __init__(self, write, size=BATCH_SIZE):
+        self.write = write
+        self.size = size
+        self.rows = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def add(self, row, key=None):
+        self.rows[next(self._counter) if key is None else key] = row
+        if len(self.rows) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            rows, self.rows = list(self.rows.values()), {}
+            self.write(rows)
+
+
+class ImportHandler(object):
+    """
+    Imports the records of some legacy models.
+    models maps the labels of the legacy models to the names of the methods handling their records.
+    Records of preload_models are handled in a first pass over the dump, before all others, e.g. small tables
+    referenced by records preceding them in the dump.
+    """
+    models = {}
+    preload_models = {}
+
+    def start(self):
+        """Called before the first record is read."""
+
+    def handle(self, record):
+        getattr(self, self.models[record['model']])(record)
+
+    def preload(self, record):
+        getattr(self, self.preload_models[record['model']])(record)
+
+    def finish(self):
+        """Called after the last record is read. Writes remaining batches and deferred records."""
+
+
+class LegacyImporter(object):
+    """
+    Reads the dump once and passes every record to the handler of its model.
+    If handlers preload models, the dump is read once more before, only handling the records of these models.
+    """
+
+    def __init__(self, *handlers, path=None):
+        self.path = str(path or settings.ROOT_DIR.path('db.json'))
+        self.handlers = handlers
+        self.routes = {model: handler for handler in handlers for model in handler.models}
+        self.preload_routes = {model: handler for handler in handlers for model in handler.preload_models}
+
+    def run(self):
+        logger.info(f'Importing {", ".join(list(self.preload_routes) + list(self.routes))} from {self.path}...')
+        for handler in self.handlers:
+            handler.start()
+
+        counts = Counter()
+        if self.preload_routes:
+            for record in iter_records(self.path):
+                handler = self.preload_routes.get(record['model'])
+                if handler:
+                    handler.preload(record)
+                    counts[record['model']] += 1
+
+        for record in iter_records(self.path):
+            handler = self.routes.get(record['model'])
+            if handler:
+                handler.handle(record)
+                counts[record['model']] += 1
+
+        for handler in self.handlers:
+            handler.finish()
+        logger.info(f'Import finished: {", ".join(f"{count} {model}" for model, count in counts.items())}')
+        return counts
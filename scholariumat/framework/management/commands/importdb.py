@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
-from users.utils import import_from_json as import_users
-from blog.utils import import_from_json as import_articles
-from events.utils import import_from_json as import_events
+from framework.importer import LegacyImporter
+from users.utils import UserImportHandler
+from blog.utils import ArticleImportHandler
+from events.utils import EventImportHandler
 from products.utils import download_missing_files, download_old_db
 
 
@@ -11,8 +12,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting full import.'))
         download_old_db()
-        import_users()
-        import_articles()
-        import_events()
+        # Reads the dump once for all apps
+        LegacyImporter(UserImportHandler(), ArticleImportHandler(), EventImportHandler()).run()
         download_missing_files()
         self.stdout.write(self.style.SUCCESS('Import successfully finished.'))
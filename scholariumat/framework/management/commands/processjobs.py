@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from framework.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Runs due background jobs, polling for new ones until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2, help='Seconds to wait when no job is due')
+        parser.add_argument('--once', action='store_true', help='Exit as soon as no job is due')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Worker started.'))
+        while True:
+            while Job.run_next():
+                pass
+            if options['once']:
+                break
+            time.sleep(options['interval'])
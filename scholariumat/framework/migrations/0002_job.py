@@ -0,0 +1,37 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('framework', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('function', models.CharField(max_length=200)),
+                ('arguments', models.TextField(default='[[], {}]')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('failed', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Hintergrundaufgabe',
+                'verbose_name_plural': 'Hintergrundaufgaben',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='job',
+            index_together={('failed', 'run_at')},
+        ),
+    ]
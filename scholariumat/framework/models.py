@@ -1,4 +1,17 @@
-from django.db import models
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from django_extensions.db.models import TimeStampedModel
+
+
+logger = logging.getLogger(__name__)
 
 
 class Announcement(models.Model):
@@ -10,3 +23,76 @@ class Announcement(models.Model):
     class Meta:
         verbose_name = 'Ankündigung'
         verbose_name_plural = "Ankündigungen"
+
+
+def get_function(path):
+    """Imports a function or a method of a class by its dotted path."""
+    try:
+        return import_string(path)
+    except ImportError:
+        class_path, name = path.rsplit('.', 1)
+        return getattr(import_string(class_path), name)
+
+
+class Job(TimeStampedModel):
+    """
+    Deferred call of a function or classmethod by its dotted path with JSON serializable arguments,
+    executed by the processjobs worker.
+    Jobs are saved in the transaction of the caller, so the worker only sees them once it is committed.
+    """
+    function = models.CharField(max_length=200)
+    arguments = models.TextField(default='[[], {}]')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    failed = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+
+    @classmethod
+    def enqueue(cls, function, *args, **kwargs):
+        job = cls.objects.create(function=function, arguments=json.dumps([args, kwargs]))
+        logger.debug(f'Enqueued job {job}')
+        if settings.JOBS_RUN_IMMEDIATELY:
+            job.run()
+        return job
+
+    def run(self):
+        """Calls the function. Deletes the job on success, otherwise schedules a retry with exponential backoff."""
+        args, kwargs = json.loads(self.arguments)
+        try:
+            with transaction.atomic():  # Changes of a failed function are rolled back
+                get_function(self.function)(*args, **kwargs)
+        except Exception:
+            self.attempts += 1
+            self.error = traceback.format_exc()
+            if self.attempts >= settings.JOBS_MAX_ATTEMPTS:
+                self.failed = True
+                logger.exception(f'Job {self} failed finally after {self.attempts} attempts.')
+            else:
+                self.run_at = timezone.now() + timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (self.attempts - 1))
+                logger.warning(f'Job {self} failed, retrying at {self.run_at}.')
+            self.save()
+            return False
+        self.delete()
+        return True
+
+    @classmethod
+    def run_next(cls):
+        """
+        Runs the next due job. Returns False if there is none.
+        Due jobs are locked while running, concurrent workers skip them.
+        """
+        with transaction.atomic():
+            job = cls.objects.select_for_update(skip_locked=True).filter(
+                failed=False, run_at__lte=timezone.now()).order_by('run_at').first()
+            if job is None:
+                return False
+            job.run()
+        return True
+
+    def __str__(self):
+        return f'{self.function} ({self.pk})'
+
+    class Meta:
+        verbose_name = 'Hintergrundaufgabe'
+        verbose_name_plural = 'Hintergrundaufgaben'
+        index_together = [('failed', 'run_at')]
@@ -0,0 +1,72 @@
+import json
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+
+from .importer import MarkdownConverter, bulk_upsert, iter_records
+from .models import Job
+
+
+class JobTest(TestCase):
+    def setUp(self):
+        self.mock_settings = {'JOBS_RUN_IMMEDIATELY': False, 'JOBS_MAX_ATTEMPTS': 2, 'MANAGERS': [('M', 'm@c.de')]}
+
+    def test_worker(self):
+        with self.settings(**self.mock_settings):
+            Job.enqueue('django.core.mail.mail_managers', 'Subject', 'Message')
+            self.assertEqual(len(mail.outbox), 0)
+            call_command('processjobs', once=True, stdout=mock.MagicMock())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_retry(self):
+        failing = mock.MagicMock(side_effect=ConnectionError('Provider down'))
+        with self.settings(**self.mock_settings), mock.patch('django.core.mail.mail_managers', failing):
+            job = Job.enqueue('django.core.mail.mail_managers', 'Subject', 'Message')
+            self.assertTrue(Job.run_next())
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, 1)
+            self.assertGreater(job.run_at, timezone.now())
+            self.assertFalse(Job.run_next())  # Not due yet
+
+            Job.objects.update(run_at=timezone.now())
+            Job.run_next()
+            job.refresh_from_db()
+            self.assertTrue(job.failed)
+            self.assertIn('Provider down', job.error)
+
+
+class ImporterTest(TestCase):
+    def test_iter_records(self):
+        records = [{'model': 'Scholien.artikel', 'pk': pk, 'fields': {'text': 'ä, ] ' * pk}} for pk in range(20)]
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.json') as dump:
+            json.dump(records, dump, indent=2)
+            dump.flush()
+            self.assertEqual(list(iter_records(dump.name, read_size=7)), records)
+            self.assertEqual(list(iter_records(dump.name)), records)
+
+    def test_markdown_converter(self):
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                mock.patch('pypandoc.convert', return_value='*a*') as convert:
+            self.assertEqual(MarkdownConverter(cache_dir).convert(['<i>a</i>', '<i>a</i>']), {'<i>a</i>': '*a*'})
+            self.assertEqual(convert.call_count, 1)  # Identical texts are converted once
+
+            self.assertEqual(MarkdownConverter(cache_dir).convert(['<i>a</i>']), {'<i>a</i>': '*a*'})
+            self.assertEqual(convert.call_count, 1)  # Cached
+
+    def test_bulk_upsert(self):
+        rows = [{'email': 'a.b@c.de', 'date_joined': '2014-01-01T12:00:00Z', 'is_active': True}]
+        pks = bulk_upsert(get_user_model(), 'email', rows)
+        self.assertEqual(pks, {'a.b@c.de': get_user_model().objects.get().pk})
+
+        # Values of the dump are compared with typed values, unchanged objects are not updated
+        with self.assertNumQueries(2):
+            self.assertEqual(bulk_upsert(get_user_model(), 'email', rows), pks)
+        self.assertEqual(bulk_upsert(get_user_model(), ('email', 'date_joined'), rows),
+                         {('a.b@c.de', get_user_model().objects.get().date_joined): pks['a.b@c.de']})
+        self.assertEqual(get_user_model().objects.count(), 1)
@@ -10,8 +10,13 @@ class ZotItemAdmin(ProductBaseAdmin):
     list_display = ['title', 'get_authors', 'published']
     list_filter = ['published']
 
-    def get_authors(self, obj):  # TODO: Move to detail view, big list becomes unresponsive.
+    def get_queryset(self, request):
+        return ZotItem.prefetch_list(super().get_queryset(request))
+
+    def get_authors(self, obj):
         return ", ".join([author.__str__() for author in obj.authors.all()])
+    get_authors.admin_order_field = 'author_sort'
+    get_authors.short_description = 'Autoren'
 
 
 class AuthorAdmin(admin.ModelAdmin):
@@ -1,9 +1,10 @@
 import logging
 import time
 
+from django.conf import settings
 from django_cron import CronJobBase, Schedule
 
-from .models import Collection, ZotItem
+from .models import Collection, ZotItem, ZotAttachment
 
 
 logger = logging.getLogger(__name__)
@@ -19,8 +20,9 @@ class ZoteroSync(CronJobBase):
         logger.info('Running Zotero synchronisation job...')
         start = time.time()
         Collection.retrieve()
-        for collection in Collection.objects.all():
-            collection.sync()
+        if not (settings.ZOTERO_INCREMENTAL_SYNC and Collection.sync_changes()):
+            Collection.sync_all()
         ZotItem.remove_deleted()
+        ZotAttachment.render_notes()
         end = time.time()
         logger.info('Zotero synchronisation job finished. Took {} seconds.'.format(int(end - start)))
@@ -0,0 +1,81 @@
+import time
+import tracemalloc
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from library.models import Collection, ZotItem
+from library.testing import FakeLibrary, fake_zotero
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks full and incremental Zotero synchronisation against a synthetic library in a test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', nargs='+', type=int, default=[1000, 10000, 50000])
+        parser.add_argument('--collections', type=int, default=20)
+        parser.add_argument('--changed', type=float, default=0.01,
+                            help='Share of items changed before the incremental sync')
+        parser.add_argument('--no-memory', action='store_false', dest='memory',
+                            help='Do not trace memory, which slows down the synchronisation')
+
+    def measure(self, function):
+        """Returns wall time, number of queries and peak of traced memory in MB of calling function."""
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(1)
+            return execute(sql, params, many, context)
+
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            function()
+        duration = time.perf_counter() - start
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        return duration, len(queries), peak
+
+    def report(self, items, phase, duration, queries, peak):
+        memory = f'{peak:10.1f}' if peak is not None else f'{"-":>10}'
+        self.stdout.write(f'{items:>8} {phase:<12} {duration:10.2f} {queries:10} {memory}')
+
+    def full_sync(self):
+        Collection.retrieve()
+        Collection.sync_all()
+        ZotItem.remove_deleted()
+
+    def incremental_sync(self):
+        Collection.retrieve()
+        Collection.sync_changes()
+        ZotItem.remove_deleted()
+
+    def handle(self, *args, **options):
+        self.memory = options['memory']
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(f'{"items":>8} {"phase":<12} {"seconds":>10} {"queries":>10} {"peak MB":>10}')
+            for items in options['items']:
+                library = FakeLibrary(items=items, collections=options['collections'])
+                changed = int(items * options['changed'])
+                mock_settings = {
+                    'ZOTERO_USER_ID': library.user_id,
+                    'ZOTERO_LIBRARY_TYPE': library.library_type,
+                    'ZOTERO_API_KEY': '',
+                }
+                with fake_zotero(library), override_settings(**mock_settings):
+                    self.report(items, 'full', *self.measure(self.full_sync))
+                    self.report(items, 'unchanged', *self.measure(self.incremental_sync))
+                    library.change(changed)
+                    library.delete(changed // 2)
+                    self.report(items, 'incremental', *self.measure(self.incremental_sync))
+                call_command('flush', interactive=False, verbosity=0)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(self.style.SUCCESS('Benchmark finished.'))
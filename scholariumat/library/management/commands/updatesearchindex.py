@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from library.models import ZotItem
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the full-text search index of all library items'
+
+    def handle(self, *args, **options):
+        ZotItem.update_search_index()
+        self.stdout.write(self.style.SUCCESS('Search index updated.'))
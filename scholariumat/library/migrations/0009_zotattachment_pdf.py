@@ -0,0 +1,28 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_libraryversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zotattachment',
+            name='pdf',
+            field=models.FileField(blank=True, editable=False, upload_to='notes/'),
+        ),
+        migrations.AddField(
+            model_name='zotattachment',
+            name='pdf_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='zotattachment',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+FORWARD_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    'CREATE TEXT SEARCH CONFIGURATION german_unaccent (COPY = german)',
+    'ALTER TEXT SEARCH CONFIGURATION german_unaccent '
+    'ALTER MAPPING FOR hword, hword_part, word WITH unaccent, german_stem',
+    'CREATE INDEX library_zotitem_search_vector ON library_zotitem USING gin (search_vector)',
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS library_zotitem_search_vector',
+    'DROP TEXT SEARCH CONFIGURATION IF EXISTS german_unaccent',
+]
+
+
+def run_sql(statements):
+    """The search configuration and index only exist on PostgreSQL, other databases use the fallback search."""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_zotattachment_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zotitem',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='zotitem',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_sql(FORWARD_SQL), run_sql(REVERSE_SQL)),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_zotitem_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zotitem',
+            name='author_sort',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200),
+        ),
+    ]
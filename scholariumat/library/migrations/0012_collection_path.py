@@ -0,0 +1,47 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def set_paths_and_counts(apps, schema_editor):
+    Collection = apps.get_model('library', 'Collection')
+    ZotItem = apps.get_model('library', 'ZotItem')
+    collections = {collection.pk: collection for collection in Collection.objects.all()}
+
+    def get_slugs(collection):
+        parent = collections.get(collection.parent_id)
+        return (get_slugs(parent) if parent else []) + [collection.slug]
+
+    counts = dict(ZotItem.collection.through.objects.values_list('collection').annotate(count=Count('zotitem')))
+    totals = defaultdict(int)
+    for collection in collections.values():
+        slugs = get_slugs(collection)
+        collection.path = ''.join(f'{slug}/' for slug in slugs)
+        for depth in range(1, len(slugs) + 1):
+            totals[''.join(f'{slug}/' for slug in slugs[:depth])] += counts.get(collection.pk, 0)
+    for collection in collections.values():
+        Collection.objects.filter(pk=collection.pk).update(path=collection.path, num_items=totals[collection.path])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_zotitem_author_sort'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='num_items',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(set_paths_and_counts, migrations.RunPython.noop),
+    ]
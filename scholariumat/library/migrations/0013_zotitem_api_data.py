@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_collection_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zotitem',
+            name='api_data',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -1,4 +1,6 @@
+import json
 import logging
+from collections import defaultdict
 from pyzotero import zotero, zotero_errors
 from slugify import slugify
 from dateutil.parser import parse
@@ -6,17 +8,25 @@ from weasyprint import HTML
 from pyzotero.zotero_errors import ResourceNotFound
 import re
 
-from django.db import models
+from django.db import models, connection
+from django.db.models import F, Q, Count
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse, HttpResponseRedirect
+from django.core.files.base import ContentFile
 from django.core.mail import mail_admins
+from django.core.cache import cache
 
 from django_extensions.db.models import TimeStampedModel, TitleSlugDescriptionModel
 
-from products.models import Purchase, ItemType, AttachmentType, Item
+from products.models import Purchase, ItemType, AttachmentType, Item, Product
 from products.behaviours import AttachmentBase, ProductBase
+from products.utils import stream_file, get_signed_url
 from framework.behaviours import CommentAble, PermalinkAble
+from framework.models import Job
+from . import search
+from .utils import ZoteroFetcher
 
 
 logger = logging.getLogger(__name__)
@@ -32,6 +42,9 @@ class ZotAttachment(AttachmentBase):
     key = models.CharField(max_length=100, blank=True)
     format = models.CharField(max_length=5, choices=FORMAT_CHOICES)
     zotitem = models.ForeignKey('ZotItem', on_delete=models.CASCADE, null=True, blank=True)
+    version = models.PositiveIntegerField(default=0, editable=False)  # Zotero item version
+    pdf = models.FileField(upload_to='notes/', blank=True, editable=False)  # Rendered note
+    pdf_version = models.PositiveIntegerField(null=True, blank=True, editable=False)
 
     ITEMTYPE_DEFAULTS = {
         'shipping': False,
@@ -47,6 +60,8 @@ class ZotAttachment(AttachmentBase):
         'inform_staff': False,
     }
 
+    RENDER_BATCH_SIZE = 50  # Maximum number of items per Zotero request
+
     @classmethod
     def update_or_create_from_data(cls, data):
         if data['itemType'] == 'attachment' and 'filename' in data:
@@ -67,11 +82,28 @@ class ZotAttachment(AttachmentBase):
 
         attachment_type, created = AttachmentType.objects.get_or_create(slug=type, defaults={'title': type.upper()})
         attachment, created = cls.objects.update_or_create(
-            key=data['key'], defaults={'format': format, 'zotitem': zotitem, 'type': attachment_type})
+            key=data['key'], defaults={
+                'format': format, 'zotitem': zotitem, 'type': attachment_type, 'version': data.get('version', 0)})
         attachment.update_or_create_item()
 
         return attachment
 
+    @classmethod
+    def remove(cls, attachments):
+        """Deletes attachments and their items. Bought items are kept with amount 0."""
+        items = Item.objects.filter(zotattachment__in=attachments)
+        files = [attachment.pdf.name for attachment in attachments.exclude(pdf='')]
+        try:
+            items.delete()
+            attachments.delete()
+        except models.ProtectedError:
+            for item in items:
+                item.handle_protected()
+        else:
+            storage = cls._meta.get_field('pdf').storage
+            for name in files:
+                storage.delete(name)
+
     def update_or_create_item(self):
         if self.type.slug not in settings.DOWNLOAD_FORMATS:
             if self.item:
@@ -101,63 +133,127 @@ class ZotAttachment(AttachmentBase):
         self.item = item
         self.save()
 
-    def get(self):
-        zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
-        if self.format == 'note':
+    @property
+    def rendered(self):
+        """Whether the cached pdf belongs to the current version of the note."""
+        return bool(self.pdf) and self.pdf_version == self.version
+
+    def render(self, data=None):
+        """Renders the note as pdf and caches it. Note data is retrieved from Zotero if not passed."""
+        if data is None:
+            zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
+            data = zot.item(self.key)['data']
+        self.version = data.get('version', self.version)
+
+        outdated = self.pdf.name
+        self.pdf.save(f'{self.key}-{self.version}.pdf', ContentFile(HTML(string=data['note']).write_pdf()), save=False)
+        self.pdf_version = self.version
+        self.save(update_fields=['version', 'pdf', 'pdf_version'])
+        if outdated:
+            self.pdf.storage.delete(outdated)
+        logger.debug(f'Conversion to pdf successfull: {self.key}')
 
-            html = zot.item(self.key)['data']['note']
-            path = f'{settings.TMP_DIR}/{self.key}.pdf'
-            HTML(string=html).write_pdf(path)
+    @classmethod
+    def render_notes(cls):
+        """Renders all notes without current pdf, retrieving their data from Zotero in batches."""
+        outdated = cls.objects.filter(format='note').filter(
+            Q(pdf='') | Q(pdf_version__isnull=True) | ~Q(pdf_version=F('version')))
+        pending = {attachment.key: attachment for attachment in outdated}
+        logger.info(f'Rendering {len(pending)} notes...')
+
+        zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
+        keys = list(pending)
+        for start in range(0, len(keys), cls.RENDER_BATCH_SIZE):
+            for item in zot.items(itemKey=','.join(keys[start:start + cls.RENDER_BATCH_SIZE])):
+                try:
+                    pending[item['data']['key']].render(item['data'])
+                except Exception:
+                    logger.exception(f'Rendering note {item["data"]["key"]} failed.')
 
-            logger.debug(f'Conversion to pdf successfull: {self.key}')
-            with open(path, 'rb') as file:
-                response = HttpResponse(file.read(), content_type=f'application/pdf')
+    def get(self, range_header=None, redirect=False):
+        filename = f'{slugify(self.item.product.zotitem.title)}.pdf'
+        if self.format == 'note':
+            if not self.rendered:
+                self.render()
+            url = redirect and get_signed_url(self.pdf, filename, 'application/pdf')
+            if url:
+                return HttpResponseRedirect(url)
+            return stream_file(
+                self.pdf.open('rb'), filename, 'application/pdf', size=self.pdf.size, range_header=range_header)
         elif self.format == 'file':
             try:
-                file = zot.file(self.key)
+                download = ZoteroFetcher(workers=1).get_file(self.key, range_header=range_header)
             except zotero_errors.ResourceNotFound:
                 logger.exception(f'Zotero: File at {self.key} is missing!')
                 return False
-            response = HttpResponse(file, content_type=f'application/{self.type.slug}')
-
-        response['Content-Disposition'] = f'attachment; \
-            filename={slugify(self.item.product.zotitem.title)}.pdf'
-        return response
+            response = StreamingHttpResponse(
+                ZoteroFetcher.iter_file(download), status=download.status_code,
+                content_type=f'application/{self.type.slug}')
+            for header in ['Content-Length', 'Content-Range', 'Accept-Ranges']:
+                if header in download.headers:
+                    response[header] = download.headers[header]
+            response['Content-Disposition'] = f'attachment; filename={filename}'
+            return response
 
 
 class Collection(TitleSlugDescriptionModel, PermalinkAble):
     parent = models.ForeignKey('self', blank=True, null=True, on_delete=models.SET_NULL)
+    path = models.CharField(max_length=500, blank=True, editable=False, db_index=True)  # Slugs from root to self
+    num_items = models.PositiveIntegerField(default=0, editable=False)  # Items including subcollections
+
+    PATH_SEPARATOR = '/'
 
     @property
     def children(self):
         return self.__class__.objects.filter(parent=self)
 
-    @property
-    def num_items(self):
-        items = 0
-        for child in self.children:
-            items += child.num_items
-        items += len(ZotItem.objects.filter(collection=self))
-        return items
+    def get_path(self):
+        return f'{self.parent.path if self.parent else ""}{self.slug}{self.PATH_SEPARATOR}'
+
+    def get_ancestor_paths(self):
+        """Paths of all parents and the collection itself, starting at the root."""
+        slugs = self.path.split(self.PATH_SEPARATOR)[:-1]
+        return [''.join(f'{slug}{self.PATH_SEPARATOR}' for slug in slugs[:depth]) for depth in range(1, len(slugs) + 1)]
+
+    def save(self, *args, **kwargs):
+        self.path = self.get_path()
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def update_counts(cls):
+        """Stores the number of items of all collections including their subcollections, counted in one query."""
+        counts = dict(ZotItem.collection.through.objects.values_list('collection').annotate(count=Count('zotitem')))
+        collections = list(cls.objects.all())
+        totals = defaultdict(int)
+        for collection in collections:
+            for path in collection.get_ancestor_paths():
+                totals[path] += counts.get(collection.pk, 0)
+        for collection in collections:
+            if collection.num_items != totals[collection.path]:
+                cls.objects.filter(pk=collection.pk).update(num_items=totals[collection.path])
 
     def handle_protected(self):
         logger.error(f'Failed to delete collection: {self}')
         mail_admins(f'Can not delete collection {self}')
 
-    def sync(self):
+    def remove_missing(self):
+        logger.warning(f'Revoming collection {self.title}')
+        self.delete()
+
+    def sync(self, items=None):
         """
         Retrieves and saves metadata from all items, attachments and notes inside the collection from zotero.
+        Items of the collection that have already been downloaded can be passed.
         """
 
-        logger.info('Retrieving items in {}'.format(self.title))
+        if items is None:
+            logger.info('Retrieving items in {}'.format(self.title))
 
-        zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
-        try:
-            items = zot.everything(zot.collection_items(self.slug))
-        except ResourceNotFound:
-            logger.warning(f'Revoming collection {self.title}')
-            self.delete()
-            return None
+            zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
+            try:
+                items = zot.everything(zot.collection_items(self.slug))
+            except ResourceNotFound:
+                return self.remove_missing()
 
         # Seperate items and attachments/notes
         parents, children = [], []
@@ -169,10 +265,8 @@ class Collection(TitleSlugDescriptionModel, PermalinkAble):
 
         logger.info('updating items...')
 
-        for item in parents:
-            zotitem = ZotItem.update_or_create_from_data(item['data'])
-            if zotitem:
-                zotitem.collection.add(self)
+        zotitems = ZotItem.bulk_update_or_create_from_data([item['data'] for item in parents])
+        self.zotitem_set.add(*zotitems)
 
         logger.info('cleaning up...')
 
@@ -192,25 +286,100 @@ class Collection(TitleSlugDescriptionModel, PermalinkAble):
         # Remove deleted attachments/notes or attachments not in DOWNLOAD_FORMATS
         logger.info('cleaning up...')
         child_keys = [child['data']['key'] for child in children]
-        try:
-            attachments = ZotAttachment.objects.filter(zotitem__collection=self).exclude(
-                type__slug__in=settings.DOWNLOAD_FORMATS, key__in=child_keys)
-            items = Item.objects.filter(zotattachment__in=attachments)
-            items.delete()
-            attachments.delete()
-        except models.ProtectedError as e:
-            for item in items:
-                item.handle_protected()
+        ZotAttachment.remove(ZotAttachment.objects.filter(zotitem__collection=self).exclude(
+            type__slug__in=settings.DOWNLOAD_FORMATS, key__in=child_keys))
 
         logger.info('Sync finished.')
 
+    @classmethod
+    def sync_all(cls):
+        """
+        Synchronises all collections and stores the library version the synchronisation is based on.
+        Collections are downloaded concurrently and saved as soon as their download is finished.
+        """
+        zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
+        version = zot.last_modified_version(limit=1)
+        collections = {collection.slug: collection for collection in cls.objects.all()}
+        for key, items in ZoteroFetcher().collection_items(collections):
+            if items is None:
+                collections[key].remove_missing()
+            else:
+                logger.info(f'Saving {len(items)} items in {collections[key].title}')
+                collections[key].sync(items)
+        cls.update_counts()
+        LibraryVersion.objects.update_or_create(library=settings.ZOTERO_USER_ID, defaults={'version': version})
+
+    @classmethod
+    def sync_changes(cls):
+        """
+        Retrieves and saves only items, attachments and notes changed or deleted since the last synchronised
+        library version. Returns False if no version is stored yet, a full sync is necessary in this case.
+        """
+        state = LibraryVersion.objects.filter(library=settings.ZOTERO_USER_ID).first()
+        if not state:
+            return False
+
+        zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
+        query = zot.items(since=state.version)
+        version = int(zot.request.headers.get('last-modified-version', state.version))
+        if version == state.version:
+            logger.info(f'Library unchanged since version {version}.')
+            return True
+
+        logger.info(f'Retrieving changes from version {state.version} to {version}...')
+        items = zot.everything(query)
+        removed = set(zot.deleted(since=state.version).get('items', []))
+
+        # Seperate items and attachments/notes
+        parents, children = [], []
+        for item in items:
+            if item['data'].get('deleted'):  # Moved to trash
+                removed.add(item['data']['key'])
+            elif 'parentItem' in item['data']:
+                children.append(item)
+            elif item['data']['itemType'] in settings.ZOTERO_ITEM_TYPES:
+                parents.append(item)
+
+        logger.info(f'updating {len(parents)} items...')
+
+        collections = {collection.slug: collection for collection in cls.objects.all()}
+        item_collections = {}
+        for item in parents:
+            keys = [key for key in item['data'].get('collections', []) if key in collections]
+            if keys:
+                item_collections[item['data']['key']] = [collections[key] for key in keys]
+            else:
+                removed.add(item['data']['key'])
+
+        zotitems = ZotItem.bulk_update_or_create_from_data(
+            [item['data'] for item in parents if item['data']['key'] in item_collections])
+        for zotitem in zotitems:
+            zotitem.collection.set(item_collections[zotitem.slug])
+
+        logger.info(f'updating {len(children)} attachments/notes...')
+
+        for child in children:
+            if not ZotAttachment.update_or_create_from_data(child['data']):
+                removed.add(child['data']['key'])
+
+        logger.info('cleaning up...')
+
+        # Items without collection get removed by ZotItem.remove_deleted
+        for zotitem in ZotItem.objects.filter(slug__in=removed):
+            zotitem.collection.clear()
+        ZotAttachment.remove(ZotAttachment.objects.filter(key__in=removed))
+        Author.objects.filter(zotitem__isnull=True).delete()
+        cls.update_counts()
+
+        state.version = version
+        state.save()
+        logger.info('Sync finished.')
+        return True
+
     def get_parents(self):
-        parents = []
-        parent = self.parent
-        while(parent):
-            parents.append(parent)
-            parent = parent.parent
-        return parents
+        """Returns all parents, starting with the closest one."""
+        paths = self.get_ancestor_paths()[:-1]
+        return sorted(self.__class__.objects.filter(path__in=paths), key=lambda parent: -len(parent.path))
 
     def __str__(self):
         return self.title
@@ -224,20 +393,20 @@ class Collection(TitleSlugDescriptionModel, PermalinkAble):
         zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
         collections = [collection for collection in zot.collections() if collection['data']['name'][0] != '_']
 
-        def save_collections(parent_key, collections):
+        def save_collections(parent, collections):
             """
-            Saves parent and childcollections recursively as models.
+            Saves parent and childcollections recursively as models, so paths of parents are always up to date.
             """
+            parent_key = parent.slug if parent else False
             for collection in [c for c in collections if c['data']['parentCollection'] == parent_key]:
                 key = collection['data']['key']
                 name = collection['data']['name']
-                parent = cls.objects.get(slug=parent_key) if parent_key else None
                 local_collection, created = cls.objects.update_or_create(
                     slug=key,
                     defaults={'title': name, 'parent': parent})
                 logger.debug('Collection {} saved.'.format(name))
 
-                save_collections(key, collections)
+                save_collections(local_collection, collections)
 
         # Check for collections to delete
         logger.debug('cleaning up...')
@@ -249,16 +418,43 @@ class Collection(TitleSlugDescriptionModel, PermalinkAble):
                 except models.ProtectedError as e:
                     local_collection.handle_protected()
 
-        save_collections(False, collections)
+        save_collections(None, collections)
 
     class Meta:
         verbose_name = 'Kollektion'
         verbose_name_plural = 'Kollektionen'
 
 
+class LibraryVersion(TimeStampedModel):
+    """Zotero library version of the last synchronisation. Enables retrieving changes only."""
+
+    library = models.CharField(max_length=50, unique=True)
+    version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.library}: {self.version}'
+
+    class Meta:
+        verbose_name = 'Bibliotheksversion'
+        verbose_name_plural = 'Bibliotheksversionen'
+
+
 class Author(models.Model):
     name = models.CharField(max_length=255)
 
+    @classmethod
+    def get_or_create_many(cls, names):
+        """Returns authors by name. All missing authors are created at once."""
+        authors = {}
+        for author in cls.objects.filter(name__in=names).order_by('pk'):
+            authors.setdefault(author.name, author)
+        missing = [cls(name=name) for name in names if name not in authors]
+        if missing:
+            cls.objects.bulk_create(missing)
+            for author in cls.objects.filter(name__in=[author.name for author in missing]).order_by('pk'):
+                authors.setdefault(author.name, author)
+        return authors
+
     def __str__(self):
         return self.name
 
@@ -277,6 +473,14 @@ class ZotItem(ProductBase):
     price = models.SmallIntegerField(null=True, blank=True, editable=False)
     price_digital = models.SmallIntegerField(null=True, blank=True, editable=False)
     printing = models.BooleanField(default=False, editable=False)
+    author_sort = models.CharField(max_length=200, blank=True, editable=False, db_index=True)  # Names of all authors
+    search_text = models.TextField(blank=True, editable=False)  # Normalized title, authors and year, see search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+    api_data = models.TextField(blank=True, editable=False)  # Item data of the Zotero API as JSON
+
+    API_BATCH_SIZE = 50  # Maximum number of items per Zotero request
+
+    SYNC_BATCH_SIZE = 100  # Items written per batch in bulk_update_or_create_from_data
 
     LIBRARY_ITEMTYPE_DEFAULTS = {
         'shipping': True,
@@ -328,9 +532,10 @@ class ZotItem(ProductBase):
             return None
 
     @classmethod
-    def update_or_create_from_data(cls, data):
+    def parse_data(cls, data):
         """
-        Given API data from Zotero as dict, update or create a ZotItem.
+        Given API data from Zotero as dict, returns the field values of the ZotItem and the names of its authors.
+        Returns None if the data is invalid.
         """
         # Get title
         try:
@@ -342,7 +547,7 @@ class ZotItem(ProductBase):
         # Get date
         date = data.get('date')
         try:
-            date = parse(date) if date else None
+            date = parse(date).date() if date else None
         except ValueError:
             logger.debug(f'Date {date} not recognized: {title}. skipping.')
             return None
@@ -350,12 +555,16 @@ class ZotItem(ProductBase):
         # Get extra variables
         extra_variables = dict(re.findall(r'{(\w+):\s?(\w+)}', data.get('extra', '')))
 
+        def get_number(key):
+            value = extra_variables.get(key)
+            return int(value) if value and value.isdigit() else None
+
         # Get amount
         tags = [tag['tag'] for tag in data['tags']]
         printing = settings.ZOTERO_PRINTING_TAG in tags
 
-        amount = extra_variables.get('amount')
-        if not amount:
+        amount = get_number('amount')
+        if amount is None:
             owned = any([tag in tags for tag in settings.ZOTERO_OWNER_TAGS])
             excluded = any([tag in tags for tag in settings.ZOTERO_EXCLUDED_TAGS])
 
@@ -366,28 +575,72 @@ class ZotItem(ProductBase):
             elif printing:
                 amount = 0
 
-        # Get/Set authors
+        # Get authors
         authors = []
         for creator in data.get('creators', []):
             names = list(filter(None, [creator.get(name_key) for name_key in ['firstName', 'name', 'lastName']]))
-            full_name = ' '.join(names)
-            author, created = Author.objects.get_or_create(name=full_name)
-            authors.append(author)
+            authors.append(' '.join(names))
 
-        slug = data['key']
         item_data = {
-            'slug': slug,
+            'slug': data['key'],
             'title': title,
             'published': date,
             'amount': amount,
-            'price': extra_variables.get('price'),
-            'price_digital': extra_variables.get('price_digital'),
-            'printing': printing
+            'price': get_number('price'),
+            'price_digital': get_number('price_digital'),
+            'printing': printing,
+            'author_sort': cls.get_author_sort(authors),
+            'search_text': search.get_search_text(title, authors, date),
+            'api_data': json.dumps(data, sort_keys=True),
         }
+        return item_data, authors
+
+    @property
+    def api_object(self):
+        """
+        Zotero API object of the item as stored by the last synchronisation.
+        Until the data is stored, it is approximated from the fields of the item.
+        """
+        if self.api_data:
+            return {'data': json.loads(self.api_data)}
+        return {'data': {
+            'title': self.title,
+            'creators': [{'lastName': author.name} for author in self.authors.all()],
+            'date': str(self.published.year) if self.published else '',
+        }}
+
+    @classmethod
+    def refresh_api_data(cls, slugs):
+        """Retrieves and stores the Zotero data of the given items in batches."""
+        zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
+        for start in range(0, len(slugs), cls.API_BATCH_SIZE):
+            for item in zot.items(itemKey=','.join(slugs[start:start + cls.API_BATCH_SIZE])):
+                data = item['data']
+                cls.objects.filter(slug=data['key']).update(api_data=json.dumps(data, sort_keys=True))
+
+    def request_api_data(self):
+        """Retrieves missing Zotero data in the background, at most once per hour."""
+        if not self.api_data and cache.add(f'zotitem_api_data_{self.slug}', True, 60 * 60):
+            Job.enqueue('library.models.ZotItem.refresh_api_data', [self.slug])
+
+    @classmethod
+    def get_author_sort(cls, author_names):
+        return ', '.join(author_names)[:cls._meta.get_field('author_sort').max_length]
 
-        existing = cls.objects.filter(slug=slug)
+    @classmethod
+    def update_or_create_from_data(cls, data):
+        """
+        Given API data from Zotero as dict, update or create a ZotItem.
+        """
+        parsed = cls.parse_data(data)
+        if not parsed:
+            return None
+        item_data, author_names = parsed
+        authors = [Author.objects.get_or_create(name=name)[0] for name in author_names]
+
+        existing = cls.objects.filter(slug=item_data['slug'])
         local_amount = existing.get().amount if existing else None
-        amount_changed = local_amount is not amount
+        amount_changed = local_amount != item_data['amount']
 
         zot_item, created = existing.update_or_create(defaults=item_data)
         zot_item.authors.clear()
@@ -397,6 +650,117 @@ class ZotItem(ProductBase):
         logger.debug(f'Saved item {zot_item.title}. Created: {created}')
         return zot_item
 
+    @classmethod
+    def bulk_update_or_create_from_data(cls, data_list):
+        """
+        Batch version of update_or_create_from_data for many items, e.g. the result of a collection request.
+        Returns the saved ZotItems.
+        """
+        zotitems = []
+        for start in range(0, len(data_list), cls.SYNC_BATCH_SIZE):
+            zotitems += cls._bulk_update_or_create(data_list[start:start + cls.SYNC_BATCH_SIZE])
+        return zotitems
+
+    @classmethod
+    def _bulk_update_or_create(cls, data_list):
+        """
+        Authors, items, author relations and purchase items are each read and written set-based.
+        Unchanged items are not written at all.
+        """
+        parsed = {}
+        for data in data_list:
+            result = cls.parse_data(data)
+            if result:
+                parsed[result[0]['slug']] = result
+        if not parsed:
+            return []
+
+        authors = Author.get_or_create_many({name for item_data, names in parsed.values() for name in names})
+
+        zotitems = {zotitem.slug: zotitem for zotitem in cls.objects.filter(slug__in=parsed)}
+        amount_changed = {
+            slug: (zotitems[slug].amount if slug in zotitems else None) != item_data['amount']
+            for slug, (item_data, names) in parsed.items()}
+
+        # Save changed items, create new ones with their products at once
+        new = []
+        for slug, (item_data, names) in parsed.items():
+            zotitem = zotitems.get(slug)
+            if zotitem is None:
+                new.append(cls(**item_data))
+            elif any(getattr(zotitem, field) != value for field, value in item_data.items()):
+                for field, value in item_data.items():
+                    setattr(zotitem, field, value)
+                zotitem.save()
+        if new:
+            if connection.features.can_return_ids_from_bulk_insert:
+                products = Product.objects.bulk_create([Product(kind=cls._meta.model_name) for zotitem in new])
+            else:
+                products = [Product.objects.create(kind=cls._meta.model_name) for zotitem in new]
+            for zotitem, product in zip(new, products):
+                zotitem.product = product
+            cls.objects.bulk_create(new)
+            created = cls.objects.filter(slug__in=[zotitem.slug for zotitem in new])
+            cls.update_search_vectors(created)
+            zotitems.update({zotitem.slug: zotitem for zotitem in created})
+
+        # Only add and remove changed author relations
+        through = cls.authors.through
+        current = {
+            (zotitem_id, author_id): pk for pk, zotitem_id, author_id in through.objects.filter(
+                zotitem__in=zotitems.values()).values_list('pk', 'zotitem_id', 'author_id')}
+        wanted = {
+            (zotitems[slug].pk, authors[name].pk) for slug, (item_data, names) in parsed.items() for name in names}
+        through.objects.filter(pk__in=[pk for relation, pk in current.items() if relation not in wanted]).delete()
+        through.objects.bulk_create([
+            through(zotitem_id=zotitem_id, author_id=author_id)
+            for zotitem_id, author_id in wanted if (zotitem_id, author_id) not in current])
+
+        zotitems = [zotitems[slug] for slug in parsed]
+        cls.bulk_update_or_create_purchase_items(zotitems, amount_changed)
+
+        logger.debug(f'Saved {len(zotitems)} items. Created: {len(new)}')
+        return zotitems
+
+    def save(self, *args, **kwargs):
+        if not self.search_text:  # Authors are added by the synchronisation
+            self.search_text = search.get_search_text(self.title, published=self.published)
+        super().save(*args, **kwargs)
+        self.update_search_vectors(ZotItem.objects.filter(pk=self.pk))
+
+    @staticmethod
+    def update_search_vectors(queryset):
+        """Updates the full-text index of the items from their search fields, only needed on PostgreSQL."""
+        if search.is_supported():
+            queryset.update(search_vector=search.get_search_vector())
+
+    @classmethod
+    def update_search_index(cls):
+        """Recomputes the search and author sort fields of all items."""
+        pks = list(cls.objects.values_list('pk', flat=True))
+        for start in range(0, len(pks), cls.SYNC_BATCH_SIZE):
+            batch = pks[start:start + cls.SYNC_BATCH_SIZE]
+            for zotitem in cls.objects.filter(pk__in=batch).prefetch_related('authors'):
+                names = [author.name for author in zotitem.authors.all()]
+                fields = {
+                    'author_sort': cls.get_author_sort(names),
+                    'search_text': search.get_search_text(zotitem.title, names, zotitem.published),
+                }
+                if any(getattr(zotitem, field) != value for field, value in fields.items()):
+                    cls.objects.filter(pk=zotitem.pk).update(**fields)
+        cls.update_search_vectors(cls.objects.all())
+
+    @classmethod
+    def prefetch_list(cls, queryset):
+        """Loads authors and items with their types of all items in lists at once."""
+        return queryset.select_related('product').prefetch_related(
+            'authors', models.Prefetch('product__item_set', queryset=Item.objects.select_related('type')))
+
+    @classmethod
+    def search(cls, text):
+        """Returns the items matching the search text, annotated with their relevance as rank."""
+        return search.search(cls.objects.all(), text)
+
     @classmethod
     def remove_deleted(cls):
         for item in cls.objects.filter(collection__isnull=True):
@@ -408,19 +772,24 @@ class ZotItem(ProductBase):
     def handle_protected(self):
         logger.info(f'Skipping deletion of {self}')
 
+    @classmethod
+    def get_purchase_itemtype(cls, printing):
+        if printing:
+            itemtype, created = ItemType.objects.update_or_create(
+                slug='published_purchase',
+                defaults=cls.PUBLISHING_ITEMTYPE_DEFAULTS)
+        else:
+            itemtype, created = ItemType.objects.update_or_create(
+                slug='library_purchase',
+                defaults=cls.LIBRARY_ITEMTYPE_DEFAULTS)
+        return itemtype
+
     def update_or_create_purchase_item(self, amount_changed=False):
         """
         Updates purchasable items for a Zotero Item
         """
         if self.amount is not None:
-            if self.printing:
-                itemtype, created = ItemType.objects.update_or_create(
-                    slug='published_purchase',
-                    defaults=self.PUBLISHING_ITEMTYPE_DEFAULTS)
-            else:
-                itemtype, created = ItemType.objects.update_or_create(
-                    slug='library_purchase',
-                    defaults=self.LIBRARY_ITEMTYPE_DEFAULTS)
+            itemtype = self.get_purchase_itemtype(self.printing)
 
             existing = self.product.item_set.filter(type__shipping=True)
 
@@ -445,6 +814,50 @@ class ZotItem(ProductBase):
                 self.amount = 0
                 return self.update_or_create_purchase_item(amount_changed=amount_changed)
 
+    @classmethod
+    def bulk_update_or_create_purchase_items(cls, zotitems, amount_changed):
+        """
+        Batch version of update_or_create_purchase_item. amount_changed is a dict by slug.
+        Existing items are only saved if they differ.
+        """
+        existing = {}
+        for item in Item.objects.filter(product__in=[zotitem.product_id for zotitem in zotitems], type__shipping=True):
+            existing.setdefault(item.product_id, item)
+
+        itemtypes = {}
+        new, removed = [], []
+        for zotitem in zotitems:
+            item = existing.get(zotitem.product_id)
+            if zotitem.amount is None:
+                if item:
+                    removed.append(zotitem)
+                continue
+
+            if zotitem.printing not in itemtypes:
+                itemtypes[zotitem.printing] = cls.get_purchase_itemtype(zotitem.printing)
+
+            # Only overwrite amount if changed
+            amount = zotitem.amount
+            if item and not amount_changed[zotitem.slug]:
+                amount = item.amount
+
+            values = {'type_id': itemtypes[zotitem.printing].pk, '_price': zotitem.price, 'amount': amount}
+            if item is None:
+                new.append(Item(product_id=zotitem.product_id, **values))
+            elif any(getattr(item, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(item, field, value)
+                item.save()
+        Item.objects.bulk_create(new)
+
+        if removed:  # Delete purchase items
+            products = [zotitem.product_id for zotitem in removed]
+            try:
+                Item.objects.filter(product__in=products, type__shipping=True).delete()
+            except models.ProtectedError:
+                for zotitem in removed:
+                    zotitem.update_or_create_purchase_item(amount_changed=amount_changed[zotitem.slug])
+
     def __str__(self):
         return '%s (%s)' % (self.title, ', '.join([author.__str__() for author in self.authors.all()]))
 
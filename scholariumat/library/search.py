@@ -0,0 +1,82 @@
+"""
+Full-text search of the library catalogue.
+
+On PostgreSQL, ZotItem.search_vector holds a GIN indexed tsvector of the title and search_text, using the text search
+configuration german_unaccent (German stemming after removing accents and umlauts, see migration 0010).
+Other databases, like SQLite in tests, fall back to prefix matching of normalized and lightly stemmed terms in
+search_text, which is maintained for every item.
+"""
+import re
+import unicodedata
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Q, Value, FloatField
+
+
+SEARCH_CONFIG = 'german_unaccent'
+
+GERMAN_SUFFIXES = ['ern', 'em', 'en', 'er', 'es', 'e', 'n', 's']
+
+
+def normalize(text):
+    """Lowercases text and removes accents and umlauts."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(character for character in text if not unicodedata.combining(character))
+
+
+def get_terms(text):
+    return re.findall(r'\w+', normalize(text))
+
+
+def stem(term):
+    """Strips common German inflection suffixes, keeping at least three characters."""
+    for suffix in GERMAN_SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            return term[:-len(suffix)]
+    return term
+
+
+def get_search_text(title, authors=(), published=None):
+    """Normalized terms of title, author names and year of publication, separated and enclosed by spaces."""
+    terms = get_terms(' '.join([title] + list(authors) + ([str(published.year)] if published else [])))
+    return f' {" ".join(terms)} '
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def get_search_vector():
+    return (SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('search_text', weight='B', config=SEARCH_CONFIG))
+
+
+class PrefixSearchQuery(SearchQuery):
+    """Matches all terms of the search as prefixes, e.g. 'wirt' finds 'Wirtschaft'."""
+
+    def __init__(self, value, **kwargs):
+        super().__init__(' & '.join(f'{term}:*' for term in get_terms(value)), **kwargs)
+
+    def as_sql(self, compiler, connection):
+        sql, params = super().as_sql(compiler, connection)
+        return sql.replace('plainto_tsquery', 'to_tsquery'), params
+
+
+def search(queryset, text):
+    """
+    Filters a ZotItem queryset by the search text, annotating the relevance as rank.
+    Returns an empty queryset if the text contains no terms.
+    """
+    terms = get_terms(text)
+    if not terms:
+        return queryset.none()
+
+    if is_supported():
+        query = PrefixSearchQuery(text, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query))
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(search_text__contains=f' {stem(term)}')
+    return queryset.filter(condition).annotate(rank=Value(0, output_field=FloatField()))
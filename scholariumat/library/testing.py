@@ -0,0 +1,260 @@
+"""
+Local stand-in for the Zotero Web API, serving synthetic libraries of configurable size.
+
+FakeZoteroAPI is a WSGI app. Within fake_zotero(library), all requests to the Zotero API made through requests
+(including pyzotero and ZoteroFetcher) are answered by it in-process, no network access is needed.
+"""
+import io
+import json
+import threading
+from contextlib import contextmanager
+from unittest import mock
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from django.conf import settings
+
+
+API_URL = 'https://api.zotero.org'
+
+
+class FakeLibrary(object):
+    """
+    Synthetic Zotero library with nested collections, items and their attachments and notes.
+    Items share authors, some are owned, printed or excluded by tags and some have prices in their extra field.
+    change() and delete() create new library versions to test incremental synchronisation.
+    """
+
+    def __init__(self, items=1000, collections=10, children=2, user_id='benchmark', library_type='user'):
+        self.user_id = user_id
+        self.library_type = library_type
+        self.version = 1
+        self.collections = {}
+        self.items = {}
+        self.children = {}
+        self.deleted = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+        collection_keys = [f'C{i:07X}' for i in range(collections)]
+        for i, key in enumerate(collection_keys):
+            parent = collection_keys[(i - 1) // 3] if i else False
+            self.collections[key] = self.get_object(key, {'name': f'Collection {i}', 'parentCollection': parent})
+
+        authors = max(items // 10, 1)
+        for i in range(items):
+            key = f'I{i:07X}'
+            tags = []
+            if i % 2 == 0:
+                tags.append(settings.ZOTERO_OWNER_TAGS[0])
+            if i % 7 == 0:
+                tags.append(settings.ZOTERO_PRINTING_TAG)
+            if i % 11 == 0:
+                tags.append(settings.ZOTERO_EXCLUDED_TAGS[0])
+            creators = [{'creatorType': 'author', 'firstName': f'First{i % authors}', 'lastName': f'Last{i % authors}'}]
+            if i % 3 == 0:
+                creators.append({'creatorType': 'editor', 'name': f'Editor{(i + 1) % authors}'})
+            item_collections = [collection_keys[i % collections]]
+            if i % 10 == 0 and collections > 1:
+                item_collections.append(collection_keys[(i + 1) % collections])
+
+            self.items[key] = self.get_object(key, {
+                'itemType': settings.ZOTERO_ITEM_TYPES[i % len(settings.ZOTERO_ITEM_TYPES)],
+                'title': f'Item {i}',
+                'date': f'{1900 + i % 120}-01-01',
+                'creators': creators,
+                'tags': [{'tag': tag} for tag in tags],
+                'extra': '{price: 20}{price_digital: 8}' if i % 5 == 0 else '',
+                'collections': item_collections,
+            })
+
+            self.children[key] = []
+            for j in range(children):
+                child_key = f'{"AN"[j % 2]}{i:06X}{j % 16:X}'
+                if j % 2:
+                    data = {'itemType': 'note', 'note': f'<p><strong>Yellow Annotations</strong></p><p>{i}</p>'}
+                else:
+                    data = {'itemType': 'attachment', 'filename': f'item{i}.pdf', 'contentType': 'application/pdf'}
+                data.update({'parentItem': key, 'tags': []})
+                self.items[child_key] = self.get_object(child_key, data)
+                self.children[key].append(child_key)
+
+    def get_object(self, key, data):
+        data.update({'key': key, 'version': self.version})
+        return {
+            'key': key,
+            'version': self.version,
+            'library': {'type': self.library_type, 'id': self.user_id},
+            'data': data,
+        }
+
+    def get_parent_keys(self):
+        return list(self.children)
+
+    def update_object(self, obj):
+        obj['version'] = obj['data']['version'] = self.version
+
+    def change(self, count):
+        """Changes the title of the first count items. Returns the new library version."""
+        self.version += 1
+        for key in self.get_parent_keys()[:count]:
+            self.items[key]['data']['title'] += ' (revised)'
+            self.update_object(self.items[key])
+        return self.version
+
+    def delete(self, count):
+        """Deletes the last count items with their attachments and notes. Returns the new library version."""
+        self.version += 1
+        for key in self.get_parent_keys()[-count:] if count else []:
+            for child_key in self.children.pop(key) + [key]:
+                del self.items[child_key]
+                self.deleted[child_key] = self.version
+        return self.version
+
+    def cached(self, name, function):
+        """Results are computed once per library version."""
+        with self._lock:
+            if self._cache.get('version') != self.version:
+                self._cache = {'version': self.version}
+            if name not in self._cache:
+                self._cache[name] = function()
+            return self._cache[name]
+
+    def get_collections(self):
+        return list(self.collections.values())
+
+    def get_collection_items(self, key):
+        """All items in a collection followed by their attachments and notes. None if the collection is unknown."""
+        def index():
+            collection_items = {collection: [] for collection in self.collections}
+            for parent in self.get_parent_keys():
+                for collection in self.items[parent]['data']['collections']:
+                    collection_items[collection].append(self.items[parent])
+            for collection, parents in collection_items.items():
+                parents += [self.items[child] for parent in parents for child in self.children[parent['key']]]
+            return collection_items
+        return self.cached('collections', index).get(key)
+
+    def get_items(self, since=0):
+        return self.cached(f'items {since}', lambda: [
+            item for item in self.items.values() if item['version'] > since])
+
+    def get_deleted(self, since=0):
+        return [key for key, version in self.deleted.items() if version > since]
+
+
+class FakeZoteroAPI(object):
+    """WSGI app answering the read requests of the Zotero Web API used by the library app."""
+
+    default_limit = 25
+    max_limit = 100
+
+    def __init__(self, library):
+        self.library = library
+
+    def __call__(self, environ, start_response):
+        params = {key: values[0] for key, values in parse_qs(environ.get('QUERY_STRING', '')).items()}
+        prefix = f'/{self.library.library_type}s/{self.library.user_id}/'
+        path = environ['PATH_INFO']
+        route = path[len(prefix):].strip('/').split('/') if path.startswith(prefix) else []
+        since = int(params.get('since', 0))
+
+        if route == ['collections']:
+            results = self.library.get_collections()
+        elif len(route) == 3 and route[0] == 'collections' and route[2] == 'items':
+            results = self.library.get_collection_items(route[1])
+        elif route == ['items']:
+            results = self.library.get_items(since)
+        elif len(route) == 2 and route[0] == 'items' and route[1] in self.library.items:
+            return self.respond(start_response, self.library.items[route[1]])
+        elif route == ['deleted']:
+            return self.respond(start_response, {
+                'collections': [], 'searches': [], 'items': self.library.get_deleted(since), 'tags': [],
+                'settings': []})
+        else:
+            results = None
+
+        if results is None:
+            return self.respond(start_response, 'Not found', status='404 Not Found')
+
+        # Paginate like the API, with Link headers pointing to the next page
+        start = int(params.get('start', 0))
+        limit = min(int(params.get('limit') or self.default_limit), self.max_limit)
+        headers = [('Total-Results', str(len(results)))]
+        if start + limit < len(results):
+            host = environ.get('HTTP_HOST', environ.get('SERVER_NAME', ''))
+            query = urlencode(dict(params, start=start + limit, limit=limit))
+            headers.append(('Link', f'<{environ["wsgi.url_scheme"]}://{host}{path}?{query}>; rel="next"'))
+        return self.respond(start_response, results[start:start + limit], headers=headers)
+
+    def respond(self, start_response, content, status='200 OK', headers=()):
+        body = json.dumps(content).encode('utf-8')
+        start_response(status, [
+            ('Content-Type', 'application/json'),
+            ('Last-Modified-Version', str(self.library.version)),
+            ('Content-Length', str(len(body))),
+        ] + list(headers))
+        return [body]
+
+
+class WSGIAdapter(BaseAdapter):
+    """Transport adapter for requests passing requests to a WSGI app instead of the network."""
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': url.hostname,
+            'SERVER_PORT': str(url.port or 443),
+            'HTTP_HOST': url.netloc,
+            'wsgi.url_scheme': url.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'CONTENT_LENGTH': str(len(body)),
+        }
+        for header, value in request.headers.items():
+            environ[f'HTTP_{header.upper().replace("-", "_")}'] = value
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = status, headers
+
+        content = b''.join(self.app(environ, start_response))
+
+        response = requests.Response()
+        response.status_code = int(started['status'].split()[0])
+        response.reason = started['status'].split(' ', 1)[-1]
+        response.headers = CaseInsensitiveDict(started['headers'])
+        response._content = content
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def fake_zotero(library):
+    """Answers all requests to the Zotero API with FakeZoteroAPI serving the given library."""
+    adapter = WSGIAdapter(FakeZoteroAPI(library))
+    get_adapter = requests.Session.get_adapter
+
+    def get_fake_adapter(session, url):
+        return adapter if url.startswith(API_URL) else get_adapter(session, url)
+
+    with mock.patch.object(requests.Session, 'get_adapter', get_fake_adapter):
+        yield library
@@ -1,24 +1,36 @@
+import tempfile
 from unittest import mock
 from datetime import date
 from pyzotero.zotero_errors import ResourceNotFound
 
-from django.test import TestCase
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
+from django.urls import reverse
 
-from library.models import Collection, ZotItem, ZotAttachment
+from library.models import Collection, ZotItem, ZotAttachment, LibraryVersion, Author
+from library.utils import ZoteroFetcher
+from library.testing import FakeLibrary, fake_zotero
 from products.models import ItemType, AttachmentType, Purchase, Item, Product
 from users.models import Profile
 
 
 class AttachmentTest(TestCase):
     def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
         self.mock_settings = {
             'ZOTERO_USER_ID': '',
             'ZOTERO_API_KEY': '',
-            'ZOTERO_LIBRARY_TYPE': ''
+            'ZOTERO_LIBRARY_TYPE': '',
+            'MEDIA_ROOT': self.media_root.name
         }
 
+    def tearDown(self):
+        self.media_root.cleanup()
+
     def test_pdf_generation(self):
         product = ZotItem.objects.create(title='testtitle', slug='testkey')
         type = ItemType.objects.create(title='typetitle')
@@ -34,6 +46,34 @@ class AttachmentTest(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
+    def test_pdf_cache(self):
+        product = ZotItem.objects.create(title='testtitle', slug='testkey')
+        attachment_type = AttachmentType.objects.create(title='PDF', slug='pdf')
+        attachment = ZotAttachment.objects.create(key='foo', format='note', type=attachment_type, zotitem=product)
+        attachment.update_or_create_item()
+
+        zotero = mock.MagicMock()
+        zotero().item.return_value = {'data': {'key': 'foo', 'note': 'testtext', 'version': 1}}
+        zotero().items.return_value = [{'data': {'key': 'foo', 'note': 'changed', 'version': 2}}]
+        with mock.patch('pyzotero.zotero.Zotero', zotero), self.settings(**self.mock_settings):
+            attachment.get()
+            attachment.get()
+            self.assertEqual(zotero().item.call_count, 1)  # Second download from cache
+            first_pdf = attachment.pdf.name
+
+            # Changed note gets rendered again
+            note = {'key': 'foo', 'itemType': 'note', 'parentItem': 'testkey', 'version': 2,
+                    'note': '<p><strong>Yellow Annotations</strong></p>'}
+            attachment = ZotAttachment.update_or_create_from_data(note)
+            self.assertFalse(attachment.rendered)
+            ZotAttachment.render_notes()
+            attachment.refresh_from_db()
+            self.assertTrue(attachment.rendered)
+            self.assertEqual(attachment.pdf_version, 2)
+            self.assertFalse(attachment.pdf.storage.exists(first_pdf))
+            ZotAttachment.render_notes()
+            zotero().items.assert_called_once()
+
 
 class ImportTest(TestCase):
     def setUp(self):
@@ -200,3 +240,325 @@ class SyncTest(TestCase):
         with mock.patch('pyzotero.zotero.Zotero', self.zotero), self.settings(**self.mock_settings):
             self.collection.sync()
         self.assertFalse(Collection.objects.all())
+
+
+class IncrementalSyncTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_settings = {
+            'ZOTERO_USER_ID': 'testuser',
+            'ZOTERO_API_KEY': '',
+            'ZOTERO_LIBRARY_TYPE': ''
+        }
+
+    def setUp(self):
+        self.zotero = mock.MagicMock()
+        self.zotero().request.headers = {'last-modified-version': 10}
+        self.zotero().deleted.return_value = {'items': []}
+        self.item = {'data': {'key': 'testkey',
+                              'itemType': settings.ZOTERO_ITEM_TYPES[0],
+                              'title': 'test book',
+                              'date': '2018-01-01',
+                              'tags': [{'tag': settings.ZOTERO_OWNER_TAGS[0]}],
+                              'creators': [],
+                              'collections': ['testcollection'],
+                              'extra': ''}}
+        self.zotero().everything.return_value = [self.item]
+        self.collection = Collection.objects.create(title='test collection', slug='testcollection')
+
+    def sync_changes(self):
+        with mock.patch('pyzotero.zotero.Zotero', self.zotero), self.settings(**self.mock_settings):
+            return Collection.sync_changes()
+
+    def test_without_version(self):
+        self.assertFalse(self.sync_changes())
+
+    def test_unchanged(self):
+        LibraryVersion.objects.create(library='testuser', version=10)
+        self.assertTrue(self.sync_changes())
+        self.zotero().everything.assert_not_called()
+        self.assertFalse(ZotItem.objects.exists())
+
+    def test_changes(self):
+        LibraryVersion.objects.create(library='testuser', version=5)
+        self.assertTrue(self.sync_changes())
+        self.assertEqual(LibraryVersion.objects.get(library='testuser').version, 10)
+        self.assertTrue(self.collection.zotitem_set.filter(slug='testkey').exists())
+
+        # Test if deleted items get removed
+        self.zotero().request.headers = {'last-modified-version': 11}
+        self.zotero().everything.return_value = []
+        self.zotero().deleted.return_value = {'items': ['testkey']}
+        self.sync_changes()
+        ZotItem.remove_deleted()
+        self.assertFalse(ZotItem.objects.exists())
+
+
+class BulkSyncTest(TestCase):
+    def get_data(self, key, **kwargs):
+        data = {'key': key,
+                'itemType': settings.ZOTERO_ITEM_TYPES[0],
+                'title': f'book {key}',
+                'date': '2018-01-01',
+                'tags': [{'tag': settings.ZOTERO_OWNER_TAGS[0]}],
+                'creators': [{'firstName': 'John', 'lastName': f'Smith {key}'}, {'name': 'Jane Doe'}],
+                'extra': '{price: 12}'}
+        data.update(kwargs)
+        return data
+
+    def test_same_result(self):
+        ZotItem.update_or_create_from_data(self.get_data('single'))
+        ZotItem.bulk_update_or_create_from_data([self.get_data('bulk')])
+        single, bulk = ZotItem.objects.get(slug='single'), ZotItem.objects.get(slug='bulk')
+
+        self.assertEqual(bulk.published, single.published)
+        self.assertEqual((bulk.amount, bulk.price), (single.amount, single.price))
+        self.assertEqual(bulk.authors.count(), 2)
+        self.assertEqual(Author.objects.filter(name='Jane Doe').count(), 1)
+        item = bulk.product.item_set.get()
+        self.assertEqual((item.amount, item.get_price(), item.type), (1, 12, single.product.item_set.get().type))
+
+    def test_update(self):
+        ZotItem.bulk_update_or_create_from_data([self.get_data('testkey')])
+        item = ZotItem.objects.get(slug='testkey').product.item_set.get()
+        item.amount = 0  # Sold
+        item.save()
+
+        data = self.get_data('testkey', creators=[{'name': 'Jane Doe'}], extra='{price: 15}')
+        ZotItem.bulk_update_or_create_from_data([data])
+        zotitem = ZotItem.objects.get(slug='testkey')
+        self.assertEqual([author.name for author in zotitem.authors.all()], ['Jane Doe'])
+        item.refresh_from_db()
+        self.assertEqual((item.amount, item._price), (0, 15))  # Amount unchanged
+
+        ZotItem.bulk_update_or_create_from_data([self.get_data('testkey', extra='{amount: 3}')])
+        item.refresh_from_db()
+        self.assertEqual(item.amount, 3)
+
+    @skipUnlessDBFeature('can_return_ids_from_bulk_insert')  # Products are created one by one otherwise
+    def test_constant_queries(self):
+        def count_queries(keys):
+            with CaptureQueriesContext(connection) as queries:
+                ZotItem.bulk_update_or_create_from_data([self.get_data(key) for key in keys])
+            return len(queries)
+
+        ZotItem.bulk_update_or_create_from_data([self.get_data('warmup')])  # Create item type
+        self.assertEqual(count_queries(['a', 'b']), count_queries(['c', 'd', 'e', 'f']))
+        # Unchanged items are not written
+        self.assertLess(count_queries(['a', 'b']), count_queries(['g', 'h']))
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        ZotItem.bulk_update_or_create_from_data([
+            {'key': 'A', 'title': 'Grundsätze der Volkswirtschaftslehre', 'date': '1871',
+             'creators': [{'firstName': 'Carl', 'lastName': 'Menger'}], 'tags': []},
+            {'key': 'B', 'title': 'Nationalökonomie', 'date': '1940',
+             'creators': [{'firstName': 'Ludwig', 'lastName': 'von Mises'}], 'tags': []},
+            {'key': 'C', 'title': 'Theorie des Geldes und der Umlaufsmittel', 'date': '1912',
+             'creators': [{'firstName': 'Ludwig', 'lastName': 'von Mises'}], 'tags': []},
+        ])
+
+    def get_slugs(self, text):
+        return set(ZotItem.search(text).values_list('slug', flat=True))
+
+    def test_search(self):
+        self.assertEqual(self.get_slugs('grundsatze'), {'A'})  # Umlauts are folded
+        self.assertEqual(self.get_slugs('Nationalök'), {'B'})  # Prefixes match
+        self.assertEqual(self.get_slugs('Geld'), {'C'})
+        self.assertEqual(self.get_slugs('mises'), {'B', 'C'})  # Authors are searched
+        self.assertEqual(self.get_slugs('Mises 1912'), {'C'})  # All terms have to match
+        self.assertEqual(self.get_slugs('?'), set())
+
+    def test_update(self):
+        ZotItem.bulk_update_or_create_from_data([{
+            'key': 'A', 'title': 'Grundsätze', 'date': '1871', 'tags': [],
+            'creators': [{'firstName': 'Friedrich', 'lastName': 'Hayek'}]}])
+        self.assertEqual(self.get_slugs('menger'), set())
+        self.assertEqual(self.get_slugs('hayek'), {'A'})
+
+        ZotItem.objects.update(search_text='')
+        ZotItem.update_search_index()
+        self.assertEqual(self.get_slugs('hayek'), {'A'})
+
+
+class CollectionTreeTest(TestCase):
+    def setUp(self):
+        self.root = Collection.objects.create(title='Root', slug='root')
+        self.child = Collection.objects.create(title='Child', slug='child', parent=self.root)
+        self.grandchild = Collection.objects.create(title='Grandchild', slug='grandchild', parent=self.child)
+        for i, collection in enumerate([self.root, self.child, self.grandchild, self.grandchild]):
+            collection.zotitem_set.add(ZotItem.objects.create(title=f'Book {i}', slug=f'book{i}'))
+
+    def test_tree(self):
+        self.assertEqual(self.grandchild.path, 'root/child/grandchild/')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.grandchild.get_parents(), [self.child, self.root])
+
+        Collection.update_counts()
+        counts = dict(Collection.objects.values_list('slug', 'num_items'))
+        self.assertEqual(counts, {'root': 4, 'child': 3, 'grandchild': 2})
+
+    def test_retrieve(self):
+        zotero = mock.MagicMock()
+        zotero().collections.return_value = [
+            {'data': {'key': 'root', 'name': 'Root', 'parentCollection': False}},
+            {'data': {'key': 'child', 'name': 'Child', 'parentCollection': 'root'}},
+            {'data': {'key': 'grandchild', 'name': 'Grandchild', 'parentCollection': 'root'}},
+        ]
+        mock_settings = {'ZOTERO_USER_ID': '', 'ZOTERO_API_KEY': '', 'ZOTERO_LIBRARY_TYPE': ''}
+        with mock.patch('pyzotero.zotero.Zotero', zotero), self.settings(**mock_settings):
+            Collection.retrieve()
+        self.assertEqual(Collection.objects.get(slug='grandchild').path, 'root/grandchild/')
+
+
+class DetailTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create(email='a.b@c.de')
+        Profile.objects.create(user=user)
+        self.client.force_login(user)
+        self.data = {'key': 'KEY', 'title': 'Book', 'ISBN': '123', 'tags': [], 'creators': []}
+        cache.clear()
+        self.zotero = mock.MagicMock()
+        self.mock_settings = {'ZOTERO_USER_ID': '', 'ZOTERO_API_KEY': '', 'ZOTERO_LIBRARY_TYPE': ''}
+
+    def get_api_object(self):
+        with mock.patch('pyzotero.zotero.Zotero', self.zotero), self.settings(**self.mock_settings):
+            response = self.client.get(reverse('library:zotitem', args=['KEY']))
+        return response.context['api_object']
+
+    def test_stored_data(self):
+        ZotItem.bulk_update_or_create_from_data([self.data])
+        self.assertEqual(self.get_api_object()['data']['ISBN'], '123')
+        self.zotero.assert_not_called()
+
+    def test_missing_data(self):
+        ZotItem.objects.create(title='Book', slug='KEY')
+        self.zotero().items.return_value = [{'data': self.data}]
+        self.assertEqual(self.get_api_object()['data']['title'], 'Book')  # Approximated from the item
+        self.assertEqual(ZotItem.objects.get(slug='KEY').api_object['data']['ISBN'], '123')  # Refreshed in a job
+
+
+class ListTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create(email='a.b@c.de')
+        Profile.objects.create(user=user)
+        self.client.force_login(user)
+        self.collection = Collection.objects.create(title='Collection', slug='collection')
+
+    def add_items(self, count):
+        start = ZotItem.objects.count()
+        data = [{'key': f'K{i}', 'title': f'Book {i}', 'date': '2000', 'tags': [{'tag': settings.ZOTERO_OWNER_TAGS[0]}],
+                 'creators': [{'name': f'Author {i}'}, {'name': 'Editor'}]} for i in range(start, start + count)]
+        self.collection.zotitem_set.add(*ZotItem.bulk_update_or_create_from_data(data))
+
+    def test_constant_queries(self):
+        url = reverse('library:collection', args=[self.collection.slug])
+        self.add_items(1)
+        self.client.get(url)  # Fill caches
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(url)
+
+        self.add_items(9)
+        with CaptureQueriesContext(connection) as page:
+            response = self.client.get(url, {'sort': 'author_sort', 'dir': 'asc'})
+        self.assertEqual(len(single), len(page))
+        self.assertEqual(
+            [zotitem.author_sort for zotitem in response.context['object_list']][:2],
+            ['Author 0, Editor', 'Author 1, Editor'])
+
+
+class FetcherTest(TestCase):
+    def setUp(self):
+        self.mock_settings = {
+            'ZOTERO_USER_ID': 'testuser',
+            'ZOTERO_API_KEY': '',
+            'ZOTERO_LIBRARY_TYPE': 'user'
+        }
+
+    def get_response(self, status_code=200, items=None, headers=None):
+        response = mock.MagicMock(status_code=status_code, headers=headers or {})
+        response.json.return_value = items or []
+        return response
+
+    def fetch(self, keys, responses):
+        with mock.patch('requests.Session.get', side_effect=responses) as get, self.settings(**self.mock_settings):
+            fetcher = ZoteroFetcher(workers=1)
+            fetcher.page_size = 2
+            return dict(fetcher.collection_items(keys)), get
+
+    def test_pagination(self):
+        items = [{'data': {'key': str(i)}} for i in range(3)]
+        headers = {'Total-Results': '3'}
+        result, get = self.fetch(['testkey'], [
+            self.get_response(items=items[:2], headers=headers), self.get_response(items=items[2:], headers=headers)])
+        self.assertEqual(result, {'testkey': items})
+        self.assertEqual(get.call_args[1]['params']['start'], 2)
+
+    def test_retry(self):
+        limited = self.get_response(status_code=429, headers={'Retry-After': '0'})
+        result, get = self.fetch(['testkey'], [
+            limited,
+            self.get_response(items=[{'data': {'key': 'a'}}], headers={'Total-Results': '1', 'Backoff': '0'})])
+        self.assertEqual(len(result['testkey']), 1)
+        self.assertEqual(get.call_count, 2)
+        limited.close.assert_called_once()  # Connection released before retrying
+
+    def test_missing_collection(self):
+        result, get = self.fetch(['testkey'], [self.get_response(status_code=404)])
+        self.assertEqual(result, {'testkey': None})
+
+    def test_sync_all(self):
+        collection = Collection.objects.create(title='test collection', slug='testkey')
+        missing = Collection.objects.create(title='missing collection', slug='missing')
+        item = {'data': {'key': 'itemkey',
+                         'itemType': settings.ZOTERO_ITEM_TYPES[0],
+                         'title': 'test book',
+                         'tags': [],
+                         'extra': ''}}
+        zotero = mock.MagicMock()
+        zotero().last_modified_version.return_value = 10
+        downloads = [('testkey', [item]), ('missing', None)]
+        with mock.patch('pyzotero.zotero.Zotero', zotero), \
+                mock.patch.object(ZoteroFetcher, 'collection_items', return_value=downloads), \
+                self.settings(**self.mock_settings):
+            Collection.sync_all()
+
+        self.assertTrue(collection.zotitem_set.filter(slug='itemkey').exists())
+        self.assertFalse(Collection.objects.filter(pk=missing.pk).exists())
+        self.assertEqual(LibraryVersion.objects.get(library='testuser').version, 10)
+
+
+class FakeZoteroTest(TestCase):
+    def setUp(self):
+        self.library = FakeLibrary(items=30, collections=4)
+        self.mock_settings = {
+            'ZOTERO_USER_ID': self.library.user_id,
+            'ZOTERO_API_KEY': '',
+            'ZOTERO_LIBRARY_TYPE': self.library.library_type
+        }
+
+    def sync(self, full=False):
+        with fake_zotero(self.library), self.settings(**self.mock_settings):
+            Collection.retrieve()
+            if full:
+                Collection.sync_all()
+            else:
+                Collection.sync_changes()
+            ZotItem.remove_deleted()
+
+    def test_sync(self):
+        self.sync(full=True)
+        self.assertEqual(Collection.objects.count(), 4)
+        self.assertEqual(Collection.objects.get(slug='C0000001').parent.slug, 'C0000000')
+        self.assertEqual(ZotItem.objects.count(), 30)
+        self.assertEqual(ZotAttachment.objects.filter(format='file').count(), 30)
+        self.assertEqual(ZotAttachment.objects.filter(format='note').count(), 30)
+
+        self.library.change(2)
+        self.library.delete(3)
+        self.sync()
+        self.assertEqual(ZotItem.objects.count(), 27)
+        self.assertEqual(ZotAttachment.objects.count(), 54)
+        self.assertEqual(ZotItem.objects.get(slug='I0000001').title, 'Item 1 (revised)')
+        self.assertEqual(LibraryVersion.objects.get(library=self.library.user_id).version, self.library.version)
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from pyzotero.zotero_errors import ResourceNotFound
+
+from django.conf import settings
+
+from products.utils import DOWNLOAD_CHUNK_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+
+class ZoteroFetcher(object):
+    """
+    Downloads the items of many Zotero collections concurrently with a bounded thread pool.
+    All threads share one HTTP session and one backoff timer, so Backoff and Retry-After headers of the Zotero API
+    pause every request. Only downloading happens in the threads, results are yielded to the caller as soon as a
+    collection is complete, which saves them while the remaining collections are still being downloaded.
+    """
+    url = 'https://api.zotero.org'
+    page_size = 100
+    max_retries = 5
+    timeout = 60
+
+    def __init__(self, workers=None):
+        self.workers = workers or settings.ZOTERO_FETCH_WORKERS
+        self.library = f'/{settings.ZOTERO_LIBRARY_TYPE}s/{settings.ZOTERO_USER_ID}'
+        self.session = requests.Session()
+        self.session.headers['Zotero-API-Version'] = '3'
+        if settings.ZOTERO_API_KEY:
+            self.session.headers['Authorization'] = f'Bearer {settings.ZOTERO_API_KEY}'
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=self.workers))
+        self._lock = threading.Lock()
+        self._paused_until = 0
+
+    def pause(self, seconds):
+        """Delays all following requests of all threads."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def wait(self):
+        with self._lock:
+            delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def get_seconds(response, header, default=0):
+        try:
+            return float(response.headers.get(header, default))
+        except ValueError:
+            return default
+
+    def get(self, path, headers=None, stream=False, **params):
+        """Requests an API path, retrying while the API is overloaded."""
+        for attempt in range(self.max_retries + 1):
+            self.wait()
+            response = self.session.get(
+                f'{self.url}{path}', params=params, headers=headers, stream=stream, timeout=self.timeout)
+            self.pause(self.get_seconds(response, 'Backoff'))
+            if response.status_code not in (429, 503) or attempt == self.max_retries:
+                break
+            logger.warning(f'Zotero: Rate limited at {path}, retrying.')
+            response.close()  # Returns the connection of streamed responses to the pool
+            self.pause(self.get_seconds(response, 'Retry-After', default=2 ** attempt))
+
+        if response.status_code == 404:
+            response.close()
+            raise ResourceNotFound(f'Zotero: {path} not found.')
+        if response.status_code != 416:  # Unsatisfiable ranges are passed on
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+        return response
+
+    def get_file(self, key, range_header=None):
+        """Returns the unread response of an attachment file, optionally only the requested byte range."""
+        headers = {'Accept-Encoding': 'identity'}  # Keep Content-Length valid for the streamed bytes
+        if range_header:
+            headers['Range'] = range_header
+        return self.get(f'{self.library}/items/{key}/file', headers=headers, stream=True)
+
+    @staticmethod
+    def iter_file(response):
+        """Yields the content of a streamed response in chunks, closing the connection afterwards."""
+        try:
+            yield from response.iter_content(DOWNLOAD_CHUNK_SIZE)
+        finally:
+            response.close()
+
+    def get_collection_items(self, key):
+        """Returns all items of a collection or None if the collection does not exist."""
+        path = f'{self.library}/collections/{key}/items'
+        items, total = [], None
+        try:
+            while total is None or len(items) < total:
+                response = self.get(path, format='json', limit=self.page_size, start=len(items))
+                page = response.json()
+                if not page:
+                    break
+                items += page
+                total = int(response.headers.get('Total-Results', len(items)))
+        except ResourceNotFound:
+            return None
+        return items
+
+    def collection_items(self, keys):
+        """Yields tuples of collection key and items in the order the downloads finish."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.get_collection_items, key): key for key in keys}
+            for future in as_completed(futures):
+                yield futures.pop(future), future.result()
@@ -1,9 +1,7 @@
-from django.db.models import Q
-from django.conf import settings
+from django.db.models import F
 
 from vanilla import ListView, DetailView
 from braces.views import LoginRequiredMixin
-from pyzotero import zotero
 
 from .models import ZotItem, Collection
 from framework.views import CompatibleOrderableListMixin
@@ -13,7 +11,7 @@ from products.views import PurchaseMixin, DownloadMixin
 class ZotItemListView(LoginRequiredMixin, CompatibleOrderableListMixin, ListView):
     model = ZotItem
     paginate_by = 10
-    orderable_columns = ['title', 'published', 'authors']
+    orderable_columns = ['title', 'published', 'author_sort']
     orderable_columns_default = 'published'
     ordering_default = 'desc'
 
@@ -35,13 +33,14 @@ class ZotItemListView(LoginRequiredMixin, CompatibleOrderableListMixin, ListView
     def get_queryset(self):
         search = self.request.GET.get('search')
         if search:
-            items = ZotItem.objects.filter(Q(title__icontains=search) | Q(authors__name__icontains=search))
-            items = items.distinct()
+            items = ZotItem.search(search)
+            if self.order_by_param not in self.request.GET:  # Most relevant first
+                return ZotItem.prefetch_list(items.order_by('-rank', F('published').desc(nulls_last=True)))
         else:
             # Only filter for collection if no search
             items = ZotItem.objects.filter(collection=self.collection)
 
-        return self.get_ordered_queryset(queryset=items)
+        return ZotItem.prefetch_list(self.get_ordered_queryset(queryset=items))
 
 
 class ZotItemDetailView(LoginRequiredMixin, PurchaseMixin, DownloadMixin, DetailView):
@@ -50,6 +49,6 @@ class ZotItemDetailView(LoginRequiredMixin, PurchaseMixin, DownloadMixin, Detail
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        zot = zotero.Zotero(settings.ZOTERO_USER_ID, settings.ZOTERO_LIBRARY_TYPE, settings.ZOTERO_API_KEY)
-        context['api_object'] = zot.item(self.object.slug)
+        context['api_object'] = self.object.api_object
+        self.object.request_api_data()
         return context
@@ -1,3 +1,5 @@
+from operator import attrgetter
+
 from django.contrib import admin
 from django.urls import reverse
 
@@ -18,13 +20,26 @@ class ProductBaseAdmin(admin.ModelAdmin):
         return super().change_view(request, object_id, form_url='', extra_context=extra_context)
 
 
+class ProductTypeAdminMixin:
+    """Loads the product objects of all products in the changelist with one query per kind."""
+
+    product_path = 'product'
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        get_product = attrgetter(self.product_path) if self.product_path else lambda obj: obj
+        Product.prefetch_types(get_product(obj) for obj in changelist.result_list)
+        return changelist
+
+
 class ItemInline(admin.TabularInline):
     model = Item
     raw_id_fields = ['files']
     show_change_link = True
 
 
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ProductTypeAdminMixin, admin.ModelAdmin):
+    product_path = None
     inlines = [ItemInline]
     search_fields = [
         'event__title',
@@ -45,7 +60,8 @@ class ProductAdmin(admin.ModelAdmin):
         return [f'{related.name}__title' for related in self.model._meta.get_fields() if related.one_to_one]
 
 
-class PurchaseAdmin(admin.ModelAdmin):
+class PurchaseAdmin(ProductTypeAdminMixin, admin.ModelAdmin):
+    product_path = 'item.product'
     search_fields = [
         'item__title',
         'item__type__title',
@@ -58,6 +74,7 @@ class PurchaseAdmin(admin.ModelAdmin):
     ]
     list_filter = ['executed']
     list_display = ['item', 'product', 'profile', 'amount', 'date', 'executed', 'shipped']
+    list_select_related = ['item__type', 'item__product', 'profile']
     raw_id_fields = ['profile', 'item']
     readonly_fields = ['executed']
 
@@ -65,7 +82,7 @@ class PurchaseAdmin(admin.ModelAdmin):
         return obj.item.product
 
 
-class ItemAdmin(admin.ModelAdmin):
+class ItemAdmin(ProductTypeAdminMixin, admin.ModelAdmin):
     search_fields = [
         'title',
         'product__event__title',
@@ -73,6 +90,7 @@ class ItemAdmin(admin.ModelAdmin):
         'product__studyproduct__title']
     raw_id_fields = ['product', 'files']
     list_display = ['__str__', 'title', 'type', '_price', 'product']
+    list_select_related = ['type', 'product']
 
 
 class AttachmentAdmin(admin.ModelAdmin):
@@ -7,9 +7,9 @@ from django.db import models
 from django.conf import settings
 from django_extensions.db.models import TimeStampedModel, TitleSlugDescriptionModel
 from django.urls import reverse_lazy
-from django.core.mail import mail_managers
 
 from framework.behaviours import CommentAble, PermalinkAble
+from framework.models import Job
 from .utils import SofortPayment
 
 
@@ -27,7 +27,7 @@ class ProductBase(TitleSlugDescriptionModel, TimeStampedModel, PermalinkAble):
     def save(self, *args, **kwargs):
         if not self.product:
             from .models import Product
-            self.product = Product.objects.create()
+            self.product = Product.objects.create(kind=self._meta.model_name)
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):  # TODO: Gets ignored in bulk delete. pre_delete signal better?
@@ -49,6 +49,11 @@ class ProductContent(models.Model):
     def is_accessible(self, user):
         return self.items.intersection(user.profile.items_bought).exists()
 
+    def is_included(self, items):
+        """Returns if any of the given items of the product includes the content, using prefetched types."""
+        types = {item_type.pk for item_type in self.type.included_in.all()}
+        return any(item.type_id in types for item in items)
+
     class Meta:
         abstract = True
 
@@ -59,7 +64,11 @@ class AttachmentBase(models.Model):
     type = models.ForeignKey('products.AttachmentType', on_delete=models.PROTECT)
     item = models.ForeignKey('products.Item', on_delete=models.CASCADE, null=True, blank=True)
 
-    def get(self):
+    def get(self, range_header=None, redirect=False):
+        """
+        Returns a response streaming the attachment, optionally only the requested byte range.
+        With redirect, attachments in storage may be downloaded directly from a signed URL instead.
+        """
         pass
 
     def __str__(self):
@@ -77,11 +86,13 @@ class BalanceMixin(models.Model):
     balance = models.SmallIntegerField('Guthaben', default=0)
 
     def spend(self, amount):
-        """Given an amount, tries to spend from current balance."""
-        new_balance = self.balance - amount
-        if new_balance >= 0:
-            self.balance = new_balance
-            self.save()
+        """
+        Given an amount, tries to spend from current balance.
+        The balance is checked and lowered in a single conditional update, so concurrent spending can't overdraw it.
+        """
+        spent = type(self).objects.filter(pk=self.pk, balance__gte=amount).update(balance=models.F('balance') - amount)
+        self.reload_balance()
+        if spent:
             return True
         else:
             logger.debug('{} tried to spend {} but only owns {}'.format(self, amount, self.balance))
@@ -89,8 +100,11 @@ class BalanceMixin(models.Model):
 
     def refill(self, amount):
         """Refills balance."""
-        self.balance += amount
-        self.save()
+        type(self).objects.filter(pk=self.pk).update(balance=models.F('balance') + amount)
+        self.reload_balance()
+
+    def reload_balance(self):
+        self.balance = type(self).objects.values_list('balance', flat=True).get(pk=self.pk)
 
     class Meta:
         abstract = True
@@ -298,7 +312,8 @@ class PayAble(CommentAble):
                 logger.debug("Payment {} executed successfully".format(self.slug))
                 self.executed = True
                 self.save()
-                mail_managers(
+                Job.enqueue(
+                    'django.core.mail.mail_managers',
                     f'Neue Zahlung: {self.amount}€',
                     f'Nutzer {self.profile} hat {self.amount} Euro per {self.method} gezahlt. ')
                 return True
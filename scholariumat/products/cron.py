@@ -0,0 +1,19 @@
+import logging
+
+from django_cron import CronJobBase, Schedule
+
+from .models import Item
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResolveRequests(CronJobBase):
+    RUN_EVERY_MINS = 5
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'Item request resolution Cronjob'
+
+    def do(self):
+        logger.debug('Resolving item requests...')
+        Item.resolve_pending_requests()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Sets the kind of all products created before it was stored'
+
+    def handle(self, *args, **options):
+        updated = Product.backfill_kinds()
+        self.stdout.write(self.style.SUCCESS(f'Set kind of {updated} products.'))
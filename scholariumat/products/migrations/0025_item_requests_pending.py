@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0024_contenttype'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='requests_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0025_item_requests_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='kind',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+    ]
@@ -1,21 +1,24 @@
 import logging
+from collections import defaultdict
 from slugify import slugify
 from datetime import date
 
 from django.contrib.sites.models import Site
-from django.db import models
-from django.db.models import Q
-from django.core.mail import mail_managers, send_mail
+from django.db import models, transaction
+from django.db.models import Q, F, prefetch_related_objects
 from django.urls import reverse_lazy, reverse
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponseRedirect
 from django.template.loader import render_to_string
 from django.core.validators import MaxValueValidator
 
 from django_extensions.db.models import TimeStampedModel, TitleDescriptionModel, TitleSlugDescriptionModel
 
 from framework.behaviours import CommentAble
+from framework.models import Job
 from .behaviours import PayAble
+from .status import ItemStatusResolver
+from .utils import stream_file, get_signed_url
 
 logger = logging.getLogger(__name__)
 
@@ -23,12 +26,37 @@ logger = logging.getLogger(__name__)
 class Product(models.Model):
     """Class to avoid MTI/generic relations: Explicit OneToOneField with all products."""
 
+    kind = models.CharField(max_length=50, blank=True, editable=False)  # Name of the relation to the product object
+
+    @classmethod
+    def get_kinds(cls):
+        return [field.name for field in cls._meta.get_fields() if field.one_to_one]
+
     @property
     def type(self):
         """Get product object"""
-        for product_rel in self._meta.get_fields():
-            if product_rel.one_to_one and getattr(self, product_rel.name, False):
-                return getattr(self, product_rel.name)
+        if not self.kind:  # Not backfilled yet
+            for kind in self.get_kinds():
+                if getattr(self, kind, False):
+                    return getattr(self, kind)
+            return None
+        return getattr(self, self.kind, None)
+
+    @classmethod
+    def prefetch_types(cls, products):
+        """Loads the product objects of all given products with one query per kind."""
+        products_by_kind = defaultdict(list)
+        for product in products:
+            if product.kind:
+                products_by_kind[product.kind].append(product)
+        for kind, kind_products in products_by_kind.items():
+            prefetch_related_objects(kind_products, kind)
+
+    @classmethod
+    def backfill_kinds(cls):
+        """Sets the kind of all products without one. Returns the number of updated products."""
+        return sum(cls.objects.filter(kind='', **{f'{kind}__isnull': False}).update(kind=kind)
+                   for kind in cls.get_kinds())
 
     def items_accessible(self, profile):
         """Returns items that can be accessed by user"""
@@ -38,6 +66,13 @@ class Product(models.Model):
     def any_attachments_accessible(self, profile):
         return self.items_accessible(profile).filter(Q(zotattachment__isnull=False) | Q(files__isnull=False)).exists()
 
+    @classmethod
+    def with_accessible_attachments(cls, products, profile):
+        """Returns the primary keys of all given products with attachments accessible by the user."""
+        return set(Item.objects.filter(product__in=products).filter(
+            Q(purchase__in=profile.purchases) | Q(type__accessible_at__lt=profile.amount)).filter(
+            Q(zotattachment__isnull=False) | Q(files__isnull=False)).values_list('product', flat=True).distinct())
+
     def __str__(self):
         return self.type.__str__()
 
@@ -116,6 +151,19 @@ class Item(TimeStampedModel):
     files = models.ManyToManyField('products.FileAttachment', blank=True)
     _expires = models.DateField(null=True, blank=True)
     discounts = models.ManyToManyField('Discount', blank=True)
+    requests_pending = models.BooleanField(default=False, editable=False)  # Availability changed since last resolved
+
+    AVAILABILITY_FIELDS = ['amount', '_price', '_expires']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        item = super().from_db(db, field_names, values)
+        item._loaded_availability = item.get_availability()
+        return item
+
+    def get_availability(self):
+        """Values of loaded fields affecting whether requests can be resolved."""
+        return {field: self.__dict__.get(field) for field in self.AVAILABILITY_FIELDS}
 
     @property
     def expires(self):
@@ -161,81 +209,32 @@ class Item(TimeStampedModel):
         self.save()
 
     def get_status(self, user):
-        state = {
-            'accessible': self.is_accessible(user),
-            'purchasability': self.get_purchasability(user),
-            'visible': self.is_visible(user)
-        }
-        return state
+        return ItemStatusResolver(user).get_status(self)
 
     def get_price(self, user=None):
-        price = self._price or self.type.default_price
-        if user and price is not None:
-            discount = self.discounts.filter(level__amount__lte=user.profile.amount).order_by('-discount').first()
-            return int(price * (1 - discount.discount/100) if discount else price)
-        return price
+        if user:
+            return ItemStatusResolver(user).get_price(self)
+        return self._price or self.type.default_price
 
     def get_purchasability(self, user):
         """
         Returns purchaseability state if an item.
         This is unrelated to the visibility or accessibility of the item.
         """
-
-        states = [
-            'purchasable',
-            'level required',
-            'purchased',
-            'accessible',
-            'requestable',
-            'sold out',
-            'unavailable'
-        ]
-
-        if self.expired:
-            return states[6]
-        elif self.is_purchased(user) and self.type.buy_once:
-            return states[2]
-        elif self.donationlevel_accessible(user):
-            return states[3]
-        elif not self.donationlevel_purchasable(user):
-            return states[1]
-        elif self.sold_out:
-            if self.type.additional_supply and user.is_authenticated:
-                return states[4]
-            else:
-                return states[5]
-        elif self.get_price() is None:
-            if self.type.request_price and user.is_authenticated:
-                return states[4]
-            else:
-                return states[6]
-        else:
-            return states[0]
+        return ItemStatusResolver(user).get_purchasability(self)
 
     def donationlevel_purchasable(self, user):
-        if user.is_authenticated:
-            return user.profile.amount >= self.type.purchasable_at
-        return 0 >= self.type.purchasable_at
+        return ItemStatusResolver(user).donationlevel_purchasable(self)
 
     def donationlevel_accessible(self, user):
-        if self.type.accessible_at:
-            if user.is_authenticated:
-                return user.profile.amount >= self.type.accessible_at
-            else:
-                return 0 >= self.type.accessible_at
-        return False
+        return ItemStatusResolver(user).donationlevel_accessible(self)
 
     def is_visible(self, user):
-        if self.expired:
-            return False
-        if user.is_authenticated:
-            return not (self.is_accessible(user) and self.attachments)
-        else:
-            return self.type.buy_unauthenticated
+        return ItemStatusResolver(user).is_visible(self)
 
     def is_purchased(self, user):
         if user.is_authenticated:
-            return bool(user.profile.purchases.filter(item=self))
+            return user.profile.purchases.filter(item=self).exists()
         return False
 
     def amount_purchased(self, user):
@@ -244,14 +243,15 @@ class Item(TimeStampedModel):
         return 0
 
     def is_accessible(self, user):
-        return self.donationlevel_accessible(user) or self.is_purchased(user)
+        return ItemStatusResolver(user).is_accessible(self)
 
     def request(self, user):
         if user.is_authenticated:
             if self.type.request_price or self.type.additional_supply:
                 self.requests.add(user.profile)
                 edit_url = reverse_lazy('admin:products_item_change', args=[self.pk])
-                mail_managers(
+                Job.enqueue(
+                    'django.core.mail.mail_managers',
                     f'Anfrage: {self.product}',
                     f'Nutzer {user.profile} hat {self.product} im Format {self.type} angefragt. '
                     f'Das Item kann unter folgender URL editiert werden: {settings.DEFAULT_DOMAIN}{edit_url}')
@@ -262,23 +262,55 @@ class Item(TimeStampedModel):
             raise NotImplementedError()
 
     def resolve_requests(self):
-        for profile in self.requests.all():
-            if self.add_to_cart(profile):
-                self.inform_user(profile)
-                self.requests.remove(profile)
-
-    def inform_user(self, profile):
+        """
+        Adds the item to the carts of all requesting users it is purchasable for and informs them.
+        Carts, requests and mails are processed in bulk.
+        """
+        profiles = list(self.requests.select_related('user'))
+        if not profiles:
+            return
+        purchased = set(Purchase.objects.filter(
+            item=self, profile__in=profiles, executed=True).values_list('profile', flat=True))
+        resolved = [profile for profile in profiles if ItemStatusResolver(
+            profile.user, purchased={self.pk} if profile.pk in purchased else set(), amount=profile.active_amount
+        ).get_purchasability(self) == 'purchasable']
+        if not resolved:
+            return
+
+        in_cart = set(Purchase.objects.filter(
+            item=self, profile__in=resolved, executed=False).values_list('profile', flat=True))
+        Purchase.objects.bulk_create([Purchase(profile=profile, item=self) for profile in resolved
+                                      if profile.pk not in in_cart])
+        if in_cart and not self.type.buy_once:
+            Purchase.objects.filter(item=self, profile__in=in_cart, executed=False).update(amount=F('amount') + 1)
+
+        self.requests.remove(*resolved)
+        self.inform_users(resolved)
+
+    @classmethod
+    def resolve_pending_requests(cls):
+        """
+        Resolves requests of all items whose availability changed since they were last resolved.
+        Every item is resolved in its own transaction, so a failure keeps its flag set and doesn't stop the others.
+        """
+        for item in cls.objects.filter(requests_pending=True).select_related('type', 'product'):
+            try:
+                with transaction.atomic():
+                    # Changes from now on are resolved next time
+                    cls.objects.filter(pk=item.pk).update(requests_pending=False)
+                    item.resolve_requests()
+            except Exception:
+                logger.exception(f'Resolving requests of item {item.pk} failed')
+
+    def inform_users(self, profiles):
         basket_url = Site.objects.get_current().domain + reverse('products:basket')
-        send_mail(
-            f'Verfügbarkeit: {self.product}',
-            render_to_string('products/emails/availability_email.txt', {'item': self, 'basket_url': basket_url}),
-            settings.DEFAULT_FROM_EMAIL,
-            [profile.user.email],
-            fail_silently=False,
-            html_message=render_to_string('products/emails/availability_email.html',
-                                          {'item': self, 'basket_url': basket_url})
-        )
-        logger.debug(f'Informed user {profile.user} of availability of {self.product} as {self}')
+        context = {'item': self, 'basket_url': basket_url}
+        text = render_to_string('products/emails/availability_email.txt', context)
+        html = render_to_string('products/emails/availability_email.html', context)
+        for profile in profiles:  # One job per mail, so a failure is only retried for its recipient
+            Job.enqueue('django.core.mail.send_mail', f'Verfügbarkeit: {self.product}', text,
+                        settings.DEFAULT_FROM_EMAIL, [profile.user.email], html_message=html)
+        logger.debug(f'Informed {len(profiles)} users of availability of {self.product} as {self}')
 
     def add_to_cart(self, profile):
         """Only add a limited product if no purchase of it exists."""
@@ -290,24 +322,27 @@ class Item(TimeStampedModel):
             return True
 
     def sell(self, amount):
-        """Given an amount, tries to lower local amount. Ignored if not limited."""
-        if self.amount is not None:
-            new_amount = self.amount - amount
-            if new_amount >= 0:
-                self.amount = new_amount
-                self.save()
-                return True
-            else:
-                logger.exception(f"Can't sell item: {self.amount} < {amount}")
-                return False
-        else:
+        """
+        Given an amount, tries to lower local amount. Ignored if not limited.
+        The stock is checked and lowered in a single conditional update, so concurrent sales can't oversell.
+        """
+        sold = Item.objects.filter(Q(amount__isnull=True) | Q(amount__gte=amount), pk=self.pk).update(
+            amount=models.F('amount') - amount)  # Unlimited amount stays NULL
+        self.reload_amount()
+        if sold:
             return True
+        else:
+            logger.warning(f"Can't sell item: {self.amount} < {amount}")
+            return False
 
     def refill(self, amount):
-        """Refills amount."""
-        if self.amount is not None:
-            self.amount += amount
-            self.save()
+        """Refills amount. Requests get resolved by resolve_pending_requests."""
+        if Item.objects.filter(pk=self.pk, amount__isnull=False).update(
+                amount=models.F('amount') + amount, requests_pending=True):
+            self.reload_amount()
+
+    def reload_amount(self):
+        self.amount = Item.objects.values_list('amount', flat=True).get(pk=self.pk)
 
     def __str__(self):
         if self.title:
@@ -315,11 +350,16 @@ class Item(TimeStampedModel):
         return self.type.title
 
     def save(self, *args, **kwargs):
+        """Marks requests to be resolved if the availability of an existing item changed."""
         if not self.pk and self.amount is None:
             self.amount = self.type.default_amount
+        availability = self.get_availability()
+        if self.pk and availability != getattr(self, '_loaded_availability', None):
+            self.requests_pending = True
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'requests_pending'}
         super().save(*args, **kwargs)
-        self.refresh_from_db()
-        self.resolve_requests()
+        self._loaded_availability = availability
 
     class Meta:
         verbose_name = 'Item'
@@ -358,6 +398,12 @@ class Purchase(TimeStampedModel, CommentAble):
         return self.item.available and self.item.amount >= self.amount
 
     def execute(self):
+        """
+        Executes the purchase in one transaction of conditional updates:
+        The purchase is marked as executed, the item sold and the price spent only if still possible.
+        If any step fails, the transaction is rolled back. Within a request (ATOMIC_REQUESTS) the transaction is
+        only a savepoint, so the locks taken on the purchase, item and profile rows are held until the request commits.
+        """
         if self.executed:
             logger.warning(f'Cannot execute purchase: Already executed.')
             return False
@@ -367,26 +413,42 @@ class Purchase(TimeStampedModel, CommentAble):
             logger.warning(f'Cannot execute purchase: item state: {state}')
             return False
 
-        if self.profile.spend(self.total):
-            if self.item.sell(self.amount):
-                if self.item.type.inform_staff:
-                    mail_managers(
-                        f'Neuer Kauf: {self.item.product}',
-                        f'Nutzer {self.profile} hat {self.item.product} ({self.item}) gekauft. '
-                        f'Zahlung: {self.method}.')
-                if self.item.type.shipping:
-                    mail_managers(
-                        f'Versand notwendig: {self.item.product}',
-                        f'Nutzer {self.profile} hat {self.item.product} im Format {self.item} bestellt. '
-                        f'Adresse: {self.profile.address}')
-                self.executed = True
-                self.date = date.today()
-                self.save()
-                logger.debug(f'Executed purchase {self}')
-                return True
-            else:
+        if not self.pk:
+            self.save()
+        total = self.total
+        today = date.today()
+        with transaction.atomic():
+            if not Purchase.objects.filter(pk=self.pk, executed=False).update(executed=True, date=today):
+                logger.warning(f'Cannot execute purchase: Already executed.')
+                return False
+            if not self.item.sell(self.amount):
+                logger.warning(f'Cannot execute purchase: Item sold out!')
+                transaction.set_rollback(True)
+                return False
+            spent = self.profile.spend(total)
+            if not spent:
                 logger.warning(f'Cannot execute purchase: Balance not high enough!')
-                self.profile.refill(self.total)
+                transaction.set_rollback(True)
+        if not spent:
+            self.item.reload_amount()  # Sale got rolled back
+            return False
+
+        self.executed = True
+        self.date = today
+        if self.item.type.inform_staff:
+            Job.enqueue(
+                'django.core.mail.mail_managers',
+                f'Neuer Kauf: {self.item.product}',
+                f'Nutzer {self.profile} hat {self.item.product} ({self.item}) gekauft. '
+                f'Zahlung: {self.method}.')
+        if self.item.type.shipping:
+            Job.enqueue(
+                'django.core.mail.mail_managers',
+                f'Versand notwendig: {self.item.product}',
+                f'Nutzer {self.profile} hat {self.item.product} im Format {self.item} bestellt. '
+                f'Adresse: {self.profile.address}')
+        logger.debug(f'Executed purchase {self}')
+        return True
 
     def revert(self):
         self.profile.refill(self.total)
@@ -439,14 +501,19 @@ class FileAttachment(models.Model):
     )
     type = models.ForeignKey('products.AttachmentType', on_delete=models.PROTECT)
 
-    def get(self):
+    def get(self, range_header=None, redirect=False):
+        """Streams the file. With redirect, the file is downloaded directly from storage if it can sign URLs."""
         if not self.file:
             raise FileNotFoundError
         product = next(i.product for i in self.item_set.all() if i.product.type)
-        response = HttpResponse(self.file, content_type=f'application/{self.type.slug}')
-        response['Content-Disposition'] = f'attachment; \
-            filename={slugify(product.type.title)}.{self.type.slug}'
-        return response
+        filename = f'{slugify(product.type.title)}.{self.type.slug}'
+        content_type = f'application/{self.type.slug}'
+        if redirect:
+            url = get_signed_url(self.file, filename, content_type)
+            if url:
+                return HttpResponseRedirect(url)
+        return stream_file(
+            self.file.open('rb'), filename, content_type, size=self.file.size, range_header=range_header)
 
     def save(self, *args, **kwargs):
         if self.already_uploaded_url:
@@ -0,0 +1,139 @@
+from django.db.models import prefetch_related_objects
+
+
+class ItemStatusResolver:
+    """
+    Resolves the state of items in relation to a single user.
+    User data (donation amount, purchased items) is loaded once per resolver, item data (types, attachments,
+    discounts) once per batch of items. The number of queries therefore doesn't grow with the number of items.
+    """
+
+    STATES = [
+        'purchasable',
+        'level required',
+        'purchased',
+        'accessible',
+        'requestable',
+        'sold out',
+        'unavailable'
+    ]
+
+    def __init__(self, user, purchased=None, amount=None):
+        self.user = user
+        self._amount = amount  # Amount of the active donation, if already known
+        self._purchased = purchased  # Item primary keys, if already known
+        self._discounts = {}
+        self._statuses = {}
+
+    @classmethod
+    def for_request(cls, request):
+        """Returns resolver cached on the request, so all template tags of a response share it."""
+        resolver = getattr(request, '_item_status_resolver', None)
+        if resolver is None or resolver.user != request.user:  # User changes on login
+            resolver = cls(request.user)
+            request._item_status_resolver = resolver
+        return resolver
+
+    @property
+    def amount(self):
+        """Amount of the active donation of the user."""
+        if self._amount is None:
+            self._amount = self.user.profile.amount if self.user.is_authenticated else 0
+        return self._amount
+
+    @property
+    def purchased(self):
+        """Set of primary keys of all items bought by the user."""
+        if self._purchased is None:
+            if self.user.is_authenticated:
+                self._purchased = set(self.user.profile.purchases.values_list('item', flat=True))
+            else:
+                self._purchased = set()
+        return self._purchased
+
+    def resolve(self, items):
+        """Loads data of all unresolved items at once and returns the states of all given items."""
+        items = list(items)
+        pending = [item for item in items if item.pk not in self._statuses]
+        if pending:
+            prefetch_related_objects(pending, 'type', 'files', 'zotattachment_set')
+            self._load_discounts(pending)
+            for item in pending:
+                self._statuses[item.pk] = {
+                    'accessible': self.is_accessible(item),
+                    'purchasability': self.get_purchasability(item),
+                    'visible': self.is_visible(item)
+                }
+        return [self._statuses[item.pk] for item in items]
+
+    def _load_discounts(self, items):
+        """Retrieves the highest discount available to the user for every item."""
+        from .models import Item
+
+        pending = [item.pk for item in items if item.pk not in self._discounts]
+        if pending and self.user.is_authenticated:
+            self._discounts.update({pk: 0 for pk in pending})
+            discounts = Item.discounts.through.objects.filter(
+                item__in=pending, discount__level__amount__lte=self.amount).values_list('item', 'discount__discount')
+            for pk, discount in discounts:
+                self._discounts[pk] = max(self._discounts[pk], discount)
+
+    def get_status(self, item):
+        return self.resolve([item])[0]
+
+    def get_price(self, item):
+        price = item._price or item.type.default_price
+        if self.user.is_authenticated and price is not None:
+            self._load_discounts([item])
+            discount = self._discounts[item.pk]
+            return int(price * (1 - discount/100) if discount else price)
+        return price
+
+    def get_purchasability(self, item):
+        """
+        Returns purchaseability state if an item.
+        This is unrelated to the visibility or accessibility of the item.
+        """
+
+        if item.expired:
+            return self.STATES[6]
+        elif self.is_purchased(item) and item.type.buy_once:
+            return self.STATES[2]
+        elif self.donationlevel_accessible(item):
+            return self.STATES[3]
+        elif not self.donationlevel_purchasable(item):
+            return self.STATES[1]
+        elif item.sold_out:
+            if item.type.additional_supply and self.user.is_authenticated:
+                return self.STATES[4]
+            else:
+                return self.STATES[5]
+        elif item.get_price() is None:
+            if item.type.request_price and self.user.is_authenticated:
+                return self.STATES[4]
+            else:
+                return self.STATES[6]
+        else:
+            return self.STATES[0]
+
+    def donationlevel_purchasable(self, item):
+        return self.amount >= item.type.purchasable_at
+
+    def donationlevel_accessible(self, item):
+        if item.type.accessible_at:
+            return self.amount >= item.type.accessible_at
+        return False
+
+    def is_visible(self, item):
+        if item.expired:
+            return False
+        if self.user.is_authenticated:
+            return not (self.is_accessible(item) and item.attachments)
+        else:
+            return item.type.buy_unauthenticated
+
+    def is_purchased(self, item):
+        return item.pk in self.purchased
+
+    def is_accessible(self, item):
+        return self.donationlevel_accessible(item) or self.is_purchased(item)
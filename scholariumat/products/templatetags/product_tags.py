@@ -1,17 +1,26 @@
 from django import template
 
+from ..status import ItemStatusResolver
+
 
 register = template.Library()
 
 
+@register.simple_tag
+def resolve_items(request, items):
+    """Loads the states of all given items at once. Later item_status/item_price calls use the results."""
+    ItemStatusResolver.for_request(request).resolve(items)
+    return ''
+
+
 @register.simple_tag
 def item_status(request, item):
-    return item.get_status(request.user)
+    return ItemStatusResolver.for_request(request).get_status(item)
 
 
 @register.simple_tag
 def item_price(request, item):
-    return item.get_price(request.user)
+    return ItemStatusResolver.for_request(request).get_price(item)
 
 
 @register.simple_tag
@@ -1,15 +1,27 @@
 import os
+import time
+import tempfile
+import threading
+from datetime import date, timedelta
+from unittest import mock, skipIf
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core import mail
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.files.base import ContentFile
 from django.urls import reverse
 
 from users.models import Profile
 from library.models import ZotItem
-from products.models import Item, ItemType, Purchase, Payment
+from events.models import Event, EventType, Livestream
+from products.models import Item, ItemType, Product, Purchase, Payment, FileAttachment, AttachmentType, \
+    ContentType
 from donations.models import DonationLevel, Donation, PaymentMethod
+from products.status import ItemStatusResolver
 
 
 class RequestPaymentTest(TestCase):
@@ -133,6 +145,22 @@ class ItemTest(TestCase):
         self.assertEqual(self.item.amount, self.amount_start - 1)
 
 
+class ProductTest(TestCase):
+    def test_type(self):
+        books = [ZotItem.objects.create(title=f'Book {i}', slug=f'book-{i}') for i in range(3)]
+        self.assertEqual(books[0].product.kind, 'zotitem')
+        products = list(Product.objects.filter(pk__in=[book.product_id for book in books]))
+        with self.assertNumQueries(1):
+            Product.prefetch_types(products)
+            self.assertEqual({product.type for product in products}, set(books))
+
+        # Products created before kinds were stored are found, too
+        Product.objects.update(kind='')
+        self.assertEqual(Product.objects.get(pk=books[0].product_id).type, books[0])
+        self.assertEqual(Product.backfill_kinds(), 3)
+        self.assertEqual(Product.objects.filter(kind='zotitem').count(), 3)
+
+
 class RequestTest(TestCase):
     def setUp(self):
         self.user = get_user_model().objects.create(email='a.b@c.de')
@@ -145,6 +173,7 @@ class RequestTest(TestCase):
     def test_request(self):
         self.item.request(self.user)
         self.item.refill(1)
+        Item.resolve_pending_requests()
 
         # Assert item put in basket
         self.assertIsNotNone(self.user.profile.cart.all())
@@ -152,3 +181,203 @@ class RequestTest(TestCase):
 
         # Assert admins and user are informed
         self.assertEqual(len(mail.outbox), 2)
+
+    def test_pending(self):
+        users = [get_user_model().objects.create(email=f'user{i}@c.de') for i in range(3)]
+        for user in users:
+            Profile.objects.create(user=user)
+            self.item.request(user)
+        mail.outbox = []
+
+        # Unchanged availability doesn't cause resolution
+        self.item.title = 'Neu'
+        self.item.save()
+        self.assertFalse(Item.objects.get(pk=self.item.pk).requests_pending)
+
+        item = Item.objects.get(pk=self.item.pk)
+        item.amount = 5
+        item.save()
+        self.assertTrue(Item.objects.get(pk=self.item.pk).requests_pending)
+        Item.resolve_pending_requests()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(item.requests.exists())
+        self.assertFalse(Item.objects.get(pk=self.item.pk).requests_pending)
+
+    def test_pending_failure(self):
+        self.item.request(self.user)
+        self.item.refill(1)
+        with mock.patch.object(Item, 'inform_users', side_effect=RuntimeError):
+            Item.resolve_pending_requests()
+
+        # Failed resolution is rolled back and retried next time
+        self.assertTrue(Item.objects.get(pk=self.item.pk).requests_pending)
+        self.assertTrue(self.item.requests.exists())
+        self.assertFalse(self.user.profile.cart.exists())
+        Item.resolve_pending_requests()
+        self.assertFalse(Item.objects.get(pk=self.item.pk).requests_pending)
+        self.assertEqual(self.item, self.user.profile.cart.get().item)
+
+
+class ItemStatusResolverTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='a.b@c.de')
+        Profile.objects.create(user=self.user)
+        self.book = ZotItem.objects.create(title='Testbook', slug='testslug')
+        self.itemtype = ItemType.objects.create(title='Kauf', buy_once=True)
+        self.items = [
+            Item.objects.create(type=self.itemtype, _price=10, product=self.book.product) for i in range(5)]
+        level = DonationLevel.objects.create(amount=75)
+        self.user.profile.donate(75)
+        self.items[0].discounts.create(level=level, discount=50)
+        Purchase.objects.create(profile=self.user.profile, item=self.items[1], executed=True)
+
+    def test_status(self):
+        resolver = ItemStatusResolver(self.user)
+        for item, status in zip(self.items, resolver.resolve(self.items)):
+            self.assertEqual(status['purchasability'], item.get_purchasability(self.user))
+            self.assertEqual(status['accessible'], item.is_accessible(self.user))
+            self.assertEqual(status['visible'], item.is_visible(self.user))
+        self.assertEqual(resolver.get_status(self.items[1])['purchasability'], 'purchased')
+        self.assertEqual(resolver.get_price(self.items[0]), 5)
+        self.assertEqual(resolver.get_price(self.items[2]), 10)
+
+    def test_constant_queries(self):
+        items = list(Item.objects.filter(pk=self.items[0].pk))
+        with CaptureQueriesContext(connection) as single:
+            ItemStatusResolver(self.user).resolve(items)
+
+        items = list(Item.objects.all())
+        with CaptureQueriesContext(connection) as multiple:
+            resolver = ItemStatusResolver(self.user)
+            resolver.resolve(items)
+            for item in items:
+                resolver.get_price(item)
+                item.attachments
+        self.assertEqual(len(single), len(multiple))
+
+
+class PurchaseViewTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(email='a.b@c.de')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.itemtype = ItemType.objects.create(title='Teilnahme')
+        self.content_type = ContentType.objects.create(title='Livestream')
+        self.content_type.included_in.add(self.itemtype)
+        self.event_type = EventType.objects.create(title='Seminar', slug='seminar')
+
+    def buy(self, count):
+        for i in range(count):
+            book = ZotItem.objects.create(title=f'Book {i}', slug=f'book-{i}-{ZotItem.objects.count()}')
+            event = Event.objects.create(
+                title=f'Event {i}', slug=f'event-{i}-{Event.objects.count()}', type=self.event_type,
+                date=date.today() + timedelta(days=i - count // 2))
+            Livestream.objects.create(product=event.product, type=self.content_type, link='https://example.com')
+            for product in [book.product, event.product]:
+                item = Item.objects.create(type=self.itemtype, product=product)
+                Purchase.objects.create(profile=self.user.profile, item=item, executed=True)
+
+    def test_constant_queries(self):
+        self.buy(1)
+        self.client.get(reverse('products:purchases'))  # Fill caches
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('products:purchases'))
+
+        self.buy(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('products:purchases'))
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.context['digital_content']), 11)
+        self.assertEqual(len(response.context['future_events']) + len(response.context['past_events']), 11)
+        self.assertContains(response, 'Zum Video')
+
+
+class FileAttachmentTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.content = bytes(range(256)) * 1000
+        book = ZotItem.objects.create(title='Testbook', slug='testslug')
+        item = Item.objects.create(type=ItemType.objects.create(title='Kauf'), product=book.product)
+        with self.settings(MEDIA_ROOT=self.media_root.name):
+            self.attachment = FileAttachment(type=AttachmentType.objects.create(title='MP3', slug='mp3'))
+            self.attachment.file.save('test.mp3', ContentFile(self.content))
+        item.files.add(self.attachment)
+
+    def tearDown(self):
+        self.media_root.cleanup()
+
+    def test_streaming(self):
+        with self.settings(MEDIA_ROOT=self.media_root.name):
+            response = self.attachment.get()
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Length'], str(len(self.content)))
+            self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_range(self):
+        with self.settings(MEDIA_ROOT=self.media_root.name):
+            response = self.attachment.get(range_header='bytes=1000-1999')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.content)}')
+            self.assertEqual(b''.join(response.streaming_content), self.content[1000:2000])
+
+            response = self.attachment.get(range_header=f'bytes={len(self.content)}-')
+            self.assertEqual(response.status_code, 416)
+
+    def test_signed_redirect(self):
+        signed_settings = {
+            'MEDIA_ROOT': self.media_root.name,
+            'DEFAULT_FILE_STORAGE': 'products.storages.SignedFileSystemStorage'
+        }
+        with self.settings(**signed_settings):
+            response = self.attachment.get(redirect=True)
+            self.assertEqual(response.status_code, 302)
+
+            download = self.client.get(response.url)
+            self.assertEqual(download['Content-Disposition'], 'attachment; filename=testbook.mp3')
+            self.assertEqual(b''.join(download.streaming_content), self.content)
+
+            self.assertEqual(self.client.get(response.url[:-2] + 'xx').status_code, 403)
+            with mock.patch('time.time', return_value=time.time() + settings.SIGNED_DOWNLOAD_EXPIRY + 1):
+                self.assertEqual(self.client.get(response.url).status_code, 403)
+
+        # Storage without signed URLs
+        with self.settings(MEDIA_ROOT=self.media_root.name):
+            self.assertTrue(self.attachment.get(redirect=True).streaming)
+
+
+@skipIf(connection.vendor == 'sqlite', 'Concurrent writes need a database with row level locking.')
+class ConcurrentPurchaseTest(TransactionTestCase):
+    def setUp(self):
+        itemtype = ItemType.objects.create(title='Teilnahme', slug='seminar_attendance', default_amount=15)
+        seminar = ZotItem.objects.create(title='Seminar', slug='seminar')
+        self.item = Item.objects.create(type=itemtype, _price=10, product=seminar.product)
+        self.purchases = []
+        for i in range(30):
+            user = get_user_model().objects.create(email=f'user{i}@c.de')
+            profile = Profile.objects.create(user=user, balance=10)
+            self.purchases.append(Purchase.objects.create(profile=profile, item=self.item))
+
+    def test_no_overselling(self):
+        barrier = threading.Barrier(len(self.purchases))
+        results = []
+
+        def execute(pk):
+            try:
+                purchase = Purchase.objects.get(pk=pk)
+                barrier.wait()
+                results.append(purchase.execute())
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=execute, args=[purchase.pk]) for purchase in self.purchases]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 15)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.amount, 0)
+        self.assertEqual(Purchase.objects.filter(executed=True).count(), 15)
+        self.assertEqual(Profile.objects.filter(balance=0).count(), 15)
+        self.assertEqual(Profile.objects.filter(balance=10).count(), 15)
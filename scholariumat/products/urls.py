@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import BasketView, PurchaseView, HistoryView, PaymentView, ApprovalView, DownloadView
+from .views import BasketView, PurchaseView, HistoryView, PaymentView, ApprovalView, DownloadView, SignedFileView
 
 app_name = 'products'
 
@@ -10,6 +10,7 @@ urlpatterns = [
     path('historie', HistoryView.as_view(), name='purchase_history'),
     path('zahlung', PaymentView.as_view(), name='payment'),
     path('bestaetigung/<slug:slug>', ApprovalView.as_view(), name='approve'),
+    path('datei/<str:token>', SignedFileView.as_view(), name='signed_file'),
 
     path('miseskreis82236442', DownloadView.as_view(), name="miseskreis")
 ]
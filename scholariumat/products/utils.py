@@ -1,13 +1,85 @@
 import requests
 from requests.auth import HTTPBasicAuth
 import xml.dom.minidom
+import copy
 import logging
+import re
 
 from django.conf import settings
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
 
 
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def read_chunks(file, length=None):
+    """Yields chunks of a file until length bytes are read, closing it afterwards."""
+    try:
+        while length is None or length > 0:
+            chunk = file.read(DOWNLOAD_CHUNK_SIZE if length is None else min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            if length is not None:
+                length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def stream_file(file, filename, content_type, size=None, range_header=None):
+    """
+    Returns a response reading file in chunks. If the size is known, a single byte range can be requested
+    with the Range header, e.g. for seeking in audio files.
+    """
+    match = RANGE_RE.match(range_header or '')
+    if size is not None and match and any(match.groups()):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:  # Suffix range: last n bytes
+            start, end = max(size - int(last), 0), size - 1
+        if start > end:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        file.seek(start)
+        response = StreamingHttpResponse(read_chunks(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(file, content_type=content_type)
+        response.block_size = DOWNLOAD_CHUNK_SIZE
+        if size is not None:
+            response['Content-Length'] = size
+
+    response['Accept-Ranges'] = 'bytes' if size is not None else 'none'
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def get_signed_url(file, filename, content_type, expire=None):
+    """
+    Returns a short-lived signed URL to download a stored file directly from the storage, saved as filename.
+    Returns None if the storage can't sign URLs.
+    """
+    storage = file.storage
+    if hasattr(storage, 'bucket'):  # S3Boto3Storage, signing might be disabled for other media
+        storage = copy.copy(storage)
+        storage.querystring_auth = True
+        storage.custom_domain = None
+    elif not getattr(storage, 'signs_urls', False):
+        return None
+
+    parameters = {
+        'ResponseContentDisposition': f'attachment; filename={filename}',
+        'ResponseContentType': content_type,
+    }
+    return storage.url(file.name, parameters=parameters, expire=expire or settings.SIGNED_DOWNLOAD_EXPIRY)
+
 
 class SofortPayment(object):
     """
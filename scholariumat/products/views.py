@@ -1,24 +1,29 @@
 import logging
+from collections import defaultdict
 from datetime import date
 
 from django.contrib import messages
 from django.conf import settings
 from django.urls import reverse, reverse_lazy
-from django.http import HttpResponseRedirect, HttpResponse, HttpResponseNotFound
+from django.http import HttpResponseRedirect, HttpResponse, HttpResponseNotFound, HttpResponseForbidden
+from django.core import signing
+from django.views import View
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.mail import mail_managers
 from django.contrib.auth import login
 
 from vanilla import ListView, TemplateView, FormView
 from braces.views import LoginRequiredMixin, MessageMixin
 
-from events.models import Event
+from events.models import Event, Livestream
+from framework.models import Job
 from library.models import ZotItem
 from donations.models import DonationLevel
 from donations.forms import ApprovalForm
 from users.views import UpdateOrCreateRequiredMixin
-from .models import Item, Purchase, Payment
+from .models import Item, Product, Purchase, Payment, FileAttachment
 from .forms import PaymentForm
+from .status import ItemStatusResolver
+from .utils import stream_file
 
 
 logger = logging.getLogger(__name__)
@@ -71,14 +76,16 @@ class DownloadMixin():
             if item.is_accessible(request.user):
                 attachment = item.attachments[int(request.POST.get('id', '0'))]
                 try:
-                    download = attachment.get()
+                    download = attachment.get(
+                        range_header=request.META.get('HTTP_RANGE'), redirect=settings.SIGNED_DOWNLOADS)
                     if download:
                         return download
                     raise FileNotFoundError()
                 except FileNotFoundError:
                     messages.error(request, settings.MESSAGE_NOT_FOUND)
                     edit_url = reverse('admin:products_item_change', args=[item.pk])
-                    mail_managers(
+                    Job.enqueue(
+                        'django.core.mail.mail_managers',
                         f'Fehlende Datei: {item.product} als {attachment}',
                         f'Das Item kann unter folgender URL editiert werden: {settings.DEFAULT_DOMAIN}{edit_url}')
 
@@ -88,11 +95,27 @@ class DownloadMixin():
         return response
 
 
+class ResolveItemsMixin():
+    """Resolves the states of all items of the listed products at once"""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        items = [item for obj in context['object_list'] for item in obj.product.item_set.all()]
+        ItemStatusResolver.for_request(self.request).resolve(items)
+        return context
+
+
 class BasketView(LoginRequiredMixin, PurchaseMixin, MessageMixin, ListView):
     template_name = 'products/basket.html'
 
     def get_queryset(self):
-        return Purchase.objects.filter(profile=self.request.user.profile, executed=False)
+        return Purchase.objects.filter(
+            profile=self.request.user.profile, executed=False).select_related('item__type', 'item__product')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        Product.prefetch_types(purchase.item.product for purchase in context['object_list'])
+        return context
 
     def post(self, request, *args, **kwargs):
         if 'buy' in request.POST:
@@ -120,27 +143,38 @@ class PurchaseView(LoginRequiredMixin, DownloadMixin, TemplateView):
     template_name = 'products/purchases.html'
 
     def get_context_data(self, **kwargs):
-        purchases = self.request.user.profile.purchases.order_by('-date')
-        products = self.request.user.profile.products_bought
-
-        context = {
+        """Groups all purchases by product. Products, attachments and livestreams are loaded in bulk."""
+        profile = self.request.user.profile
+        purchases = list(profile.purchases.order_by('-date'))
+        product_purchases = defaultdict(list)
+        for purchase in purchases:
+            product_purchases[purchase.item.product_id].append(purchase)
+        products = list(product_purchases)
+
+        events = list(Event.objects.filter(product__in=products).select_related('type'))
+        digital_products = Item.objects.filter(
+            product__in=products, amount__isnull=True).values_list('product', flat=True)
+        zotitems = list(ZotItem.objects.filter(product__in=digital_products).prefetch_related('authors'))
+
+        with_attachments = Product.with_accessible_attachments(products, profile)
+        livestreams = {}
+        for livestream in Livestream.objects.filter(
+                product__in=[event.product_id for event in events]).prefetch_related('type__included_in'):
+            livestreams.setdefault(livestream.product_id, livestream)
+        for product in events + zotitems:
+            product.attachments_accessible = product.product_id in with_attachments
+            livestream = livestreams.get(product.product_id)
+            items = [purchase.item for purchase in product_purchases[product.product_id]]
+            product.accessible_livestream = livestream if livestream and livestream.is_included(items) else None
+
+        today = date.today()
+        return {
             'purchases': purchases,
+            'future_events': {event: product_purchases[event.product_id] for event in events if event.date >= today},
+            'past_events': {event: product_purchases[event.product_id] for event in events if event.date < today},
+            'digital_content': {zotitem: product_purchases[zotitem.product_id] for zotitem in zotitems},
         }
 
-        events = Event.objects.filter(product__in=products)
-        # events = products.filter(item__type__slug__in=['livestream', 'attendence'])
-        context['future_events'] = {event: purchases.filter(item__product=event.product) for
-                                    event in events.filter(date__gte=date.today())}
-        context['past_events'] = {event: purchases.filter(item__product=event.product) for
-                                  event in events.filter(date__lt=date.today())}
-
-        # context['digital_content'] = products.filter(zotitem__isnull=False, item__amount__isnull=True)
-        digital_product = {product: purchases.filter(item__product=product) for
-                           product in products.filter(item__amount__isnull=True)}
-        context['digital_content'] = {item: purchases.filter(item__product=item.product) for
-                                      item in ZotItem.objects.filter(product__in=digital_product)}
-        return context
-
 
 class PaymentView(UpdateOrCreateRequiredMixin, MessageMixin, FormView):
     form_class = PaymentForm
@@ -216,6 +250,30 @@ class HistoryView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         return self.request.user.profile.purchases.order_by('-date')
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        Product.prefetch_types(purchase.item.product for purchase in context['object_list'])
+        return context
+
+
+class SignedFileView(View):
+    """Serves signed URLs of SignedFileSystemStorage, the local stand-in for S3."""
+
+    def get(self, request, token):
+        storage = FileAttachment._meta.get_field('file').storage
+        if not getattr(storage, 'signs_urls', False):
+            return HttpResponseNotFound()
+        try:
+            name, parameters = storage.load_token(token)
+            file = storage.open(name)
+        except (signing.BadSignature, FileNotFoundError):
+            return HttpResponseForbidden()
+
+        filename = parameters.get('ResponseContentDisposition', '').rpartition('filename=')[2] or name
+        return stream_file(
+            file, filename, parameters.get('ResponseContentType', 'application/octet-stream'),
+            size=storage.size(name), range_header=request.META.get('HTTP_RANGE'))
+
 
 class DownloadView(TemplateView):
     template_name = 'mises_songs.html'
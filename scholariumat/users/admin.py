@@ -1,65 +1,69 @@
-import csv
-from datetime import date
-
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
-from django.db.models import OuterRef, Subquery
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, StreamingHttpResponse
+from django.urls import re_path
 
 from authtools.admin import UserAdmin
 
-from donations.models import Donation
 from donations.admin import DonationInline, LevelFilter, ExpirationFilter, InterestedFilter
-from .models import Profile
+from framework.models import Job
+from products.utils import stream_file
+from .exports import get_expiry_date, get_storage, iter_csv
+from .models import Profile, ProfileExport
 
 
 class ProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'organization', 'level', 'balance', 'expiration']
+    list_display = ['user', 'organization', 'active_level', 'balance', 'expiration']
+    list_select_related = ['user', 'active_level']
     search_fields = ['user__email', 'first_name', 'last_name']
     raw_id_fields = ['user']
     list_filter = [LevelFilter, ExpirationFilter, InterestedFilter]
     inlines = [DonationInline]
     actions = ['generate_csv_full', 'generate_csv_emails_only']
 
-    def generate_csv_emails_only(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="profiles.csv"'
-        writer = csv.writer(response, quoting=csv.QUOTE_MINIMAL)
-        writer.writerows(queryset.values_list('user__email'))
-        return response
+    def get_urls(self):
+        return [
+            re_path(r'^exports/(?P<filename>[\w-]+\.csv)$', self.admin_site.admin_view(self.download_export),
+                    name='users_profile_export'),
+        ] + super().get_urls()
 
-    generate_csv_emails_only.short_description = 'CSV Dokument generieren (Nur Emails)'
+    def download_export(self, request, filename):
+        """Serves files of background exports from the private export storage until they expire."""
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        storage = get_storage()
+        if not ProfileExport.objects.filter(file_name=filename, created__gte=get_expiry_date()).exists() or \
+                not storage.exists(filename):
+            raise Http404
+        return stream_file(storage.open(filename), filename, 'text/csv', size=storage.size(filename))
 
-    def generate_csv_full(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
+    def export_csv(self, request, queryset, full):
+        """
+        Streams the export of small selections directly. Larger ones are written to the storage by a job, which
+        sends a download link to the staff member.
+        """
+        count = queryset.count()
+        if count > settings.PROFILE_EXPORT_STREAM_LIMIT:
+            export = ProfileExport.create(queryset, full, request.user.email)
+            Job.enqueue('users.exports.export_profiles', export.pk)
+            self.message_user(
+                request, f'Der Export von {count} Profilen wird erstellt und an {request.user.email} gesendet.',
+                messages.INFO)
+            return None
+
+        response = StreamingHttpResponse(iter_csv(queryset, full), content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="profiles.csv"'
-        writer = csv.writer(response, quoting=csv.QUOTE_MINIMAL)
-        writer.writerow([
-            'Anrede', 'Vorname', 'Nachname', 'Email', 'Firma', 'Straße', 'PLZ',
-            'Stadt', 'Land', 'Stufe', 'Ablaufdatum', 'Guthaben'])
+        return response
 
-        active_donations = Donation.objects.filter(
-            profile=OuterRef('pk'), expiration__gte=date.today()).order_by('-amount')
-        latest_donations = Donation.objects.filter(profile=OuterRef('pk')).order_by('-expiration')
-        queryset = queryset.annotate(
-            active_donation=Subquery(active_donations.values('amount')[:1]),
-            expiration_date=Subquery(latest_donations.values('expiration')[:1]))
+    def generate_csv_emails_only(self, request, queryset):
+        return self.export_csv(request, queryset, full=False)
 
-        writer.writerows(queryset.values_list(
-            'title',
-            'first_name',
-            'last_name',
-            'user__email',
-            'organization',
-            'street',
-            'postcode',
-            'city',
-            'country',
-            'active_donation',
-            'expiration_date',
-            'balance'))
+    generate_csv_emails_only.short_description = 'CSV Dokument generieren (Nur Emails)'
 
-        return response
+    def generate_csv_full(self, request, queryset):
+        return self.export_csv(request, queryset, full=True)
 
     generate_csv_full.short_description = 'CSV Dokument generieren'
 
@@ -0,0 +1,20 @@
+import logging
+
+from django_cron import CronJobBase, Schedule
+
+from .exports import delete_expired_exports
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeleteExpiredExports(CronJobBase):
+    RUN_EVERY_MINS = 60
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'Profile export deletion Cronjob'
+
+    def do(self):
+        count = delete_expired_exports()
+        if count:
+            logger.info(f'Deleted {count} expired profile exports.')
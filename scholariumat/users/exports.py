@@ -0,0 +1,114 @@
+"""
+CSV exports of profiles for the admin.
+
+Rows are read with a server-side cursor in chunks and written one by one, either directly into a streaming response
+or, for large selections, into a file by a background job, which mails a download link to the staff member.
+Files are written to the private storage configured by PROFILE_EXPORT_STORAGE, never to the public media storage,
+and are only served by the admin.
+"""
+import csv
+import datetime
+import logging
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import get_storage_class
+from django.core.mail import send_mail
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import ProfileExport
+
+
+logger = logging.getLogger(__name__)
+
+FULL_COLUMNS = [
+    ('Anrede', 'title'),
+    ('Vorname', 'first_name'),
+    ('Nachname', 'last_name'),
+    ('Email', 'user__email'),
+    ('Firma', 'organization'),
+    ('Straße', 'street'),
+    ('PLZ', 'postcode'),
+    ('Stadt', 'city'),
+    ('Land', 'country'),
+    ('Stufe', 'active_amount'),
+    ('Ablaufdatum', 'expiration'),
+    ('Guthaben', 'balance'),
+]
+
+
+class Echo(object):
+    """File-like object returning written lines instead of storing them, so csv.writer can be used in generators."""
+
+    def write(self, value):
+        return value
+
+
+def get_rows(queryset, full=True):
+    """Returns the header and an iterator over the rows of the export of a profile queryset."""
+    if not full:
+        return None, queryset.order_by('pk').values_list('user__email').iterator(
+            chunk_size=settings.PROFILE_EXPORT_CHUNK_SIZE)
+
+    header = [title for title, field in FULL_COLUMNS]
+    rows = queryset.order_by('pk').values_list(*[field for title, field in FULL_COLUMNS]).iterator(
+        chunk_size=settings.PROFILE_EXPORT_CHUNK_SIZE)
+    return header, rows
+
+
+def iter_csv(queryset, full=True):
+    """Yields the export as lines of CSV."""
+    writer = csv.writer(Echo(), quoting=csv.QUOTE_MINIMAL)
+    header, rows = get_rows(queryset, full)
+    if header:
+        yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def get_storage():
+    return get_storage_class(settings.PROFILE_EXPORT_STORAGE)(**settings.PROFILE_EXPORT_STORAGE_OPTIONS)
+
+
+def get_export_url(name):
+    return f'{settings.DEFAULT_DOMAIN}{reverse("admin:users_profile_export", args=[name])}'
+
+
+def get_expiry_date():
+    return timezone.now() - datetime.timedelta(seconds=settings.PROFILE_EXPORT_EXPIRY)
+
+
+def export_profiles(export_pk):
+    """Writes the file of an export and mails the download link. Runs as job."""
+    export = ProfileExport.objects.get(pk=export_pk)
+    count = export.get_profiles().count()
+    with tempfile.TemporaryFile() as export_file:
+        export_file.writelines(line.encode('utf-8') for line in iter_csv(export.get_profiles(), export.full))
+        export_file.seek(0)
+        export.file_name = get_storage().save(
+            f'profiles-{timezone.now():%Y%m%d-%H%M}-{uuid.uuid4().hex}.csv', File(export_file))
+    export.save()
+    export.profiles.clear()  # Selection is not needed anymore
+
+    hours = settings.PROFILE_EXPORT_EXPIRY // 3600
+    send_mail(
+        'Export der Nutzerprofile',
+        f'Der Export von {count} Profilen kann {hours} Stunden lang hier heruntergeladen werden: '
+        f'{get_export_url(export.file_name)}',
+        settings.DEFAULT_FROM_EMAIL, [export.email])
+    logger.info(f'Exported {count} profiles to {export.file_name}')
+    return export.file_name
+
+
+def delete_expired_exports():
+    """Deletes exports and their files after PROFILE_EXPORT_EXPIRY. Returns the number of deleted exports."""
+    storage = get_storage()
+    expired = list(ProfileExport.objects.filter(created__lt=get_expiry_date()))
+    for export in expired:
+        if export.file_name:
+            storage.delete(export.file_name)
+        export.delete()
+    return len(expired)
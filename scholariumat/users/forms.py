@@ -3,13 +3,27 @@ from captcha.fields import ReCaptchaField
 
 from django import forms
 from django.contrib.auth import get_user_model
+from django.contrib.auth.forms import PasswordResetForm
+from django.template.loader import render_to_string
 
+from framework.models import Job
 from .models import Profile
 
 
 logger = logging.getLogger(__name__)
 
 
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Renders the mail right away, but sends it in a background job."""
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(render_to_string(subject_template_name, context).splitlines())
+        body = render_to_string(email_template_name, context)
+        html = render_to_string(html_email_template_name, context) if html_email_template_name else None
+        Job.enqueue('django.core.mail.send_mail', subject, body, from_email, [to_email], html_message=html)
+
+
 class UserForm(forms.ModelForm):
     captcha = ReCaptchaField(attrs={'_no_label': True, '_no_errors': True})
 
@@ -0,0 +1,55 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+import datetime
+from bisect import bisect_right
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_active_donations(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    Donation = apps.get_model('donations', 'Donation')
+    DonationLevel = apps.get_model('donations', 'DonationLevel')
+    levels = list(DonationLevel.objects.order_by('amount'))
+    amounts = [level.amount for level in levels]
+    today = datetime.date.today()
+
+    states = {}  # Active amount and newest donation by profile
+    for donation in Donation.objects.filter(executed=True).order_by('date', 'pk').iterator():
+        amount, newest = states.get(donation.profile_id, (0, None))
+        if donation.expiration >= today:
+            amount = max(amount, donation.amount)
+        states[donation.profile_id] = (amount, donation)
+
+    for profile_pk, (amount, newest) in states.items():
+        index = bisect_right(amounts, amount) if amount else 0
+        Profile.objects.filter(pk=profile_pk).update(
+            active_amount=amount, active_level=levels[index - 1] if index else None, expiration=newest.expiration)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0005_auto_20181119_1707'),
+        ('users', '0007_auto_20181217_1412'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='active_amount',
+            field=models.SmallIntegerField(db_index=True, default=0, editable=False, verbose_name='Aktiver Betrag'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='active_level',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='donations.DonationLevel', verbose_name='Stufe'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='expiration',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='Ablaufdatum'),
+        ),
+        migrations.RunPython(set_active_donations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_profile_active_donation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('full', models.BooleanField(default=True)),
+                ('email', models.EmailField(max_length=254)),
+                ('file_name', models.CharField(blank=True, max_length=100)),
+                ('profiles', models.ManyToManyField(related_name='+', to='users.Profile')),
+            ],
+            options={
+                'verbose_name': 'Profil-Export',
+                'verbose_name_plural': 'Profil-Exporte',
+            },
+        ),
+    ]
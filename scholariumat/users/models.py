@@ -2,7 +2,6 @@ import logging
 
 from django.db import models
 from django.conf import settings
-from django.contrib import auth
 
 from authtools.models import AbstractEmailUser
 from django_countries.fields import CountryField
@@ -26,14 +25,15 @@ class User(AbstractEmailUser):
             self.set_password(User.objects.make_random_password())
             self.save()
 
-        reset_form = auth.forms.PasswordResetForm({'email': self.email})
+        from .forms import QueuedPasswordResetForm
+        reset_form = QueuedPasswordResetForm({'email': self.email})
         if not reset_form.is_valid():
             logger.error(f'Sending activation mail to {self.email} failed: {reset_form.errors}')
         reset_form.save(
             subject_template_name='registration/user_creation_subject.txt',
             email_template_name='registration/user_creation_email.html',
             from_email=settings.DEFAULT_FROM_EMAIL)
-        logger.info(f'Activation email send to {self.email}')
+        logger.info(f'Activation email to {self.email} enqueued')
 
     class Meta(AbstractEmailUser.Meta):
         swappable = 'AUTH_USER_MODEL'
@@ -80,3 +80,40 @@ class Profile(CartMixin, DonationMixin, PaymentProfileMixin, LendingMixin, Balan
     class Meta():
         verbose_name = 'Nutzerprofil'
         verbose_name_plural = 'Nutzerprofile'
+
+
+class ProfileExport(TimeStampedModel):
+    """
+    CSV export of a selection of profiles, written by a background job. The selected profiles are stored in the
+    through table until the file is written. Exports are deleted with their files after PROFILE_EXPORT_EXPIRY.
+    """
+    profiles = models.ManyToManyField(Profile, related_name='+')
+    full = models.BooleanField(default=True)
+    email = models.EmailField()
+    file_name = models.CharField(max_length=100, blank=True)
+
+    @classmethod
+    def create(cls, queryset, full, email):
+        """Stores the primary keys of the profiles of the queryset in batches, without loading them at once."""
+        export = cls.objects.create(full=full, email=email)
+        Selection = cls.profiles.through
+        selection = []
+        for pk in queryset.order_by().values_list('pk', flat=True).iterator(
+                chunk_size=settings.PROFILE_EXPORT_CHUNK_SIZE):
+            selection.append(Selection(profileexport_id=export.pk, profile_id=pk))
+            if len(selection) >= settings.PROFILE_EXPORT_CHUNK_SIZE:
+                Selection.objects.bulk_create(selection)
+                selection = []
+        Selection.objects.bulk_create(selection)
+        return export
+
+    def get_profiles(self):
+        selection = self.profiles.through.objects.filter(profileexport=self).values('profile')
+        return Profile.objects.filter(pk__in=selection)
+
+    def __str__(self):
+        return f'{self.email}: {self.file_name or "-"} ({self.created:%d.%m.%Y %H:%M})'
+
+    class Meta:
+        verbose_name = 'Profil-Export'
+        verbose_name_plural = 'Profil-Exporte'
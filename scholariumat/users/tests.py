@@ -1,7 +1,19 @@
-from django.test import TestCase
+import json
+import tempfile
+
+from unittest import mock
+
+from django.test import TestCase, RequestFactory
+from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.core import mail
 
-from users.models import Profile
+from users.models import Profile, ProfileExport
+from donations.models import Donation
+from framework.importer import LegacyImporter
+from .admin import ProfileAdmin
+from .exports import delete_expired_exports, export_profiles, get_storage
+from .utils import UserImportHandler
 
 
 class UserTest(TestCase):
@@ -25,3 +37,94 @@ class UserTest(TestCase):
         profile.refill(amount)
         self.assertEqual(profile.balance, amount)
         self.assertEqual(profile.spend(amount), True)
+
+
+class ImportTest(TestCase):
+    def get_dump(self):
+        profile_fields = {
+            'guthaben': 5, 'firma': '', 'strasse': 'Weg 1', 'plz': '1010', 'ort': 'Wien', 'tel': '', 'alt_notiz': '',
+            'anrede': 'Frau', 'land': 'AT', 'letzte_zahlung': '2014-02-01', 'stufe': None}
+        return [
+            {'model': 'Grundgeruest.nutzer', 'pk': 7, 'fields': {
+                'email': 'a.b@c.de', 'password': '', 'date_joined': '2014-01-01T12:00:00Z', 'is_active': True,
+                'first_name': 'A', 'last_name': 'B'}},
+            {'model': 'Grundgeruest.scholariumprofile', 'pk': 3, 'fields': dict(profile_fields, user=7)},
+            {'model': 'Grundgeruest.scholariumprofile', 'pk': 4, 'fields': dict(profile_fields, user=8)},
+            {'model': 'Grundgeruest.unterstuetzung', 'pk': 1, 'fields': {
+                'profil': 3, 'stufe': 2, 'datum': '2016-03-01', 'ueberprueft': True, 'zahlung_id': 'PAY-1'}},
+            {'model': 'Grundgeruest.nutzer', 'pk': 8, 'fields': {
+                'email': 'c.d@e.de', 'password': '', 'date_joined': '2015-01-01T12:00:00Z', 'is_active': True,
+                'first_name': 'C', 'last_name': 'D'}},
+            {'model': 'Produkte.spendenstufe', 'pk': 1, 'fields': {
+                'spendenbeitrag': 75, 'bezeichnung': 'Gast', 'beschreibung': ''}},
+            {'model': 'Produkte.spendenstufe', 'pk': 2, 'fields': {
+                'spendenbeitrag': 150, 'bezeichnung': 'Scholar', 'beschreibung': ''}},
+        ]
+
+    def test_import(self):
+        """References to records later in the dump are resolved at the end."""
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.json') as dump:
+            json.dump(self.get_dump(), dump)
+            dump.flush()
+            for i in range(2):  # Imports are repeatable
+                handler = UserImportHandler()
+                LegacyImporter(handler, path=dump.name).run()
+                # Levels are preloaded, only the donation of the profile of a later user is deferred
+                self.assertEqual([donation[0] for donation in handler.deferred_donations], [4])
+
+        self.assertEqual(get_user_model().objects.count(), 2)
+        profile = Profile.objects.get(old_pk=4)
+        self.assertEqual((profile.user.email, profile.last_name, profile.country), ('c.d@e.de', 'D', 'AT'))
+        self.assertEqual(
+            set(Donation.objects.values_list('profile__old_pk', 'amount', 'payment_id')),
+            {(3, 75, None), (4, 75, None), (3, 150, 'PAY-1')})
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        for i in range(3):
+            user = get_user_model().objects.create(email=f'{i}@c.de')
+            Profile.objects.create(user=user, last_name=f'Name {i}')
+        self.admin = ProfileAdmin(Profile, admin.site)
+        self.request = RequestFactory().post('/')
+        self.request.user = get_user_model().objects.create(email='staff@c.de', is_staff=True)
+
+        # Background exports write to the private export storage
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        export_settings = self.settings(
+            PROFILE_EXPORT_STORAGE_OPTIONS={'location': export_dir.name, 'base_url': None})
+        export_settings.enable()
+        self.addCleanup(export_settings.disable)
+
+    def test_streamed(self):
+        response = self.admin.generate_csv_emails_only(self.request, Profile.objects.all())
+        self.assertEqual(b''.join(response.streaming_content).decode().split(), ['0@c.de', '1@c.de', '2@c.de'])
+
+        response = self.admin.generate_csv_full(self.request, Profile.objects.filter(user__email='1@c.de'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Name 1,1@c.de', lines[1])
+
+    def test_background(self):
+        with self.settings(PROFILE_EXPORT_STREAM_LIMIT=2), mock.patch.object(self.admin, 'message_user'):
+            self.assertIsNone(self.admin.generate_csv_emails_only(self.request, Profile.objects.all()))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['staff@c.de'])
+        self.assertFalse(ProfileExport.objects.get().profiles.exists())
+
+    def test_export_file(self):
+        export = ProfileExport.create(Profile.objects.all(), False, 'staff@c.de')
+        self.assertEqual(export.get_profiles().count(), 3)
+        name = export_profiles(export.pk)
+        with get_storage().open(name) as export_file:
+            self.assertEqual(export_file.read().decode().split(), ['0@c.de', '1@c.de', '2@c.de'])
+        self.assertIn(name, mail.outbox[0].body)
+
+    def test_delete_expired(self):
+        name = export_profiles(ProfileExport.create(Profile.objects.all(), False, 'staff@c.de').pk)
+        self.assertEqual(delete_expired_exports(), 0)
+        with self.settings(PROFILE_EXPORT_EXPIRY=-1):
+            self.assertEqual(delete_expired_exports(), 1)
+        self.assertFalse(get_storage().exists(name))
+        self.assertFalse(ProfileExport.objects.exists())
@@ -1,47 +1,21 @@
-import json
-import logging
 import datetime
+import logging
 from datetime import date
 
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import translation
 from django.utils.translation import gettext as _
 
 from .models import Profile
 from donations.models import Donation, DonationLevel
+from framework.importer import Batch, ImportHandler, LegacyImporter, bulk_upsert
 
 
 logger = logging.getLogger(__name__)
 
 
-def import_from_json():
-    database = json.load(open(settings.ROOT_DIR.path('db.json')))
-
-    # DonationLevels
-    logger.info('Importing donationlevels...')
-
-    levels = [i for i in database if i['model'] == 'Produkte.spendenstufe']
-
-    donationlevel_pks = {}
-
-    for level in levels:
-        new, created = DonationLevel.objects.update_or_create(
-            amount=level['fields']['spendenbeitrag'],
-            defaults={
-                'title': level['fields']['bezeichnung'],
-                'description': level['fields']['beschreibung']})
-        donationlevel_pks[level['pk']] = new
-
-        if created:
-            logger.debug(f'Created level {new.title}')
-
-    # Users, Profiles
-    logger.info('Importing users and profiles...')
-
-    users = [i for i in database if i['model'] == 'Grundgeruest.nutzer']
-    profiles = [i for i in database if i['model'] == 'Grundgeruest.scholariumprofile']
-
+def get_country_codes():
+    """Returns country codes by German country names, as used by the legacy database."""
     translation.activate('de')
     # from django_countries import countries
     COUNTRIES = {
@@ -295,107 +269,174 @@ def import_from_json():
         "ZM": _("Zambia"),
         "ZW": _("Zimbabwe"),
     }
-    countries = {y: x for x, y in COUNTRIES.items()}
-
-    profile_pks = {}
+    return {y: x for x, y in COUNTRIES.items()}
 
-    for user in users:
-        user_defaults = {
-            'password': user['fields']['password'],
-            'date_joined': user['fields']['date_joined'],
-            'is_active': user['fields']['is_active']
-        }
-        user_new, created = get_user_model().objects.update_or_create(
-            email=user['fields']['email'], defaults=user_defaults)
-        if created:
-            logger.debug(f'Created user {user_new.email}')
-
-        profile_defaults = {
-            'first_name': user['fields']['first_name'],
-            'last_name': user['fields']['last_name']
-        }
-        profile = next((profile for profile in profiles if profile['fields']['user'] == user['pk']), None)
 
-        if profile:
-            fields = [
-                ('balance', 'guthaben'),
-                ('organization', 'firma'),
-                ('street', 'strasse'),
-                ('postcode', 'plz'),
-                ('city', 'ort'),
-                ('phone', 'tel'),
-                ('note', 'alt_notiz')
-            ]
+class UserImportHandler(ImportHandler):
+    """
+    Imports donation levels, users, profiles and donations.
+    Levels follow the donations in the dump and are read in a first pass. Profiles and donations referring to users
+    or profiles that come later in the dump are written after the last record.
+    """
+    preload_models = {
+        'Produkte.spendenstufe': 'import_level',
+    }
+    models = {
+        'Grundgeruest.nutzer': 'import_user',
+        'Grundgeruest.scholariumprofile': 'import_profile',
+        'Grundgeruest.unterstuetzung': 'import_donation',
+    }
+    profile_fields = [
+        ('balance', 'guthaben'),
+        ('organization', 'firma'),
+        ('street', 'strasse'),
+        ('postcode', 'plz'),
+        ('city', 'ort'),
+        ('phone', 'tel'),
+        ('note', 'alt_notiz')
+    ]
+
+    def start(self):
+        self.countries = get_country_codes()
+        # Indexes by legacy primary key
+        self.levels = {}  # Donation amounts
+        self.user_pks = {}
+        self.profile_pks = {}
+        self.users = Batch(self.save_users)
+        self.profiles = Batch(self.save_profiles)
+        self.donations = Batch(self.save_donations)
+        self.deferred_profiles = []
+        self.deferred_donations = []
+
+    def import_level(self, level):
+        new, created = DonationLevel.objects.update_or_create(
+            amount=level['fields']['spendenbeitrag'],
+            defaults={
+                'title': level['fields']['bezeichnung'],
+                'description': level['fields']['beschreibung']})
+        self.levels[level['pk']] = new.amount
 
-            for field in fields:
-                if profile['fields'][field[1]]:
-                    profile_defaults[field[0]] = profile['fields'][field[1]]
+        if created:
+            logger.debug(f'Created level {new.title}')
 
-            if profile['fields']['anrede'] == 'Herr':
-                profile_defaults['title'] = 'm'
-            elif profile['fields']['anrede'] == 'Frau':
-                profile_defaults['title'] = 'f'
+    def import_user(self, user):
+        self.users.add(user, key=user['pk'])
 
-            profile_defaults['old_pk'] = profile['pk']
+    def save_users(self, users):
+        user_pks = bulk_upsert(get_user_model(), 'email', [{
+            'email': user['fields']['email'],
+            'password': user['fields']['password'],
+            'date_joined': user['fields']['date_joined'],
+            'is_active': user['fields']['is_active']} for user in users])
+        for user in users:
+            self.user_pks[user['pk']] = user_pks[user['fields']['email']]
 
-            country = profile['fields']['land']
-            if len(country) > 2:
-                country = country.replace('Oe', 'Ö')
-                country_code = countries.get(country)
-                if country and not country_code:
-                    if country == 'United Kingdom':
-                        profile_defaults['country'] = 'UK'
-                    else:
-                        print(country, country_code)
-                        raise Exception
+        bulk_upsert(Profile, 'user_id', [{
+            'user_id': self.user_pks[user['pk']],
+            'first_name': user['fields']['first_name'],
+            'last_name': user['fields']['last_name']} for user in users])
+        logger.debug(f'Saved {len(users)} users')
+
+    def import_profile(self, profile):
+        profile_defaults = {'old_pk': profile['pk']}
+
+        for field, old_field in self.profile_fields:
+            if profile['fields'][old_field]:
+                profile_defaults[field] = profile['fields'][old_field]
+
+        if profile['fields']['anrede'] == 'Herr':
+            profile_defaults['title'] = 'm'
+        elif profile['fields']['anrede'] == 'Frau':
+            profile_defaults['title'] = 'f'
+
+        country = profile['fields']['land']
+        if len(country) > 2:
+            country = country.replace('Oe', 'Ö')
+            country_code = self.countries.get(country)
+            if country and not country_code:
+                if country == 'United Kingdom':
+                    profile_defaults['country'] = 'UK'
                 else:
-                    profile_defaults['country'] = country_code
+                    raise ValueError(f'Unknown country {country}')
             else:
-                profile_defaults['country'] = country
-
-            new, created = Profile.objects.update_or_create(user=user_new, defaults=profile_defaults)
-            profile_pks[profile['pk']] = new
-
-            # Create donations for old donators
-            last_payment = profile['fields']['letzte_zahlung']
-            if last_payment:
-                pdate = date(*map(int, profile['fields']['letzte_zahlung'].split('-')))
-                if pdate >= date(1900, 1, 1) and pdate <= date(2015, 8, 3):
-                    donation, created = Donation.objects.update_or_create(
-                        profile=new,
-                        date=pdate,
-                        expiration=(pdate + datetime.timedelta(days=365)),
-                        amount=donationlevel_pks[profile['fields']['stufe'] or 1].amount,
-                        defaults={'executed': True})
-                    logger.debug(f'Found old donation for {new}')
-
-    # Donations
-    logger.info('Importing donations...')
-
-    donations = [i for i in database if i['model'] == 'Grundgeruest.unterstuetzung']
+                profile_defaults['country'] = country_code
+        else:
+            profile_defaults['country'] = country
+
+        self.profiles.add((profile['fields']['user'], profile_defaults))
+
+        # Create donations for old donators
+        last_payment = profile['fields']['letzte_zahlung']
+        if last_payment:
+            pdate = date(*map(int, last_payment.split('-')))
+            if pdate >= date(1900, 1, 1) and pdate <= date(2015, 8, 3):
+                self.donations.add((profile['pk'], profile['fields']['stufe'] or 1, pdate, {'executed': True}))
+                logger.debug(f'Found old donation for profile {profile["pk"]}')
+
+    def save_profiles(self, profiles, final=False):
+        self.users.flush()
+        rows = []
+        for user_pk, profile_defaults in profiles:
+            if user_pk in self.user_pks:
+                rows.append(dict(profile_defaults, user_id=self.user_pks[user_pk]))
+            elif final:
+                logger.warning(f'User {user_pk} of profile {profile_defaults["old_pk"]} not found')
+            else:
+                self.deferred_profiles.append((user_pk, profile_defaults))
 
-    for donation in donations:
-        profile = profile_pks[donation['fields']['profil']]
+        profile_pks = bulk_upsert(Profile, 'user_id', rows)
+        for row in rows:
+            self.profile_pks[row['old_pk']] = profile_pks[row['user_id']]
 
+    def import_donation(self, donation):
         donation_defaults = {
             'review': donation['fields']['ueberprueft'],
             'executed': True
         }
-
-        id = donation['fields']['zahlung_id']
-        if id and not Donation.objects.filter(payment_id=id):
+        if donation['fields']['zahlung_id']:
             donation_defaults['payment_id'] = donation['fields']['zahlung_id']
 
         donation_date = date(*map(int, donation['fields']['datum'].split('-')))
-        new, created = Donation.objects.update_or_create(
-            profile=profile,
-            amount=donationlevel_pks[donation['fields']['stufe']].amount,
-            date=donation_date,
-            expiration=(donation_date + datetime.timedelta(days=365)),
-            defaults=donation_defaults)
+        self.donations.add(
+            (donation['fields']['profil'], donation['fields']['stufe'], donation_date, donation_defaults))
+
+    def save_donations(self, donations, final=False):
+        self.profiles.flush()
+        rows = []
+        for donation in donations:
+            profile_pk, level_pk, donation_date, donation_defaults = donation
+            if profile_pk in self.profile_pks and level_pk in self.levels:
+                rows.append(dict(
+                    donation_defaults,
+                    profile_id=self.profile_pks[profile_pk],
+                    amount=self.levels[level_pk],
+                    date=donation_date,
+                    expiration=(donation_date + datetime.timedelta(days=365))))
+            elif final:
+                logger.warning(f'Profile {profile_pk} or level {level_pk} of donation not found')
+            else:
+                self.deferred_donations.append(donation)
 
-        if created:
-            logger.debug(f'Created donation from {profile.name}')
+        # Payment ids are unique, keep existing ones
+        payment_ids = {row['payment_id'] for row in rows if 'payment_id' in row}
+        taken = set(Donation.objects.filter(payment_id__in=payment_ids).values_list('payment_id', flat=True))
+        for row in rows:
+            if row.get('payment_id') in taken:
+                del row['payment_id']
+            elif 'payment_id' in row:
+                taken.add(row['payment_id'])
+
+        bulk_upsert(Donation, ('profile_id', 'amount', 'date', 'expiration'), rows)
+
+    def finish(self):
+        self.donations.flush()  # Flushes users and profiles first
+        self.save_profiles(self.deferred_profiles, final=True)
+        self.save_donations(self.deferred_donations, final=True)
+        Profile.update_active_donations()  # Donations were created in bulk, without signals
 
-    users_with_donation = len(Profile.objects.filter(donation__isnull=False).distinct())
-    logger.info(f'Import finished. Users that donated at some point: {users_with_donation}')
+        users_with_donation = Profile.objects.filter(donation__isnull=False).distinct().count()
+        logger.info(f'Import finished. Users that donated at some point: {users_with_donation}')
+
+
+def import_from_json():
+    LegacyImporter(UserImportHandler()).run()